@@ -2,9 +2,12 @@ import datetime
 import time
 from urllib.parse import urlparse
 
+from src import sparql
 from src.failuredetection import PingFailureDetector
 from src.netscan import HostListScanner
 from src.semantics import TDInputBuilder, UnknownSemanticsException
+from src.sparql.cache import EquivalenceSetCache
+from src.sparql.persistent import PersistentQueryCache
 
 # Configuration. Location of the different things:
 from src.td import get_thing_description_from_url
@@ -14,6 +17,27 @@ SPEAKER_URL = 'http://192.168.43.171:5000/td/speaker'
 DOOR_URL = 'http://192.168.42.100:8080/'
 AUTHENTICATOR_URL = 'http://192.168.43.171:5000/td/door_control'
 
+# Results of SPARQL queries are kept on disk across restarts.
+# Change the ontology version whenever the knowledge base is updated.
+SPARQL_CACHE_FILE = '~/.wot_controller_sparql.sqlite'
+SPARQL_CACHE_ONTOLOGY_VERSION = '1'
+
+# All semantic types the controller asks about. Their equivalence sets and superclasses are fetched at startup.
+SEMANTIC_TYPES = ['http://www.matthias-fisch.de/ontologies/wot#DoorEntryPermission',
+                  'http://www.matthias-fisch.de/ontologies/wot#AlarmAction',
+                  'http://www.matthias-fisch.de/ontologies/wot#DoorOpenEvent',
+                  'http://www.matthias-fisch.de/ontologies/wot#PlayWelcomeAction',
+                  'http://www.matthias-fisch.de/ontologies/wot#Duration',
+                  'http://dbpedia.org/resource/Second',
+                  'http://dbpedia.org/resource/Millisecond',
+                  'http://dbpedia.org/ontology/Colour',
+                  'http://dbpedia.org/resource/Red',
+                  'http://www.matthias-fisch.de/ontologies/wot#SoundFile',
+                  'http://www.matthias-fisch.de/ontologies/wot#WelcomeSound']
+SPARQL_WARM_PARALLELISM = 4
+# Seconds to wait for the knowledge base before falling back to cached answers.
+SPARQL_QUERY_TIMEOUT = 2.0
+
 auth_alt_fd = None
 
 
@@ -132,6 +156,13 @@ def on_door_failure(fd):
             new_door_fd.start()
 
 
+sparql.set_query_timeout(SPARQL_QUERY_TIMEOUT)
+sparql.set_persistent_cache(PersistentQueryCache(SPARQL_CACHE_FILE, ontology_version=SPARQL_CACHE_ONTOLOGY_VERSION))
+# Keep equivalence sets until restart, so that the warmed up types answer every check involving them:
+sparql.set_expansion_cache(EquivalenceSetCache(ttl=None))
+for iri, e in sparql.warm(SEMANTIC_TYPES, parallelism=SPARQL_WARM_PARALLELISM).items():
+    print("WARNING: Could not fetch semantics of %s: %s" % (iri, e))
+
 alarm_system = AlarmSystem()
 alarm_system.alarm_source = get_thing_description_from_url(SPEAKER_URL)
 alarm_system.authenticator = get_thing_description_from_url(AUTHENTICATOR_URL)
@@ -1,13 +1,86 @@
 # sparql module
 # Defines functionality to perform certain queries
 # The endpoint used is lov.okfn.org
+import contextvars
+import json
+import sys
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from urllib.parse import urlparse
 
-from SPARQLWrapper import SPARQLWrapper, JSON
+from src.sparql.backend import HttpBackend
+from src.sparql.breaker import CircuitBreaker
+from src.sparql.cache import QueryCache, SingleFlight, symmetric_key
+from src.sparql.local import LocalReasoner
+from src.sparql.metrics import QueryMetrics, instrumented
+from src.sparql.pool import ConnectionPool
 
 # The URL of the default SPARQL endpoint. Assume Bigdata Blazegraph is runn
 DEFAULT_SPARQL_ENDPOINT = 'http://localhost:9999/bigdata/namespace/wotkb/sparql'
 
+# Predicate linking each class to every class equivalent to it in a graph written by sparql.closure.
+CLOSURE_PREDICATE = 'http://www.matthias-fisch.de/ontologies/wot#closureEquivalent'
+
+# Headers of the POST requests used for querying endpoints.
+QUERY_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded', 'Accept': 'application/sparql-results+json'}
+
+# Cache for the results of equivalent_classes, classes_equivalent, shared_superclasses and has_type.
+# Expired results are still served for a day while they are refreshed in the background.
+# See set_query_cache() for replacing or disabling it.
+query_cache = QueryCache(stale_ttl=24 * 3600)
+
+# Optional cache of whole equivalence sets, which then answers equivalent_classes and classes_equivalent
+# instead of query_cache. See set_expansion_cache().
+expansion_cache = None
+
+# Call counts, error counts, cache hit rates and latencies per kind of query. See sparql.metrics.
+metrics = QueryMetrics()
+
+# Coalesces identical queries sent concurrently by multiple threads into one request.
+# single_flight.stats() tells how many queries were merged.
+single_flight = SingleFlight()
+
+# Keep-alive connections to the SPARQL endpoints, shared by all threads. See set_connection_pool().
+connection_pool = ConnectionPool()
+
+# Answers the queries that are not answered from a cache, by default by sending them to the endpoints.
+# See set_backend() and sparql.backend.
+backend = HttpBackend()
+
+# Timeout in seconds of each query sent to an endpoint. None for the timeout of the connection pool.
+# See set_query_timeout().
+query_timeout = None
+
+# Timeout overriding query_timeout within timeout() blocks of the current thread or asyncio task.
+_timeout_override = contextvars.ContextVar('query_timeout_override', default=None)
+
+# Lets queries to endpoints that failed repeatedly fail immediately. See set_circuit_breaker().
+circuit_breaker = CircuitBreaker()
+
+# Named graph holding the materialized equivalence closure or None. See set_closure_graph().
+closure_graph = None
+
+# Optional on-disk cache of raw responses, shared across restarts. See set_persistent_cache().
+persistent_cache = None
+
+# Reasoner answering queries for DEFAULT_SPARQL_ENDPOINT locally. See set_default_reasoner().
+default_reasoner = None
+
+# Index of the subclass hierarchy answering has_type and shared_superclasses. See set_subclass_index().
+subclass_index = None
+
+# Filter of the IRIs known to an endpoint, short-cutting checks involving unknown IRIs. See set_known_iris().
+known_iris = None
+
+_MISSING = object()
+
+# Keys of the cache entries currently refreshed in the background and the executor refreshing them.
+_refreshing = set()
+_refresh_lock = threading.Lock()
+_refresh_executor = None
+
 class SparqlException(Exception):
     """
     Exception to signalize that something went wrong during a query to a SPARQL-endpoint.
@@ -21,6 +94,42 @@ class UnknownPrefixException(SparqlException):
     """
     pass
 
+class CircuitOpenException(SparqlException):
+    """
+    Signalizes that a query was not sent because the endpoint failed repeatedly. See circuit_breaker.
+    """
+    pass
+
+class _PrefixTable(object):
+    """
+    Prefixes registered in a SPARQLNamespaceRepository together with memoized resolutions and a trie of the
+    prefixes for compaction. A table may be shared by multiple repositories as long as none of them registers
+    further prefixes (copy-on-write).
+    """
+
+    # Maximum number of memoized resolutions per table.
+    MAX_RESOLVED = 4096
+
+    def __init__(self, prefixes=None):
+        self.prefixes = dict(prefixes or {})
+        self.resolved = {}  # Shorthand -> interned full IRI
+        self.trie = None  # Built on first compaction
+        self.shared = False
+
+    def build_trie(self):
+        """
+        @rtype dict
+        @return Character trie of all prefixes. The key None of a node holds the name of the prefix ending there.
+        """
+        trie = {}
+        for name, prefix in self.prefixes.items():
+            node = trie
+            for c in prefix:
+                node = node.setdefault(c, {})
+            node.setdefault(None, name)
+        return trie
+
+
 class SPARQLNamespaceRepository(object):
     """
     Utility class for resolving shorthand notation for IRIs, e.g. dogont:Lighting to
@@ -31,8 +140,47 @@ class SPARQLNamespaceRepository(object):
         ns.register('dogont', 'http://elite.polito.it/ontologies/dogont.owl#')
         ns.resolve('dogont:Lighting')
         > http://elite.polito.it/ontologies/dogont.owl#Lighting
+        ns.compact('http://elite.polito.it/ontologies/dogont.owl#Lighting')
+        > dogont:Lighting
     """
-    __prefixes = {}
+
+    # Prefix tables of the JSON-LD contexts in use, shared by all repositories with the same context.
+    __context_tables = weakref.WeakValueDictionary()
+    __context_lock = threading.Lock()
+
+    def __init__(self):
+        super().__init__()
+        self.__table = _PrefixTable()
+
+    @classmethod
+    def for_context(cls, context):
+        """
+        Creates a repository with the prefixes defined in a JSON-LD @context. Repositories for identical contexts
+        share their prefix table and resolutions until one of them registers another prefix.
+        @type context list|dict|str
+        @param context The @context of a TD.
+        @rtype SPARQLNamespaceRepository
+        """
+        if not isinstance(context, list):
+            context = [context]
+        prefixes = {}
+        for c in context:
+            if isinstance(c, dict):
+                for shorthand, prefix in c.items():
+                    if isinstance(prefix, str):
+                        prefixes[shorthand] = prefix
+        key = frozenset(prefixes.items())
+
+        with cls.__context_lock:
+            table = cls.__context_tables.get(key)
+            if table is None:
+                table = _PrefixTable(prefixes)
+                table.shared = True
+                cls.__context_tables[key] = table
+
+        repo = cls()
+        repo.__table = table
+        return repo
 
     def register(self, prefix_name, prefix):
         """
@@ -42,11 +190,20 @@ class SPARQLNamespaceRepository(object):
         @type prefix str
         @param prefix The full prefix, e.g. http://elite.polito.it/ontologies/dogont.owl#.
         """
-        self.__prefixes[prefix_name] = prefix
+        table = self.__table
+        if table.shared:
+            # Copy-on-write, other repositories keep the shared table:
+            self.__table = _PrefixTable(table.prefixes)
+            self.__table.prefixes[prefix_name] = prefix
+        else:
+            table.prefixes[prefix_name] = prefix
+            table.resolved = {}
+            table.trie = None
 
     def resolve(self, shorthand):
         """
         Resolves a shorthand notation of an IRI using a previously registered prefix.
+        Results are memoized and interned, so resolving the same shorthand again costs a dict lookup.
         @type shorthand str
         @param shorthand A shorthand IRI, e.g. dogont:Lighting
         @rtype str
@@ -54,35 +211,183 @@ class SPARQLNamespaceRepository(object):
         @raise UnknownPrefixException If the used prefix was not previously registered.
         @raise ValueError If the shorthand is malformed, i.e. not '<prefix>:<resource>'.
         """
+        table = self.__table
+        iri = table.resolved.get(shorthand)
+        if iri is not None:
+            return iri
+
         # First check if this is already a
         parsed = urlparse(shorthand)
         if parsed.scheme and parsed.netloc:
-            return shorthand
+            iri = shorthand
+        else:
+            try:
+                prefix, resource = shorthand.split(':')
+                if prefix in table.prefixes.keys():
+                    iri = table.prefixes[prefix] + resource
+                else:
+                    raise UnknownPrefixException('The IRI-prefix %s is unknown by this repository' % prefix)
 
-        try:
-            prefix, resource = shorthand.split(':')
-            if prefix in self.__prefixes.keys():
-                return self.__prefixes[prefix] + resource
-            else:
-                raise UnknownPrefixException('The IRI-prefix %s is unknown by this repository' % prefix)
+            except ValueError:
+                raise ValueError('%s is not a valid IRI-shorthand.' % shorthand)
+
+        if len(table.resolved) >= _PrefixTable.MAX_RESOLVED:
+            table.resolved.clear()
+        iri = table.resolved[shorthand] = sys.intern(iri)
+        return iri
+
+    def resolve_many(self, shorthands):
+        """
+        Resolves multiple shorthand IRIs. See resolve().
+        @type shorthands iterable
+        @param shorthands Shorthand or full IRIs.
+        @rtype list
+        @return The full IRIs in the same order.
+        """
+        return [self.resolve(shorthand) for shorthand in shorthands]
+
+    def compact(self, iri):
+        """
+        Converts a full IRI to shorthand notation using the longest registered prefix it starts with.
+        @type iri str
+        @param iri A full IRI, e.g. http://elite.polito.it/ontologies/dogont.owl#Lighting
+        @rtype str
+        @return The shorthand IRI, e.g. dogont:Lighting, or iri itself if no registered prefix matches.
+        """
+        table = self.__table
+        trie = table.trie
+        if trie is None:
+            trie = table.trie = table.build_trie()
+
+        node = trie
+        match = None
+        for i, c in enumerate(iri):
+            node = node.get(c)
+            if node is None:
+                break
+            if None in node:
+                match = (node[None], i + 1)
 
-        except ValueError:
-            raise ValueError('%s is not a valid IRI-shorthand.' % shorthand)
+        if match is None:
+            return iri
+        name, length = match
+        return name + ':' + iri[length:]
+
+    def prefixes(self):
+        """
+        @rtype dict
+        @return Copy of the mapping of registered shorthand names to prefixes.
+        """
+        return dict(self.__table.prefixes)
 
 
-def __query(q, endpoint = DEFAULT_SPARQL_ENDPOINT):
+def __query(q, endpoint = DEFAULT_SPARQL_ENDPOINT, kind = None):
     """
     Files a query to the SPARQL-endpoint at lov.okfn.org
+    The query is answered by the backend, by default over a keep-alive connection from connection_pool.
+    Callers sending the same query while it is in flight share its response.
     @type q: str
     @param q: A SPARQL query.
     @type endpoint str
     @param endpoint URL of the SPARQL endpoint to query.
+    @type kind str|None
+    @param kind The kind of query, under which it is recorded in metrics if it is sent to the endpoint.
     @rtype: dict|None
     @return: The response of the endpoint or None on error or malformed query.
     """
-    sparql = SPARQLWrapper(endpoint, returnFormat=JSON)
-    sparql.setQuery(q)
-    r = sparql.query().convert()
+    return single_flight.do((endpoint, q), lambda: _fetch(q, endpoint, kind))
+
+
+def _fetch(q, endpoint, kind = None):
+    """
+    Answers a query from persistent_cache or by the backend.
+    Only queries actually sent to the endpoint are recorded in metrics.
+    @rtype dict
+    @return The response of the endpoint.
+    @raise CircuitOpenException If the circuit of the endpoint is open.
+    """
+    r = _stored_response(q, endpoint)
+    if r is None:
+        with _sending(endpoint, kind):
+            r = backend.query(q, endpoint)
+        _store_response(q, endpoint, r)
+    return r
+
+
+def _stored_response(q, endpoint):
+    """
+    @rtype dict|None
+    @return The response to q stored in persistent_cache or None if there is none.
+    """
+    store = persistent_cache
+    return store.get(endpoint, q) if store is not None else None
+
+
+def _store_response(q, endpoint, r):
+    """
+    Stores the response r to q in persistent_cache if one is set.
+    """
+    store = persistent_cache
+    if store is not None:
+        store.put(endpoint, q, r)
+
+
+@contextmanager
+def _sending(endpoint, kind):
+    """
+    Context manager around sending a query to the backend, shared by the blocking and the asyncio query paths:
+    Refuses the query if the circuit of the endpoint is open, records it in metrics and reports its outcome
+    to circuit_breaker.
+    @type kind str|None
+    @param kind The kind of query recorded in metrics or None in order not to record it.
+    @raise CircuitOpenException If the circuit of the endpoint is open.
+    """
+    breaker = circuit_breaker
+    if breaker is not None and not breaker.allow(endpoint):
+        raise CircuitOpenException('SPARQL endpoint %s is not queried after repeated failures' % endpoint)
+    if kind is not None:
+        metrics.record_query(kind)
+    try:
+        yield
+    except (ValueError, GeneratorExit):
+        # The endpoint is working, but rejected the query or the caller stopped reading the response:
+        if breaker is not None:
+            breaker.success(endpoint)
+        raise
+    except Exception:
+        if breaker is not None:
+            breaker.failure(endpoint)
+        raise
+    except BaseException:
+        # Interrupted or cancelled, e.g. by asyncio.wait_for(). Let the next query be the trial if this one was:
+        if breaker is not None:
+            breaker.release(endpoint)
+        raise
+    if breaker is not None:
+        breaker.success(endpoint)
+
+
+def _decode_response(response, endpoint):
+    """
+    Decodes the response of a SPARQL endpoint to a query.
+    @type response PooledResponse
+    @param response The HTTP response.
+    @type endpoint str
+    @param endpoint URL of the SPARQL endpoint queried.
+    @rtype dict
+    @return The deserialized JSON response.
+    @raise ValueError If the endpoint rejected the query as malformed.
+    @raise SparqlException If the endpoint reported an error or does not return JSON.
+    """
+    if response.status == 400:
+        raise ValueError('SPARQL endpoint %s rejected the query: %s' % (endpoint, response.data.decode('utf-8', 'replace')))
+    elif response.status != 200:
+        raise SparqlException('Received %d %s from SPARQL endpoint %s' % (response.status, response.reason, endpoint))
+
+    try:
+        r = json.loads(response.data.decode('utf-8'))
+    except ValueError:
+        r = None
 
     if isinstance(r, dict): # Check whether JSON conversion was successful
         return r
@@ -90,19 +395,415 @@ def __query(q, endpoint = DEFAULT_SPARQL_ENDPOINT):
         raise SparqlException("SPARQL endpoint %s does not support JSON return format." % endpoint)
 
 
+def set_query_cache(cache):
+    """
+    Replaces the cache used for query results.
+    @type cache QueryCache|None
+    @param cache The new cache or None in order to disable caching.
+    """
+    global query_cache
+    query_cache = cache
+
+
+def set_expansion_cache(cache):
+    """
+    Switches to caching whole equivalence sets: The first check involving an IRI fetches all classes equivalent
+    to it at once and every later check of that IRI against any other one is answered from this set.
+    Lookups in the cache are counted by its stats(), not by the cache statistics of metrics.
+    @type cache EquivalenceSetCache|None
+    @param cache The cache or None in order to cache single results in query_cache again.
+    """
+    global expansion_cache
+    expansion_cache = cache
+
+
+def _equivalence_set(sets, iri, endpoint):
+    """
+    @type sets EquivalenceSetCache
+    @return The IRI and all IRIs equivalent to it, fetched from the endpoint if not in sets.
+    """
+    members = sets.get(endpoint, iri)
+    if members is None:
+        members = sets.put(endpoint, iri, _query_equivalent_classes(iri, endpoint))
+    return members
+
+
+def _equivalents(members, iri):
+    """
+    @type members frozenset
+    @param members An equivalence set of iri as stored in an EquivalenceSetCache.
+    @rtype list
+    @return The sorted IRIs equivalent to iri, as returned by equivalent_classes() if an expansion cache is set.
+    """
+    return sorted(members - {iri})
+
+
+def set_connection_pool(pool):
+    """
+    Replaces the pool of connections used for querying SPARQL endpoints, e.g. in order to change
+    the number of connections per endpoint or the timeouts.
+    @type pool ConnectionPool
+    @param pool The new connection pool.
+    """
+    global connection_pool
+    old_pool, connection_pool = connection_pool, pool
+    old_pool.close()
+
+
+def set_backend(new_backend):
+    """
+    Replaces the backend answering queries, e.g. by a GraphBackend in order to evaluate all queries
+    on local OWL files or by a ReplayBackend for deterministic tests and benchmarks.
+    @type new_backend SparqlBackend
+    @param new_backend The new backend. The previous backend is closed.
+    """
+    global backend
+    old_backend, backend = backend, new_backend
+    old_backend.close()
+
+
+def set_query_timeout(timeout):
+    """
+    Sets the timeout of each query sent to an endpoint.
+    @type timeout float|None
+    @param timeout Seconds or None for the timeout of the connection pool.
+    """
+    global query_timeout
+    query_timeout = timeout
+
+
+@contextmanager
+def timeout(seconds):
+    """
+    Overrides query_timeout for the queries sent by the current thread or asyncio task within the block.
+    Queries already in flight for other callers and refreshes in the background keep their timeout.
+
+    Example:
+        with sparql.timeout(0.5):
+            sparql.classes_equivalent(iri1, iri2)
+    @type seconds float|None
+    @param seconds Timeout of each query in seconds or None for the timeout of the connection pool.
+    """
+    token = _timeout_override.set((seconds, ))
+    try:
+        yield
+    finally:
+        _timeout_override.reset(token)
+
+
+def _query_timeout():
+    """
+    @rtype float|None
+    @return The timeout of queries sent now: The one of the innermost timeout() block or query_timeout.
+    """
+    override = _timeout_override.get()
+    return override[0] if override is not None else query_timeout
+
+
+def set_circuit_breaker(breaker):
+    """
+    Replaces the circuit breaker guarding the endpoints.
+    @type breaker CircuitBreaker|None
+    @param breaker The new circuit breaker or None in order to always query the endpoints.
+    """
+    global circuit_breaker
+    circuit_breaker = breaker
+
+
+def set_closure_graph(graph):
+    """
+    Answers equivalence queries by single-hop lookups in a named graph written by sparql.closure.materialize()
+    instead of property path queries. The graph must be materialized on every endpoint queried.
+    The results cached in query_cache and expansion_cache are discarded, since their keys do not tell
+    which semantics they were computed with.
+    @type graph str|None
+    @param graph IRI of the named graph, e.g. sparql.closure.CLOSURE_GRAPH, or None for property path queries.
+    """
+    global closure_graph
+    closure_graph = graph
+    for cache in (query_cache, expansion_cache):
+        if cache is not None:
+            cache.clear()
+
+
+def set_persistent_cache(cache):
+    """
+    Sets an on-disk cache for responses of SPARQL endpoints, which is consulted before any query is sent.
+    @type cache PersistentQueryCache|None
+    @param cache The cache or None in order to disable it.
+    """
+    global persistent_cache
+    persistent_cache = cache
+
+
+def set_default_reasoner(reasoner):
+    """
+    Answers all queries to DEFAULT_SPARQL_ENDPOINT from a local reasoner instead of the endpoint,
+    so that no SPARQL endpoint needs to be running.
+    A reasoner can also be selected per call by passing it as endpoint.
+    @type reasoner LocalReasoner|None
+    @param reasoner The reasoner to use or None in order to query DEFAULT_SPARQL_ENDPOINT again.
+    """
+    global default_reasoner
+    default_reasoner = reasoner
+
+
+def set_subclass_index(index):
+    """
+    Answers has_type() and shared_superclasses() for the endpoint of an index from that index
+    instead of querying the endpoint.
+    @type index sparql.index.SubclassIndex|None
+    @param index The index or None in order to query the endpoint again.
+    """
+    global subclass_index
+    subclass_index = index
+
+
+def _index_for(endpoint):
+    """
+    @rtype sparql.index.SubclassIndex|None
+    @return The subclass index for endpoint or None if there is none.
+    """
+    index = subclass_index
+    if index is not None and index.endpoint == endpoint:
+        return index
+    else:
+        return None
+
+
+def set_known_iris(known):
+    """
+    Answers checks involving IRIs that are certainly unknown to the endpoint of a filter without querying it:
+    Unknown IRIs have no equivalent classes and no superclasses.
+    @type known sparql.bloom.KnownIriFilter|None
+    @param known The filter or None in order to query the endpoint for all IRIs.
+    """
+    global known_iris
+    known_iris = known
+
+
+def _unknown(endpoint, *iris):
+    """
+    @rtype bool
+    @return True if any of iris is certainly unknown to endpoint according to known_iris.
+    """
+    known = known_iris
+    if known is None or known.endpoint != endpoint:
+        return False
+    return not all(known.might_contain(iri) for iri in iris)
+
+
+def _reasoner_for(endpoint):
+    """
+    @rtype LocalReasoner|None
+    @return The local reasoner answering queries for endpoint or None if the endpoint must be queried.
+    """
+    if isinstance(endpoint, LocalReasoner):
+        return endpoint
+    elif endpoint == DEFAULT_SPARQL_ENDPOINT:
+        return default_reasoner
+    else:
+        return None
+
+
+def _cached(key, compute):
+    """
+    Returns the result cached for key or computes and caches it if there is none.
+    An expired result still kept by query_cache is returned immediately and refreshed in the background.
+    @type key tuple
+    @param key The cache key. Its first element is the kind of query.
+    @type compute callable
+    @param compute Called without arguments to compute the result on a cache miss.
+    @return The (possibly cached) result.
+    """
+    r = _cache_lookup(key)
+    if r is _MISSING:
+        r = _stale_lookup(key)
+        if r is not _MISSING:
+            _refresh(key, compute)
+            return r
+        r = compute()
+        _cache_store(key, r)
+    return r
+
+
+def _stale_lookup(key):
+    """
+    @return The expired result still kept for key or _MISSING if there is none.
+    """
+    cache = query_cache
+    if cache is None or not cache.stale_ttl:
+        return _MISSING
+    return cache.get_stale(key, _MISSING)
+
+
+def _refresh(key, compute):
+    """
+    Computes and caches the result for key in the background unless it is already being refreshed.
+    Failures are ignored, so the stale result stays available, e.g. while the circuit of the endpoint is open.
+    """
+    global _refresh_executor
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='sparql-refresh')
+
+    def run():
+        try:
+            _cache_store(key, compute())
+        except Exception:
+            pass
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(key)
+
+    _refresh_executor.submit(run)
+
+
+def _cache_lookup(key):
+    """
+    @return The result cached for key or _MISSING if there is none or caching is disabled.
+    """
+    cache = query_cache
+    if cache is None:
+        return _MISSING
+
+    r = cache.get(key, _MISSING)
+    metrics.record_cache(key[0], r is not _MISSING)
+    return r
+
+
+def _cache_store(key, r):
+    """
+    Caches the result r for key if caching is enabled.
+    """
+    cache = query_cache
+    if cache is not None:
+        cache.put(key, r)
+
+
+def _execute(q, endpoint, kind):
+    """
+    Files a query to the SPARQL-endpoint.
+    @type kind str
+    @param kind The kind of query, under which the query is recorded in metrics if it is sent to the endpoint.
+    @rtype dict
+    @return The response of the endpoint.
+    @raise SparqlException If the query is malformed.
+    """
+    try:
+        return __query(q, endpoint, kind)
+    except ValueError:
+        raise SparqlException('Malformed query: %s' % q)
+
+
+def _stream(q, endpoint, kind):
+    """
+    Files a SELECT query to the SPARQL-endpoint and yields the bindings of the result as they are received.
+    Bypasses single_flight and persistent_cache, which need complete responses.
+    @type kind str
+    @param kind The kind of query, under which the query is recorded in metrics.
+    @rtype generator
+    @return Generator of the bindings.
+    @raise SparqlException If the query is malformed or the circuit of the endpoint is open.
+    """
+    try:
+        with _sending(endpoint, kind):
+            yield from backend.query_stream(q, endpoint)
+    except ValueError:
+        raise SparqlException('Malformed query: %s' % q)
+
+
+def _stream_uris(q, endpoint, kind, var):
+    """
+    Like _stream(), but yields only the IRIs bound to var.
+    """
+    for binding in _stream(q, endpoint, kind):
+        if var in binding and binding[var]['type'] == 'uri':
+            yield binding[var]['value']
+
+
+def _parse_uris(r, var):
+    """
+    Extracts the IRIs bound to a variable from the response to a SELECT query.
+    @type r dict
+    @param r The response of the endpoint.
+    @type var str
+    @param var Name of the variable (without ?).
+    @rtype list
+    @return The IRIs bound to var.
+    @raise SparqlException If the response is malformed.
+    """
+    if r and 'results' in r and 'bindings' in r['results']:
+        iris = []
+        for binding in r['results']['bindings']:
+            if var in binding and binding[var]['type'] == 'uri':
+                iris.append(binding[var]['value'])
+        return iris
+    else:
+        raise SparqlException('Malformed response')
+
+
+def _parse_boolean(r):
+    """
+    @type r dict
+    @param r The response of the endpoint to an ASK query.
+    @rtype bool
+    @return The result of the ASK query.
+    @raise SparqlException If the response is malformed.
+    """
+    if r and 'boolean' in r:
+        return r['boolean']
+    else:
+        raise SparqlException('Malformed response')
+
+
+@instrumented(metrics, 'equivalent_classes')
 def equivalent_classes(iri, endpoint = DEFAULT_SPARQL_ENDPOINT):
     """
     Queries the SPARQL-endpoint for classes/resources that are equal to the one given.
     Takes equivalency by the transitive closure of rdfs:seeAlso, owl:sameAs and owl:equivalentClass into account.
+    Results are cached in query_cache or in expansion_cache if set.
     @type iri: str
     @param iri: The IRI of the class for which equivalent classes should be found.
-    @type endpoint str
-    @param endpoint URL of the SPARQL endpoint to query.
+    @type endpoint str|LocalReasoner
+    @param endpoint URL of the SPARQL endpoint to query or a local reasoner to answer the query.
     @rtype: list
     @return: List of the IRIs of equivalent classes.
     @raise SparqlException: Raised if the internally constructed query is malformed or the response of the endpoint is.
     """
-    q = 'PREFIX rdfs:<http://www.w3.org/2000/01/rdf-schema#>\
+    reasoner = _reasoner_for(endpoint)
+    if reasoner is not None:
+        return reasoner.equivalent_classes(iri)
+
+    if _unknown(endpoint, iri):
+        return []
+
+    sets = expansion_cache
+    if sets is not None:
+        return _equivalents(_equivalence_set(sets, iri, endpoint), iri)
+
+    return list(_cached(('equivalent_classes', endpoint, iri),
+                        lambda: tuple(_query_equivalent_classes(iri, endpoint))))
+
+
+def _query_equivalent_classes(iri, endpoint):
+    """
+    Uncached implementation of equivalent_classes().
+    """
+    return _parse_uris(_execute(_equivalent_classes_query(iri), endpoint, 'equivalent_classes'), 'o')
+
+
+def _equivalent_classes_query(iri):
+    """
+    @rtype str
+    @return The query for classes equivalent to iri. Results are bound to ?o.
+    """
+    if closure_graph is not None:
+        return 'SELECT DISTINCT ?o { GRAPH <' + closure_graph + '> { <' + iri + '> <' + CLOSURE_PREDICATE + '> ?o } }'
+    return 'PREFIX rdfs:<http://www.w3.org/2000/01/rdf-schema#>\
          PREFIX owl: <http://www.w3.org/2002/07/owl#>\
          SELECT DISTINCT ?o {\
                  { <' + iri + '> rdfs:seeAlso+ ?o .} \
@@ -112,31 +813,65 @@ def equivalent_classes(iri, endpoint = DEFAULT_SPARQL_ENDPOINT):
                 UNION { ?o owl:sameAs+ <' + iri + '> . } \
                  UNION { ?o owl:equivalentClass+ <' + iri + '> .}}'
 
-    try:
-        r = __query(q, endpoint)
-    except ValueError:
-        raise SparqlException('Malformed query: %s' % q)
 
-    if r and 'results' in r and 'bindings' in r['results']:
-        eq_classes = []
-        for binding in r['results']['bindings']:
-            if 'o' in binding and binding['o']['type'] == 'uri':
-                eq_classes.append(binding['o']['value'])
-        return eq_classes
+def iter_equivalent_classes(iri, endpoint = DEFAULT_SPARQL_ENDPOINT):
+    """
+    Generator variant of equivalent_classes(): Yields the IRIs of equivalent classes as soon as they are received,
+    so that a caller looking for a certain class can stop without reading the rest of a large result.
+    The result is cached like by equivalent_classes() once it was read completely.
+    @type iri str
+    @param iri The IRI of the class for which equivalent classes should be found.
+    @type endpoint str|LocalReasoner
+    @param endpoint URL of the SPARQL endpoint to query or a local reasoner to answer the query.
+    @rtype generator
+    @return Generator of the IRIs of equivalent classes.
+    @raise SparqlException Raised if the internally constructed query is malformed or the response of the endpoint is.
+    """
+    reasoner = _reasoner_for(endpoint)
+    if reasoner is not None:
+        yield from reasoner.equivalent_classes(iri)
+        return
+
+    if _unknown(endpoint, iri):
+        return
+
+    sets = expansion_cache
+    key = ('equivalent_classes', endpoint, iri)
+    if sets is not None:
+        members = sets.get(endpoint, iri)
+        if members is not None:
+            yield from _equivalents(members, iri)
+            return
     else:
-        raise SparqlException('Malformed response')
+        cached = _cache_lookup(key)
+        if cached is not _MISSING:
+            yield from cached
+            return
+
+    received = []
+    for other in _stream_uris(_equivalent_classes_query(iri), endpoint, 'equivalent_classes', 'o'):
+        received.append(other)
+        yield other
+
+    if sets is not None:
+        sets.put(endpoint, iri, received)
+    else:
+        _cache_store(key, tuple(received))
 
 
+@instrumented(metrics, 'classes_equivalent')
 def classes_equivalent(iri1, iri2, endpoint = DEFAULT_SPARQL_ENDPOINT):
     """
     Queries the SPARQL-endpoint for equivalency of two classes/resources.
     Takes equivalency by the transitive closure of rdfs:seeAlso, owl:sameAs and owl:equivalentClass into account.
+    Results are cached in query_cache, where the order of iri1 and iri2 does not matter.
+    If expansion_cache is set, the equivalence set of iri1 is fetched instead unless that of either IRI is known.
     @type iri1: str
     @param iri1: The IRI of the first class/resource.
     @type iri2: str
     @param iri2: The IRI of the second class/resource.
-    @type endpoint str
-    @param endpoint URL of the SPARQL endpoint to query.
+    @type endpoint str|LocalReasoner
+    @param endpoint URL of the SPARQL endpoint to query or a local reasoner to answer the query.
     @rtype: bool
     @return: Returns true if the classes/resources are equivalent.
     @raise SparqlException: Raised if the internally constructed query is malformed or the response of the endpoint is.
@@ -145,7 +880,39 @@ def classes_equivalent(iri1, iri2, endpoint = DEFAULT_SPARQL_ENDPOINT):
     if iri1 == iri2:
         return True
 
-    q = 'PREFIX rdfs:<http://www.w3.org/2000/01/rdf-schema#> \
+    reasoner = _reasoner_for(endpoint)
+    if reasoner is not None:
+        return reasoner.classes_equivalent(iri1, iri2)
+
+    if _unknown(endpoint, iri1, iri2):
+        return False
+
+    sets = expansion_cache
+    if sets is not None:
+        r = sets.equivalent(endpoint, iri1, iri2)
+        if r is None:
+            r = iri2 in sets.put(endpoint, iri1, _query_equivalent_classes(iri1, endpoint))
+        return r
+
+    return _cached(symmetric_key('classes_equivalent', endpoint, iri1, iri2),
+                   lambda: _query_classes_equivalent(iri1, iri2, endpoint))
+
+
+def _query_classes_equivalent(iri1, iri2, endpoint):
+    """
+    Uncached implementation of classes_equivalent().
+    """
+    return _parse_boolean(_execute(_classes_equivalent_query(iri1, iri2), endpoint, 'classes_equivalent'))
+
+
+def _classes_equivalent_query(iri1, iri2):
+    """
+    @rtype str
+    @return The ASK query for equivalence of iri1 and iri2.
+    """
+    if closure_graph is not None:
+        return 'ASK { GRAPH <' + closure_graph + '> { <' + iri1 + '> <' + CLOSURE_PREDICATE + '> <' + iri2 + '> } }'
+    return 'PREFIX rdfs:<http://www.w3.org/2000/01/rdf-schema#> \
         PREFIX owl: <http://www.w3.org/2002/07/owl#> \
         ASK {\
                  { <' + iri1 + '> rdfs:seeAlso ?samid . \
@@ -157,72 +924,440 @@ def classes_equivalent(iri1, iri2, endpoint = DEFAULT_SPARQL_ENDPOINT):
                 UNION { <' + iri2 + '> owl:equivalentClass+ <' + iri1 + '> .} \
         }'
 
-    try:
-        r = __query(q, endpoint)
-    except ValueError:
-        raise SparqlException('Malformed query %s' % q)
-
-    if 'boolean' in r:
-        return r['boolean']
-    else:
-        raise SparqlException('Malformed response')
-
+@instrumented(metrics, 'shared_superclasses')
 def shared_superclasses(iri1, iri2, endpoint = DEFAULT_SPARQL_ENDPOINT):
     """
     Queries the SPARQL endpoint for common superclasses. Those can have any distance in the inheritance tree.
+    Answered from subclass_index if one is set for the endpoint.
+    Results are cached in query_cache, where the order of iri1 and iri2 does not matter.
     @param iri1: The IRI of the first class/resource.
     @type iri2: str
     @param iri2: The IRI of the second class/resource.
-    @type endpoint str
-    @param endpoint URL of the SPARQL endpoint to query.
+    @type endpoint str|LocalReasoner
+    @param endpoint URL of the SPARQL endpoint to query or a local reasoner to answer the query.
     @rtype list
     @return A list of the IRIs of common superclasses.
     """
-    q = 'PREFIX rdfs:<http://www.w3.org/2000/01/rdf-schema#>\
+    reasoner = _reasoner_for(endpoint)
+    if reasoner is not None:
+        return reasoner.shared_superclasses(iri1, iri2)
+
+    index = _index_for(endpoint)
+    if index is not None:
+        return index.shared_superclasses(iri1, iri2)
+
+    if _unknown(endpoint, iri1, iri2):
+        return []
+
+    known1, known2 = _cached_superclasses(iri1, endpoint), _cached_superclasses(iri2, endpoint)
+    if known1 is not None and known2 is not None:
+        return [iri for iri in known1 if iri in known2]
+
+    return list(_cached(symmetric_key('shared_superclasses', endpoint, iri1, iri2),
+                        lambda: tuple(_query_shared_superclasses(iri1, iri2, endpoint))))
+
+def iter_shared_superclasses(iri1, iri2, endpoint = DEFAULT_SPARQL_ENDPOINT):
+    """
+    Generator variant of shared_superclasses(): Yields the IRIs of common superclasses as soon as they are received.
+    The result is cached like by shared_superclasses() once it was read completely.
+    @type iri1 str
+    @param iri1 The IRI of the first class/resource.
+    @type iri2 str
+    @param iri2 The IRI of the second class/resource.
+    @type endpoint str|LocalReasoner
+    @param endpoint URL of the SPARQL endpoint to query or a local reasoner to answer the query.
+    @rtype generator
+    @return Generator of the IRIs of common superclasses.
+    """
+    reasoner = _reasoner_for(endpoint)
+    if reasoner is not None:
+        yield from reasoner.shared_superclasses(iri1, iri2)
+        return
+
+    index = _index_for(endpoint)
+    if index is not None:
+        yield from index.shared_superclasses(iri1, iri2)
+        return
+
+    if _unknown(endpoint, iri1, iri2):
+        return
+
+    known1, known2 = _cached_superclasses(iri1, endpoint), _cached_superclasses(iri2, endpoint)
+    if known1 is not None and known2 is not None:
+        yield from (iri for iri in known1 if iri in known2)
+        return
+
+    key = symmetric_key('shared_superclasses', endpoint, iri1, iri2)
+    cached = _cache_lookup(key)
+    if cached is not _MISSING:
+        yield from cached
+        return
+
+    received = []
+    for iri in _stream_uris(_shared_superclasses_query(iri1, iri2), endpoint, 'shared_superclasses', 'super'):
+        received.append(iri)
+        yield iri
+    _cache_store(key, tuple(received))
+
+def _query_shared_superclasses(iri1, iri2, endpoint):
+    """
+    Uncached implementation of shared_superclasses().
+    """
+    return _parse_uris(_execute(_shared_superclasses_query(iri1, iri2), endpoint, 'shared_superclasses'), 'super')
+
+def _shared_superclasses_query(iri1, iri2):
+    """
+    @rtype str
+    @return The query for common superclasses of iri1 and iri2. Results are bound to ?super.
+    """
+    return 'PREFIX rdfs:<http://www.w3.org/2000/01/rdf-schema#>\
          PREFIX owl: <http://www.w3.org/2002/07/owl#>\
          SELECT DISTINCT ?super { \
               <' + iri1 + '> rdfs:subClassOf+ ?super . \
               <' + iri2 + '> rdfs:subClassOf+ ?super . \
          }'
 
-    try:
-        r = __query(q, endpoint)
-    except ValueError:
-        raise SparqlException('Malformed query: %s' % q)
+@instrumented(metrics, 'superclasses')
+def superclasses(iri, endpoint = DEFAULT_SPARQL_ENDPOINT):
+    """
+    Queries the SPARQL endpoint for all superclasses of a class. Those can have any distance in the inheritance tree.
+    Answered from subclass_index if one is set for the endpoint.
+    Results are cached in query_cache and then also answer has_type() and shared_superclasses() for the class.
+    @type iri str
+    @param iri The IRI of the class.
+    @type endpoint str|LocalReasoner
+    @param endpoint URL of the SPARQL endpoint to query or a local reasoner to answer the query.
+    @rtype list
+    @return A list of the IRIs of the superclasses.
+    """
+    reasoner = _reasoner_for(endpoint)
+    if reasoner is not None:
+        return reasoner.superclasses(iri)
+
+    index = _index_for(endpoint)
+    if index is not None:
+        return index.superclasses(iri)
+
+    if _unknown(endpoint, iri):
+        return []
+
+    return list(_cached(('superclasses', endpoint, iri),
+                        lambda: tuple(_query_superclasses(iri, endpoint))))
+
+def _query_superclasses(iri, endpoint):
+    """
+    Uncached implementation of superclasses().
+    """
+    return _parse_uris(_execute(_superclasses_query(iri), endpoint, 'superclasses'), 'super')
+
+def _superclasses_query(iri):
+    """
+    @rtype str
+    @return The query for all superclasses of iri. Results are bound to ?super.
+    """
+    return 'PREFIX rdfs:<http://www.w3.org/2000/01/rdf-schema#>\
+         SELECT DISTINCT ?super { \
+              <' + iri + '> rdfs:subClassOf+ ?super . \
+         }'
+
+def _cached_superclasses(iri, endpoint):
+    """
+    @rtype tuple|None
+    @return The superclasses of iri if they are in query_cache (e.g. after warm()), otherwise None.
+    """
+    cache = query_cache
+    if cache is None:
+        return None
+    return cache.peek(('superclasses', endpoint, iri))
 
-    if r and 'results' in r and 'bindings' in r['results']:
-        common_supers = []
-        for binding in r['results']['bindings']:
-            if 'super' in binding and binding['super']['type'] == 'uri':
-                common_supers.append(binding['super']['value'])
-        return common_supers
-    else:
-        raise SparqlException('Malformed response')
 
+@instrumented(metrics, 'has_type')
 def has_type(iri, type_iri, endpoint = DEFAULT_SPARQL_ENDPOINT):
     """
     Queries the SPARQL endpoint if a class is a subclass of a given type.
+    Answered from subclass_index if one is set for the endpoint.
+    Results are cached in query_cache.
     @param iri: The IRI of the first class/resource.
     @type iri: str
     @param type_iri: The IRI of the type to check for.
     @type type_iri str
-    @type endpoint str
-    @param endpoint URL of the SPARQL endpoint to query.
+    @type endpoint str|LocalReasoner
+    @param endpoint URL of the SPARQL endpoint to query or a local reasoner to answer the query.
     @rtype list
     @return Returns True iff iri is a subclass of type_iri.
     """
-    q = 'PREFIX rdfs:<http://www.w3.org/2000/01/rdf-schema#>\
+    reasoner = _reasoner_for(endpoint)
+    if reasoner is not None:
+        return reasoner.has_type(iri, type_iri)
+
+    index = _index_for(endpoint)
+    if index is not None:
+        return index.has_type(iri, type_iri)
+
+    if _unknown(endpoint, iri, type_iri):
+        return False
+
+    known = _cached_superclasses(iri, endpoint)
+    if known is not None:
+        return type_iri in known
+
+    return _cached(('has_type', endpoint, iri, type_iri),
+                   lambda: _query_has_type(iri, type_iri, endpoint))
+
+def _query_has_type(iri, type_iri, endpoint):
+    """
+    Uncached implementation of has_type().
+    """
+    return _parse_boolean(_execute(_has_type_query(iri, type_iri), endpoint, 'has_type'))
+
+def _has_type_query(iri, type_iri):
+    """
+    @rtype str
+    @return The ASK query whether iri is a subclass of type_iri.
+    """
+    return 'PREFIX rdfs:<http://www.w3.org/2000/01/rdf-schema#>\
          PREFIX owl: <http://www.w3.org/2002/07/owl#>\
          ASK { \
               <' + iri + '> rdfs:subClassOf+ <' + type_iri + '> . \
          }'
 
-    try:
-        r = __query(q, endpoint)
-    except ValueError:
-        raise SparqlException('Malformed query %s' % q)
 
-    if 'boolean' in r:
-        return r['boolean']
+@instrumented(metrics, 'equivalent_classes_many')
+def equivalent_classes_many(iris, endpoint = DEFAULT_SPARQL_ENDPOINT):
+    """
+    Like equivalent_classes(), but for multiple IRIs at once. IRIs whose result is not cached are looked up
+    using a single query with a VALUES block.
+    @type iris: iterable
+    @param iris: The IRIs of the classes for which equivalent classes should be found.
+    @type endpoint str|LocalReasoner
+    @param endpoint URL of the SPARQL endpoint to query or a local reasoner to answer the query.
+    @rtype: dict
+    @return: Mapping of each IRI to the list of the IRIs of its equivalent classes.
+    @raise SparqlException: Raised if the internally constructed query is malformed or the response of the endpoint is.
+    """
+    reasoner = _reasoner_for(endpoint)
+    sets = expansion_cache
+    result = {}
+    missing = []
+    for iri in iris:
+        if iri in result:
+            continue
+        elif reasoner is not None:
+            result[iri] = reasoner.equivalent_classes(iri)
+        elif _unknown(endpoint, iri):
+            result[iri] = []
+        elif sets is not None:
+            members = sets.get(endpoint, iri)
+            if members is None:
+                result[iri] = None
+                missing.append(iri)
+            else:
+                result[iri] = _equivalents(members, iri)
+        else:
+            cached = _cache_lookup(('equivalent_classes', endpoint, iri))
+            if cached is _MISSING:
+                result[iri] = None
+                missing.append(iri)
+            else:
+                result[iri] = list(cached)
+
+    if missing:
+        eq_classes = _query_equivalent_classes_many(missing, endpoint)
+        for iri in missing:
+            if sets is not None:
+                result[iri] = _equivalents(sets.put(endpoint, iri, eq_classes[iri]), iri)
+            else:
+                _cache_store(('equivalent_classes', endpoint, iri), tuple(eq_classes[iri]))
+                result[iri] = eq_classes[iri]
+    return result
+
+
+def _query_equivalent_classes_many(iris, endpoint):
+    """
+    Uncached implementation of equivalent_classes_many().
+    @rtype dict
+    @return Mapping of each IRI to the list of its equivalent classes.
+    """
+    r = _execute(_equivalent_classes_many_query(iris), endpoint, 'equivalent_classes_many')
+    if r and 'results' in r and 'bindings' in r['results']:
+        eq_classes = {iri: [] for iri in iris}
+        for binding in r['results']['bindings']:
+            if 's' in binding and 'o' in binding and binding['o']['type'] == 'uri' \
+                    and binding['s']['value'] in eq_classes:
+                eq_classes[binding['s']['value']].append(binding['o']['value'])
+        return eq_classes
+    else:
+        raise SparqlException('Malformed response')
+
+
+def _equivalent_classes_many_query(iris):
+    """
+    @rtype str
+    @return The query for classes equivalent to any of iris. Results are bound to ?s (one of iris) and ?o.
+    """
+    values = ' '.join('<' + iri + '>' for iri in iris)
+    if closure_graph is not None:
+        return 'SELECT DISTINCT ?s ?o { VALUES ?s { ' + values + ' } \
+                GRAPH <' + closure_graph + '> { ?s <' + CLOSURE_PREDICATE + '> ?o } }'
+    return 'PREFIX rdfs:<http://www.w3.org/2000/01/rdf-schema#>\
+         PREFIX owl: <http://www.w3.org/2002/07/owl#>\
+         SELECT DISTINCT ?s ?o {\
+                 VALUES ?s { ' + values + ' } \
+                 { ?s rdfs:seeAlso+ ?o .} \
+                UNION { ?s owl:sameAs+ ?o . } \
+                 UNION { ?s owl:equivalentClass+ ?o .} \
+                UNION { ?o rdfs:seeAlso+ ?s .} \
+                UNION { ?o owl:sameAs+ ?s . } \
+                 UNION { ?o owl:equivalentClass+ ?s .}}'
+
+
+@instrumented(metrics, 'classes_equivalent_many')
+def classes_equivalent_many(pairs, endpoint = DEFAULT_SPARQL_ENDPOINT):
+    """
+    Like classes_equivalent(), but for multiple pairs of IRIs at once. Pairs whose result is not cached are checked
+    using a single query with a VALUES block.
+    @type pairs: iterable
+    @param pairs: Tuples (iri1, iri2) of IRIs to check for equivalence.
+    @type endpoint str|LocalReasoner
+    @param endpoint URL of the SPARQL endpoint to query or a local reasoner to answer the query.
+    @rtype: dict
+    @return: Mapping of each pair (as given) to True if the classes/resources are equivalent and False otherwise.
+    @raise SparqlException: Raised if the internally constructed query is malformed or the response of the endpoint is.
+    """
+    reasoner = _reasoner_for(endpoint)
+    sets = expansion_cache
+    if reasoner is None and sets is not None:
+        return _classes_equivalent_many_by_sets(sets, pairs, endpoint)
+
+    result = {}
+    missing = {}  # Cache key -> pair to query
+    for iri1, iri2 in pairs:
+        pair = (iri1, iri2)
+        if pair in result:
+            continue
+        elif iri1 == iri2:
+            result[pair] = True
+        elif reasoner is not None:
+            result[pair] = reasoner.classes_equivalent(iri1, iri2)
+        elif _unknown(endpoint, iri1, iri2):
+            result[pair] = False
+        else:
+            key = symmetric_key('classes_equivalent', endpoint, iri1, iri2)
+            cached = _cache_lookup(key)
+            if cached is _MISSING:
+                missing.setdefault(key, pair)
+                result[pair] = None
+            else:
+                result[pair] = cached
+
+    if missing:
+        equivalent = _query_classes_equivalent_many(list(missing.values()), endpoint)
+        for key, pair in missing.items():
+            _cache_store(key, pair in equivalent)
+        for pair, r in result.items():
+            if r is None:
+                result[pair] = pair in equivalent or (pair[1], pair[0]) in equivalent
+    return result
+
+
+def _classes_equivalent_many_by_sets(sets, pairs, endpoint):
+    """
+    Implementation of classes_equivalent_many() using an expansion cache: The equivalence sets of the first IRIs
+    of all pairs that cannot be answered from the cache are fetched by a single query.
+    @type sets EquivalenceSetCache
+    @rtype dict
+    @return Mapping of each pair to True if the classes/resources are equivalent and False otherwise.
+    """
+    pairs = list(pairs)
+    result = {}
+    unknown = {}  # Used as ordered set
+    for iri1, iri2 in pairs:
+        if iri1 == iri2:
+            result[(iri1, iri2)] = True
+        elif _unknown(endpoint, iri1, iri2):
+            result[(iri1, iri2)] = False
+        else:
+            r = sets.equivalent(endpoint, iri1, iri2)
+            if r is None:
+                unknown[iri1] = True
+            else:
+                result[(iri1, iri2)] = r
+
+    fetched = {}
+    if unknown:
+        for iri, eq_classes in _query_equivalent_classes_many(list(unknown), endpoint).items():
+            fetched[iri] = sets.put(endpoint, iri, eq_classes)
+
+    for iri1, iri2 in pairs:
+        if (iri1, iri2) not in result:
+            result[(iri1, iri2)] = iri2 in fetched.get(iri1, ())
+    return result
+
+
+def _query_classes_equivalent_many(pairs, endpoint):
+    """
+    Uncached implementation of classes_equivalent_many().
+    @rtype set
+    @return The set of the given pairs whose classes/resources are equivalent.
+    """
+    r = _execute(_classes_equivalent_many_query(pairs), endpoint, 'classes_equivalent_many')
+    if r and 'results' in r and 'bindings' in r['results']:
+        equivalent = set()
+        for binding in r['results']['bindings']:
+            if 'a' in binding and 'b' in binding:
+                equivalent.add((binding['a']['value'], binding['b']['value']))
+        return equivalent
     else:
-        raise SparqlException('Malformed response')
\ No newline at end of file
+        raise SparqlException('Malformed response')
+
+
+def _classes_equivalent_many_query(pairs):
+    """
+    @rtype str
+    @return The query for the equivalent ones of pairs of IRIs. Equivalent pairs are bound to ?a and ?b.
+    """
+    values = ' '.join('(<' + iri1 + '> <' + iri2 + '>)' for iri1, iri2 in pairs)
+    if closure_graph is not None:
+        return 'SELECT DISTINCT ?a ?b { VALUES (?a ?b) { ' + values + ' } \
+                GRAPH <' + closure_graph + '> { ?a <' + CLOSURE_PREDICATE + '> ?b } }'
+    return 'PREFIX rdfs:<http://www.w3.org/2000/01/rdf-schema#> \
+        PREFIX owl: <http://www.w3.org/2002/07/owl#> \
+        SELECT DISTINCT ?a ?b {\
+                VALUES (?a ?b) { ' + values + ' } \
+                { ?a rdfs:seeAlso+ ?b . } \
+                UNION { ?a owl:sameAs+ ?b . } \
+                UNION { ?a owl:equivalentClass+ ?b .} \
+                UNION { ?b rdfs:seeAlso+ ?a .} \
+                UNION { ?b owl:sameAs+ ?a . } \
+                UNION { ?b owl:equivalentClass+ ?a .} \
+        }'
+
+
+def warm(iris, endpoint = DEFAULT_SPARQL_ENDPOINT, parallelism=4):
+    """
+    Fetches the equivalent classes and superclasses of IRIs concurrently into the in-process caches,
+    so that later checks involving these IRIs need no query. The equivalence sets are kept in expansion_cache
+    if set, which then answers classes_equivalent() for any pair involving one of the IRIs.
+    @type iris iterable
+    @param iris The IRIs of the classes that will be asked about.
+    @type endpoint str|LocalReasoner
+    @param endpoint URL of the SPARQL endpoint to query or a local reasoner to answer the queries.
+    @type parallelism int
+    @param parallelism Maximum number of queries in flight at once.
+    @rtype dict
+    @return Mapping of the IRIs that could not be warmed up to the exception raised. Empty on success.
+    """
+    if parallelism < 1:
+        raise ValueError('parallelism must be positive')
+
+    failed = {}
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        futures = []
+        for iri in set(iris):
+            futures.append((iri, executor.submit(equivalent_classes, iri, endpoint)))
+            futures.append((iri, executor.submit(superclasses, iri, endpoint)))
+        for iri, future in futures:
+            e = future.exception()
+            if e is not None:
+                failed.setdefault(iri, e)
+    return failed
@@ -0,0 +1,236 @@
+# Module sparql.aio
+# asyncio counterparts of the query functions of the sparql module.
+#
+# The functions share the query cache, persistent cache and local reasoners with the blocking functions,
+# so many independent checks can be awaited concurrently, e.g. by asyncio.gather().
+#
+# Example:
+#     results = await asyncio.gather(*[aio.classes_equivalent(a, b) for a, b in pairs])
+
+import asyncio
+from urllib.parse import urlencode
+
+from src import sparql
+from src.sparql import DEFAULT_SPARQL_ENDPOINT, SparqlException, symmetric_key
+from src.sparql.backend import HttpBackend
+from src.sparql.metrics import instrumented
+from src.sparql.pool import AsyncConnectionPool
+
+# Keep-alive connections to the SPARQL endpoints. The number of concurrent queries per endpoint is bounded
+# by the size of the pool. See set_connection_pool().
+connection_pool = AsyncConnectionPool()
+
+# Keys of the cache entries currently refreshed in the background and the tasks refreshing them.
+_refreshing = set()
+_refresh_tasks = set()
+
+
+def set_connection_pool(pool):
+    """
+    Replaces the pool of connections used for querying SPARQL endpoints, e.g. in order to change the number
+    of concurrent queries per endpoint or the timeout.
+    @type pool AsyncConnectionPool
+    @param pool The new connection pool.
+    """
+    global connection_pool
+    old_pool, connection_pool = connection_pool, pool
+    old_pool.close()
+
+
+async def _query(q, endpoint, kind = None):
+    """
+    Files a query to a SPARQL endpoint over a keep-alive connection from connection_pool
+    or to sparql.backend if another backend is set. Like sparql._fetch(), answers it from
+    sparql.persistent_cache if possible and only records it in sparql.metrics if it is sent to the endpoint.
+    @rtype dict
+    @return The deserialized response of the endpoint.
+    """
+    r = sparql._stored_response(q, endpoint)
+    if r is None:
+        with sparql._sending(endpoint, kind):
+            backend = sparql.backend
+            if type(backend) is HttpBackend and backend.pool is None:
+                response = await connection_pool.request('POST', endpoint, body=urlencode({'query': q}),
+                                                         headers=sparql.QUERY_HEADERS,
+                                                         timeout=sparql._query_timeout())
+                r = sparql._decode_response(response, endpoint)
+            else:
+                r = await backend.query_async(q, endpoint)
+        sparql._store_response(q, endpoint, r)
+    return r
+
+
+async def _execute(q, endpoint, kind):
+    try:
+        return await _query(q, endpoint, kind)
+    except ValueError:
+        raise SparqlException('Malformed query: %s' % q)
+
+
+async def _cached(key, compute):
+    """
+    Returns the result cached for key or awaits compute() and caches its result if there is none.
+    An expired result still kept by sparql.query_cache is returned immediately and refreshed in the background.
+    """
+    r = sparql._cache_lookup(key)
+    if r is sparql._MISSING:
+        r = sparql._stale_lookup(key)
+        if r is not sparql._MISSING:
+            _refresh(key, compute)
+            return r
+        r = await compute()
+        sparql._cache_store(key, r)
+    return r
+
+
+def _refresh(key, compute):
+    """
+    asyncio counterpart of sparql._refresh(). Refreshes the result for key in a task of the running event loop.
+    """
+    if key in _refreshing:
+        return
+    _refreshing.add(key)
+
+    async def run():
+        try:
+            sparql._cache_store(key, await compute())
+        except Exception:
+            pass
+        finally:
+            _refreshing.discard(key)
+
+    _refresh_tasks.add(asyncio.ensure_future(run()))
+    for task in [task for task in _refresh_tasks if task.done()]:
+        _refresh_tasks.discard(task)
+
+
+async def _equivalence_set(sets, iri, endpoint):
+    """
+    asyncio counterpart of sparql._equivalence_set().
+    """
+    members = sets.get(endpoint, iri)
+    if members is None:
+        members = await _fetch_equivalence_set(sets, iri, endpoint)
+    return members
+
+
+async def _fetch_equivalence_set(sets, iri, endpoint):
+    """
+    Fetches the equivalence set of an IRI from the endpoint and stores it in sets.
+    """
+    r = await _execute(sparql._equivalent_classes_query(iri), endpoint, 'equivalent_classes')
+    return sets.put(endpoint, iri, sparql._parse_uris(r, 'o'))
+
+
+@instrumented(sparql.metrics, 'equivalent_classes')
+async def equivalent_classes(iri, endpoint = DEFAULT_SPARQL_ENDPOINT):
+    """
+    asyncio counterpart of sparql.equivalent_classes().
+    @rtype: list
+    @return: List of the IRIs of equivalent classes.
+    """
+    reasoner = sparql._reasoner_for(endpoint)
+    if reasoner is not None:
+        return reasoner.equivalent_classes(iri)
+
+    if sparql._unknown(endpoint, iri):
+        return []
+
+    sets = sparql.expansion_cache
+    if sets is not None:
+        return sparql._equivalents(await _equivalence_set(sets, iri, endpoint), iri)
+
+    async def compute():
+        r = await _execute(sparql._equivalent_classes_query(iri), endpoint, 'equivalent_classes')
+        return tuple(sparql._parse_uris(r, 'o'))
+
+    return list(await _cached(('equivalent_classes', endpoint, iri), compute))
+
+
+@instrumented(sparql.metrics, 'classes_equivalent')
+async def classes_equivalent(iri1, iri2, endpoint = DEFAULT_SPARQL_ENDPOINT):
+    """
+    asyncio counterpart of sparql.classes_equivalent().
+    @rtype: bool
+    @return: Returns true if the classes/resources are equivalent.
+    """
+    if iri1 == iri2:
+        return True
+
+    reasoner = sparql._reasoner_for(endpoint)
+    if reasoner is not None:
+        return reasoner.classes_equivalent(iri1, iri2)
+
+    if sparql._unknown(endpoint, iri1, iri2):
+        return False
+
+    sets = sparql.expansion_cache
+    if sets is not None:
+        r = sets.equivalent(endpoint, iri1, iri2)
+        if r is None:
+            r = iri2 in await _fetch_equivalence_set(sets, iri1, endpoint)
+        return r
+
+    async def compute():
+        r = await _execute(sparql._classes_equivalent_query(iri1, iri2), endpoint, 'classes_equivalent')
+        return sparql._parse_boolean(r)
+
+    return await _cached(symmetric_key('classes_equivalent', endpoint, iri1, iri2), compute)
+
+
+@instrumented(sparql.metrics, 'shared_superclasses')
+async def shared_superclasses(iri1, iri2, endpoint = DEFAULT_SPARQL_ENDPOINT):
+    """
+    asyncio counterpart of sparql.shared_superclasses().
+    @rtype list
+    @return A list of the IRIs of common superclasses.
+    """
+    reasoner = sparql._reasoner_for(endpoint)
+    if reasoner is not None:
+        return reasoner.shared_superclasses(iri1, iri2)
+
+    index = sparql._index_for(endpoint)
+    if index is not None:
+        return index.shared_superclasses(iri1, iri2)
+
+    if sparql._unknown(endpoint, iri1, iri2):
+        return []
+
+    known1, known2 = sparql._cached_superclasses(iri1, endpoint), sparql._cached_superclasses(iri2, endpoint)
+    if known1 is not None and known2 is not None:
+        return [iri for iri in known1 if iri in known2]
+
+    async def compute():
+        r = await _execute(sparql._shared_superclasses_query(iri1, iri2), endpoint, 'shared_superclasses')
+        return tuple(sparql._parse_uris(r, 'super'))
+
+    return list(await _cached(symmetric_key('shared_superclasses', endpoint, iri1, iri2), compute))
+
+
+@instrumented(sparql.metrics, 'has_type')
+async def has_type(iri, type_iri, endpoint = DEFAULT_SPARQL_ENDPOINT):
+    """
+    asyncio counterpart of sparql.has_type().
+    @rtype bool
+    @return Returns True iff iri is a subclass of type_iri.
+    """
+    reasoner = sparql._reasoner_for(endpoint)
+    if reasoner is not None:
+        return reasoner.has_type(iri, type_iri)
+
+    index = sparql._index_for(endpoint)
+    if index is not None:
+        return index.has_type(iri, type_iri)
+
+    if sparql._unknown(endpoint, iri, type_iri):
+        return False
+
+    known = sparql._cached_superclasses(iri, endpoint)
+    if known is not None:
+        return type_iri in known
+
+    async def compute():
+        r = await _execute(sparql._has_type_query(iri, type_iri), endpoint, 'has_type')
+        return sparql._parse_boolean(r)
+
+    return await _cached(('has_type', endpoint, iri, type_iri), compute)
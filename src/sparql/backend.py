@@ -0,0 +1,260 @@
+# Module sparql.backend
+# Backends answering the SPARQL queries of the sparql module.
+#
+# HttpBackend sends queries to remote endpoints (the default), GraphBackend evaluates them on an in-memory
+# rdflib graph and RecordingBackend/ReplayBackend record responses of another backend and play them back,
+# so query paths can be tested and benchmarked deterministically without any endpoint.
+#
+# Example:
+#     sparql.set_backend(GraphBackend())  # Evaluate all queries on the ontology of this repository
+
+import asyncio
+import contextvars
+import json
+import threading
+from urllib.parse import urlencode
+
+from rdflib import Dataset
+
+from src import sparql
+from src.sparql.local import DEFAULT_ONTOLOGY_FILES
+from src.sparql.persistent import normalize_query
+from src.sparql.pool import PooledResponse
+from src.sparql.stream import iter_bindings
+
+# Number of bytes read from the network at once when streaming results.
+STREAM_CHUNK_SIZE = 8192
+
+# Headers of the POST requests used for SPARQL UPDATE requests.
+UPDATE_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+class SparqlBackend(object):
+    """
+    Interface of backends answering SPARQL queries with deserialized SPARQL JSON results.
+    """
+
+    def query(self, q, endpoint):
+        """
+        Answers a query.
+        @type q str
+        @param q The SPARQL query.
+        @type endpoint str
+        @param endpoint URL of the SPARQL endpoint the query is addressed to.
+        @rtype dict
+        @return The SPARQL JSON results, i.e. a dict with either 'results' or 'boolean'.
+        @raise ValueError If the query is malformed.
+        @raise SparqlException If the query could not be answered.
+        """
+        raise NotImplementedError()
+
+    def query_stream(self, q, endpoint):
+        """
+        Answers a SELECT query, yielding the bindings of the result as they are received.
+        Unless overridden, the complete result of query() is fetched first.
+        @type q str
+        @param q The SPARQL SELECT query.
+        @type endpoint str
+        @param endpoint URL of the SPARQL endpoint the query is addressed to.
+        @rtype generator
+        @return Generator of the bindings.
+        @raise ValueError If the query is malformed.
+        @raise SparqlException If the query could not be answered or the response is malformed.
+        """
+        r = self.query(q, endpoint)
+        if r and 'results' in r and 'bindings' in r['results']:
+            yield from r['results']['bindings']
+        else:
+            raise sparql.SparqlException('Malformed response')
+
+    def update(self, u, endpoint):
+        """
+        Executes a SPARQL UPDATE request.
+        @type u str
+        @param u The update request.
+        @type endpoint str
+        @param endpoint URL of the SPARQL endpoint the request is addressed to.
+        @raise ValueError If the request is malformed.
+        @raise SparqlException If the request failed.
+        @raise NotImplementedError If the backend is read-only.
+        """
+        raise NotImplementedError('%s does not support updates' % type(self).__name__)
+
+    async def query_async(self, q, endpoint):
+        """
+        asyncio counterpart of query(). Runs query() in the default executor unless overridden, in a copy of
+        the current context, so that e.g. a per-call timeout set by sparql.timeout() applies.
+        """
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(None, context.run, self.query, q, endpoint)
+
+    def close(self):
+        """
+        Releases the resources of the backend.
+        """
+        pass
+
+
+class HttpBackend(SparqlBackend):
+    """
+    Sends queries to remote SPARQL endpoints over the SPARQL 1.1 protocol.
+    """
+
+    def __init__(self, pool=None):
+        """
+        @type pool ConnectionPool|None
+        @param pool The connection pool to use. sparql.connection_pool if None.
+        """
+        super().__init__()
+        self.pool = pool
+
+    def query(self, q, endpoint):
+        pool = self.pool if self.pool is not None else sparql.connection_pool
+        response = pool.request('POST', endpoint, body=urlencode({'query': q}), headers=sparql.QUERY_HEADERS,
+                                timeout=sparql._query_timeout())
+        return sparql._decode_response(response, endpoint)
+
+    def query_stream(self, q, endpoint):
+        pool = self.pool if self.pool is not None else sparql.connection_pool
+        with pool.stream('POST', endpoint, body=urlencode({'query': q}), headers=sparql.QUERY_HEADERS,
+                         timeout=sparql._query_timeout()) as response:
+            if response.status != 200:
+                sparql._decode_response(PooledResponse(response.status, response.reason, response.headers,
+                                                       response.read()), endpoint)
+            try:
+                yield from iter_bindings(iter(lambda: response.read1(STREAM_CHUNK_SIZE), b''))
+            except ValueError:
+                raise sparql.SparqlException('Malformed response of SPARQL endpoint %s' % endpoint)
+
+    def update(self, u, endpoint):
+        pool = self.pool if self.pool is not None else sparql.connection_pool
+        response = pool.request('POST', endpoint, body=urlencode({'update': u}), headers=UPDATE_HEADERS,
+                                timeout=sparql._query_timeout())
+        if response.status == 400:
+            raise ValueError('SPARQL endpoint %s rejected the update: %s'
+                             % (endpoint, response.data.decode('utf-8', 'replace')))
+        elif not 200 <= response.status < 300:
+            raise sparql.SparqlException('Received %d %s from SPARQL endpoint %s'
+                                         % (response.status, response.reason, endpoint))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+
+
+class GraphBackend(SparqlBackend):
+    """
+    Evaluates queries and updates on an in-memory rdflib dataset, regardless of the endpoint they are addressed to.
+    The default graph of the dataset is the union of all its graphs, like in Blazegraph's quads mode.
+
+    Example:
+        backend = GraphBackend('ontology/ontology.owl')
+        backend.query('ASK { ?s ?p ?o }', sparql.DEFAULT_SPARQL_ENDPOINT)
+        > {'head': {}, 'boolean': True}
+    """
+
+    def __init__(self, *paths, graph=None):
+        """
+        @type paths str
+        @param paths Paths of the OWL (RDF/XML) files to load. The ontology of this repository if none given.
+        @type graph rdflib.Graph
+        @param graph An already loaded graph to use instead of files. Must be a Dataset for updates of named graphs.
+        """
+        super().__init__()
+        if graph is None:
+            graph = Dataset(default_union=True)
+            for path in paths or DEFAULT_ONTOLOGY_FILES:
+                graph.parse(path, format='xml')
+        self.graph = graph
+        self.__lock = threading.Lock()
+
+    def query(self, q, endpoint):
+        with self.__lock:
+            try:
+                result = self.graph.query(q)
+            except Exception as e:
+                # rdflib raises pyparsing exceptions for syntax errors:
+                raise ValueError('Malformed query: %s' % e)
+            return json.loads(result.serialize(format='json').decode('utf-8'))
+
+    def update(self, u, endpoint):
+        with self.__lock:
+            try:
+                self.graph.update(u)
+            except Exception as e:
+                raise ValueError('Malformed update: %s' % e)
+
+
+class RecordingBackend(SparqlBackend):
+    """
+    Passes queries to another backend and records the responses, which can then be saved for a ReplayBackend.
+
+    Example:
+        recorder = RecordingBackend(HttpBackend())
+        sparql.set_backend(recorder)
+        ...
+        recorder.save('recording.json')
+    """
+
+    def __init__(self, backend):
+        """
+        @type backend SparqlBackend
+        @param backend The backend answering the queries.
+        """
+        super().__init__()
+        self.backend = backend
+        self.recordings = {}  # (endpoint, normalized query) -> response
+        self.__lock = threading.Lock()
+
+    def query(self, q, endpoint):
+        r = self.backend.query(q, endpoint)
+        with self.__lock:
+            self.recordings[(endpoint, normalize_query(q))] = r
+        return r
+
+    def update(self, u, endpoint):
+        self.backend.update(u, endpoint)
+
+    def save(self, path):
+        """
+        Writes the recorded responses to a JSON file.
+        @type path str
+        @param path Path of the file.
+        """
+        with self.__lock:
+            entries = [{'endpoint': endpoint, 'query': q, 'response': r}
+                       for (endpoint, q), r in sorted(self.recordings.items())]
+        with open(path, 'w') as f:
+            json.dump(entries, f, indent=1)
+
+    def close(self):
+        self.backend.close()
+
+
+class ReplayBackend(SparqlBackend):
+    """
+    Answers queries with responses previously recorded by a RecordingBackend.
+    """
+
+    def __init__(self, path=None, recordings=None):
+        """
+        @type path str|None
+        @param path Path of a file written by RecordingBackend.save().
+        @type recordings dict|None
+        @param recordings Recorded responses, e.g. RecordingBackend.recordings, used instead of a file.
+        """
+        super().__init__()
+        self.recordings = dict(recordings or {})
+        if path is not None:
+            with open(path) as f:
+                for entry in json.load(f):
+                    self.recordings[(entry['endpoint'], entry['query'])] = entry['response']
+
+    def query(self, q, endpoint):
+        r = self.recordings.get((endpoint, normalize_query(q)))
+        if r is None:
+            raise sparql.SparqlException('No response to the query was recorded for %s: %s' % (endpoint, q))
+        return r
+
+    async def query_async(self, q, endpoint):
+        return self.query(q, endpoint)
@@ -0,0 +1,197 @@
+# Module sparql.balancer
+# Load balancing of queries over replicas of a SPARQL endpoint.
+#
+# Queries addressed to an endpoint are sent to the replica with the lowest moving average latency.
+# Failing replicas are ejected for some time and slow requests can be hedged by sending them
+# to a second replica, whichever answers first wins.
+#
+# Example:
+#     sparql.set_backend(BalancedBackend(['http://kb1:9999/bigdata/namespace/wotkb/sparql',
+#                                         'http://kb2:9999/bigdata/namespace/wotkb/sparql'], hedge_after=0.2))
+
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from src import sparql
+from src.sparql.backend import HttpBackend, SparqlBackend
+
+
+class _Replica(object):
+    """
+    Latency and health statistics of a single replica.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.ewma = None  # Moving average of the latency in seconds, None until measured
+        self.requests = 0
+        self.failures = 0  # Consecutive failures
+        self.ejected_until = 0.0
+
+
+class BalancedBackend(SparqlBackend):
+    """
+    Backend distributing the queries addressed to an endpoint over its replicas.
+    Queries to endpoints without replicas are passed on unchanged.
+    """
+
+    def __init__(self, replicas, backend=None, alpha=0.3, hedge_after=None, eject_after=3, eject_seconds=30.0,
+                 max_workers=8):
+        """
+        @type replicas list|dict
+        @param replicas URLs of the replicas of DEFAULT_SPARQL_ENDPOINT or a mapping of endpoints to the URLs
+        of their replicas.
+        @type backend SparqlBackend|None
+        @param backend The backend sending the queries to the replicas. A HttpBackend if None.
+        @type alpha float
+        @param alpha Weight of the latest latency in the moving average (0 < alpha <= 1).
+        @type hedge_after float|None
+        @param hedge_after Seconds after which a query still pending is also sent to the next best replica.
+        None for no hedging.
+        @type eject_after int
+        @param eject_after Number of consecutive failures after which a replica is ejected.
+        @type eject_seconds float
+        @param eject_seconds Seconds an ejected replica receives no queries.
+        @type max_workers int
+        @param max_workers Maximum number of hedged requests in flight.
+        """
+        super().__init__()
+        if not 0 < alpha <= 1:
+            raise ValueError('alpha must be in (0, 1]')
+        if not isinstance(replicas, dict):
+            replicas = {sparql.DEFAULT_SPARQL_ENDPOINT: replicas}
+        self.backend = backend if backend is not None else HttpBackend()
+        self.alpha = alpha
+        self.hedge_after = hedge_after
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.__replicas = {endpoint: [_Replica(url) for url in urls] for endpoint, urls in replicas.items()}
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sparql-hedge') \
+            if hedge_after is not None else None
+
+    def __ranked(self, replicas):
+        """
+        @rtype list
+        @return The replicas ordered by preference: healthy ones by latency (unmeasured first), then ejected ones
+        by the end of their ejection.
+        """
+        now = time.monotonic()
+        with self.__lock:
+            healthy = [r for r in replicas if r.ejected_until <= now]
+            ejected = [r for r in replicas if r.ejected_until > now]
+            healthy.sort(key=lambda r: -1.0 if r.ewma is None else r.ewma)
+            ejected.sort(key=lambda r: r.ejected_until)
+        return healthy + ejected
+
+    def __record(self, replica, latency=None):
+        """
+        Records a successful query with its latency or a failure if latency is None.
+        """
+        with self.__lock:
+            replica.requests += 1
+            if latency is None:
+                replica.failures += 1
+                if replica.failures >= self.eject_after:
+                    replica.ejected_until = time.monotonic() + self.eject_seconds
+            else:
+                replica.failures = 0
+                replica.ejected_until = 0.0
+                replica.ewma = latency if replica.ewma is None else \
+                    self.alpha * latency + (1 - self.alpha) * replica.ewma
+
+    def __send(self, replica, q):
+        start = time.monotonic()
+        try:
+            r = self.backend.query(q, replica.url)
+        except ValueError:
+            self.__record(replica, time.monotonic() - start)  # The replica works, the query is malformed
+            raise
+        except Exception:
+            self.__record(replica)
+            raise
+        self.__record(replica, time.monotonic() - start)
+        return r
+
+    def query(self, q, endpoint):
+        replicas = self.__replicas.get(endpoint)
+        if not replicas:
+            return self.backend.query(q, endpoint)
+
+        ranked = self.__ranked(replicas)
+        if self.__executor is None or len(ranked) < 2:
+            return self.__failover(q, ranked)
+        return self.__hedged(q, ranked)
+
+    def __failover(self, q, ranked):
+        """
+        Sends a query to the replicas in order until one answers.
+        """
+        error = None
+        for replica in ranked:
+            try:
+                return self.__send(replica, q)
+            except ValueError:
+                raise
+            except Exception as e:
+                error = e
+        raise error
+
+    def __hedged(self, q, ranked):
+        """
+        Sends a query to the best replica and, if it has not answered within hedge_after seconds or failed,
+        also to the next one. Returns the first answer.
+        """
+        pending = {self.__submit(ranked[0], q)}
+        remaining = ranked[1:]
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=self.hedge_after if remaining else None,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except ValueError:
+                    raise
+                except Exception as e:
+                    error = e
+            if remaining:  # Timed out or failed: hedge with the next replica
+                pending.add(self.__submit(remaining.pop(0), q))
+        raise error
+
+    def __submit(self, replica, q):
+        """
+        Sends a query to a replica in the hedge executor, in a copy of the current context, so that e.g. a per-call
+        timeout set by sparql.timeout() applies.
+        """
+        return self.__executor.submit(contextvars.copy_context().run, self.__send, replica, q)
+
+    def update(self, u, endpoint):
+        """
+        Executes an update on all replicas of the endpoint.
+        """
+        replicas = self.__replicas.get(endpoint)
+        if not replicas:
+            self.backend.update(u, endpoint)
+            return
+        for replica in replicas:
+            self.backend.update(u, replica.url)
+
+    def stats(self):
+        """
+        @rtype dict
+        @return Mapping of each replica URL to its moving average latency, number of requests,
+        consecutive failures and whether it is ejected.
+        """
+        now = time.monotonic()
+        with self.__lock:
+            return {r.url: {'ewma': r.ewma, 'requests': r.requests, 'failures': r.failures,
+                            'ejected': r.ejected_until > now}
+                    for replicas in self.__replicas.values() for r in replicas}
+
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+        self.backend.close()
@@ -0,0 +1,160 @@
+# Module sparql.bloom
+# Bloom filter of the IRIs known to a knowledge base.
+#
+# Checks involving an IRI the knowledge base has never heard of (e.g. the private vocabulary of a thing)
+# have a known answer: Such an IRI has no equivalent classes and no superclasses. KnownIriFilter tells with
+# certainty that an IRI is unknown, so these checks need no query.
+
+import hashlib
+import math
+import threading
+import time
+
+from rdflib import Graph, URIRef
+
+from src import sparql
+from src.sparql.local import DEFAULT_ONTOLOGY_FILES
+
+# Fetches every IRI used as subject, predicate or object.
+IRIS_QUERY = 'SELECT DISTINCT ?iri { \
+              { ?iri ?p ?o } UNION { ?s ?iri ?o } UNION { ?s ?p ?iri } \
+              FILTER(isIRI(?iri)) \
+         }'
+
+
+class BloomFilter(object):
+    """
+    Set of strings with a false positive rate but without false negatives.
+
+    Example:
+        bloom = BloomFilter(capacity=1000, error_rate=0.001)
+        bloom.add('http://www.matthias-fisch.de/ontologies/wot#AlarmAction')
+        'http://www.matthias-fisch.de/ontologies/wot#AlarmAction' in bloom
+        > True
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        """
+        @type capacity int
+        @param capacity Number of items the filter is sized for.
+        @type error_rate float
+        @param error_rate Probability of false positives when capacity items are added.
+        """
+        super().__init__()
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+        capacity = max(capacity, 1)
+        self.size = max(int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.__bits = bytearray((self.size + 7) // 8)
+
+    def __positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        """
+        @type item str
+        @param item The string to add.
+        """
+        for position in self.__positions(item):
+            self.__bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        bits = self.__bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self.__positions(item))
+
+
+class KnownIriFilter(object):
+    """
+    Bloom filter of all IRIs of a SPARQL endpoint or of local OWL files, rebuilt periodically.
+    Install it with sparql.set_known_iris() in order to answer checks involving unknown IRIs for its endpoint
+    without querying it.
+
+    Example:
+        known = KnownIriFilter(refresh_interval=3600)  # Loads the IRIs from DEFAULT_SPARQL_ENDPOINT
+        sparql.set_known_iris(known)
+    """
+
+    def __init__(self, endpoint = sparql.DEFAULT_SPARQL_ENDPOINT, ontology_files=None, error_rate=0.001,
+                 refresh_interval=3600):
+        """
+        @type endpoint str
+        @param endpoint URL of the SPARQL endpoint whose IRIs are loaded.
+        @type ontology_files list|None
+        @param ontology_files If given, the IRIs are loaded from these OWL files instead of querying endpoint
+        (an empty list for the ontology of this repository). The filter then answers for endpoint nevertheless.
+        @type error_rate float
+        @param error_rate Probability that an unknown IRI is taken as known (and thus queried).
+        @type refresh_interval float|None
+        @param refresh_interval Seconds after which the filter is rebuilt in the background. None for never.
+        """
+        super().__init__()
+        self.endpoint = endpoint
+        self.ontology_files = ontology_files
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.rejected = 0  # Number of IRIs found to be unknown
+        self.__bloom = None
+        self.__built = 0.0
+        self.__refreshing = False
+        self.__lock = threading.Lock()
+        self.refresh()
+
+    def __load_iris(self):
+        """
+        @rtype set
+        @return All IRIs of the knowledge base.
+        """
+        if self.ontology_files is not None:
+            graph = Graph()
+            for path in self.ontology_files or DEFAULT_ONTOLOGY_FILES:
+                graph.parse(path, format='xml')
+            return {str(term) for triple in graph for term in triple if isinstance(term, URIRef)}
+
+        r = sparql._execute(IRIS_QUERY, self.endpoint, 'known_iris')
+        return set(sparql._parse_uris(r, 'iri'))
+
+    def refresh(self):
+        """
+        Reloads the IRIs and rebuilds the filter. Checks made concurrently use the old filter until the new one
+        is complete.
+        """
+        iris = self.__load_iris()
+        bloom = BloomFilter(len(iris), self.error_rate)
+        for iri in iris:
+            bloom.add(iri)
+        with self.__lock:
+            self.__bloom = bloom
+            self.__built = time.monotonic()
+
+    def __refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            pass  # Keep the old filter and retry after the next interval
+        finally:
+            with self.__lock:
+                self.__built = time.monotonic()
+                self.__refreshing = False
+
+    def might_contain(self, iri):
+        """
+        @type iri str
+        @rtype bool
+        @return False if iri is certainly unknown to the knowledge base, True if it is probably known.
+        """
+        with self.__lock:
+            bloom = self.__bloom
+            if self.refresh_interval is not None and not self.__refreshing \
+                    and time.monotonic() - self.__built > self.refresh_interval:
+                self.__refreshing = True
+                threading.Thread(target=self.__refresh_in_background, daemon=True).start()
+
+        if iri in bloom:
+            return True
+        with self.__lock:
+            self.rejected += 1
+        return False
@@ -0,0 +1,132 @@
+# Module sparql.breaker
+# Circuit breaker for SPARQL endpoints.
+#
+# After repeated failures of an endpoint, queries to it fail immediately for some time instead of
+# waiting for timeouts, so that callers can fall back to cached answers right away.
+
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class _Circuit(object):
+    """
+    State of the circuit of a single endpoint.
+    """
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0  # Consecutive failures
+        self.opened = 0.0  # Time the circuit was opened
+        self.trial = False  # Whether a trial query is in flight while half-open
+
+
+class CircuitBreaker(object):
+    """
+    Thread-safe circuit breaker keeping a circuit per endpoint.
+
+    A circuit opens after failure_threshold consecutive failures. While it is open, allow() rejects all queries.
+    After reset_timeout seconds a single trial query is allowed (half-open): its success closes the circuit,
+    its failure opens it again.
+
+    Example:
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+        if breaker.allow(endpoint):
+            try:
+                r = send(q)
+                breaker.success(endpoint)
+            except Exception:
+                breaker.failure(endpoint)
+                raise
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        @type failure_threshold int
+        @param failure_threshold Number of consecutive failures after which a circuit opens.
+        @type reset_timeout float
+        @param reset_timeout Seconds a circuit stays open before a trial query is allowed.
+        """
+        super().__init__()
+        if failure_threshold < 1:
+            raise ValueError('failure_threshold must be positive')
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.__circuits = {}
+        self.__lock = threading.Lock()
+
+    def __circuit(self, endpoint):
+        circuit = self.__circuits.get(endpoint)
+        if circuit is None:
+            circuit = self.__circuits[endpoint] = _Circuit()
+        return circuit
+
+    def allow(self, endpoint):
+        """
+        @type endpoint str
+        @param endpoint URL of the SPARQL endpoint.
+        @rtype bool
+        @return Whether a query may be sent to the endpoint now.
+        """
+        with self.__lock:
+            circuit = self.__circuit(endpoint)
+            if circuit.state == CLOSED:
+                return True
+            if circuit.state == OPEN and time.monotonic() - circuit.opened >= self.reset_timeout:
+                circuit.state = HALF_OPEN
+                circuit.trial = False
+            if circuit.state == HALF_OPEN and not circuit.trial:
+                circuit.trial = True
+                return True
+            return False
+
+    def success(self, endpoint):
+        """
+        Records a successful query, which closes the circuit of the endpoint.
+        """
+        with self.__lock:
+            circuit = self.__circuit(endpoint)
+            circuit.state = CLOSED
+            circuit.failures = 0
+            circuit.trial = False
+
+    def failure(self, endpoint):
+        """
+        Records a failed query. Opens the circuit if the threshold is reached or the trial query failed.
+        """
+        with self.__lock:
+            circuit = self.__circuit(endpoint)
+            circuit.failures += 1
+            if circuit.state == HALF_OPEN or circuit.failures >= self.failure_threshold:
+                circuit.state = OPEN
+                circuit.opened = time.monotonic()
+                circuit.trial = False
+
+    def release(self, endpoint):
+        """
+        Records a query that ended without result, e.g. because it was cancelled. Neither a success nor a failure
+        is recorded, but a half-open circuit allows the next trial query.
+        """
+        with self.__lock:
+            self.__circuit(endpoint).trial = False
+
+    def state(self, endpoint):
+        """
+        @rtype str
+        @return The state of the circuit of the endpoint: CLOSED, OPEN or HALF_OPEN.
+        """
+        with self.__lock:
+            circuit = self.__circuit(endpoint)
+            if circuit.state == OPEN and time.monotonic() - circuit.opened >= self.reset_timeout:
+                return HALF_OPEN
+            return circuit.state
+
+    def reset(self):
+        """
+        Closes all circuits.
+        """
+        with self.__lock:
+            self.__circuits = {}
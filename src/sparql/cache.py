@@ -0,0 +1,373 @@
+# Module sparql.cache
+# In-process caching of results of SPARQL queries.
+#
+# The facts queried by the sparql module (equivalence of classes, subclass relations)
+# change very rarely, so their results can safely be kept for some time.
+
+import threading
+import time
+from collections import OrderedDict
+
+
+def symmetric_key(kind, endpoint, iri1, iri2):
+    """
+    Builds a cache key for a query over two IRIs where the order of the IRIs does not matter,
+    i.e. the keys for (a, b) and (b, a) are the same.
+    @type kind str
+    @param kind The kind of query, e.g. 'classes_equivalent'.
+    @type endpoint str
+    @param endpoint URL of the SPARQL endpoint queried.
+    @rtype tuple
+    @return The cache key.
+    """
+    if iri2 < iri1:
+        iri1, iri2 = iri2, iri1
+    return kind, endpoint, iri1, iri2
+
+
+class QueryCache(object):
+    """
+    Thread-safe LRU cache with a time-to-live for results of SPARQL queries.
+
+    Example:
+        cache = QueryCache(maxsize=2, ttl=60)
+        cache.put('a', 1)
+        cache.get('a')
+        > 1
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, stale_ttl=0):
+        """
+        @type maxsize int
+        @param maxsize Maximum number of entries. If exceeded the least recently used entry is evicted.
+        @type ttl float|None
+        @param ttl Seconds an entry stays valid after it was stored. None for no expiration.
+        @type stale_ttl float
+        @param stale_ttl Seconds an expired entry is still kept for get_stale().
+        """
+        super().__init__()
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive')
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.__entries = OrderedDict()  # key -> (expiry time, value)
+        self.__lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Looks up the value stored for a key.
+        @param key The key to look up.
+        @param default Returned if there is no valid entry for the key.
+        @return The cached value or default if there is none or it has expired.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                now = time.monotonic()
+                if expires is None or expires > now:
+                    self.__entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                if expires + self.stale_ttl <= now:
+                    del self.__entries[key]
+            self.misses += 1
+            return default
+
+    def peek(self, key, default=None):
+        """
+        Looks up the value stored for a key like get(), but without counting a hit or miss and without
+        marking the entry as recently used, e.g. for probing whether an optional shortcut is available.
+        @param key The key to look up.
+        @param default Returned if there is no valid entry for the key.
+        @return The cached value or default if there is none or it has expired.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or expires > time.monotonic():
+                    return value
+            return default
+
+    def get_stale(self, key, default=None):
+        """
+        Looks up the value stored for a key, including expired values that are at most stale_ttl seconds
+        past their expiration.
+        @param key The key to look up.
+        @param default Returned if there is no such entry for the key.
+        @return The cached value or default.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or expires + self.stale_ttl > time.monotonic():
+                    self.stale_hits += 1
+                    return value
+            return default
+
+    def put(self, key, value):
+        """
+        Stores a value for a key. Evicts the least recently used entry if the cache is full.
+        @param key The key of the entry.
+        @param value The value to store.
+        """
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.__lock:
+            self.__entries[key] = (expires, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """
+        Removes the entry for a key if there is one.
+        """
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes all entries and resets the hit and miss counters.
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.stale_hits = 0
+            self.evictions = 0
+
+    def stats(self):
+        """
+        @rtype dict
+        @return The number of hits, misses, stale values served, evictions and the current number of entries.
+        """
+        with self.__lock:
+            return {'hits': self.hits, 'misses': self.misses, 'stale_hits': self.stale_hits,
+                    'evictions': self.evictions,
+                    'size': len(self.__entries), 'maxsize': self.maxsize}
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__entries)
+
+
+class _Call(object):
+    """
+    A call in progress whose result is shared with all callers waiting for it.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls with the same key: while a call is in flight, later callers with the same key
+    wait for its result instead of doing the call again.
+
+    Example:
+        flight = SingleFlight()
+        flight.do(('http://localhost:9999/sparql', q), lambda: send(q))
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.executed = 0  # Number of calls actually done
+        self.merged = 0  # Number of calls that waited for the result of an identical one
+        self.__calls = {}  # key -> _Call
+        self.__lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Calls fn unless a call with the same key is already in flight, in which case its result is awaited.
+        @param key Identifies identical calls.
+        @type fn callable
+        @param fn Called without arguments.
+        @return The result of fn.
+        @raise Exception Any exception raised by fn is raised to all callers waiting for it.
+        """
+        with self.__lock:
+            call = self.__calls.get(key)
+            if call is None:
+                call = self.__calls[key] = _Call()
+                self.executed += 1
+                leader = True
+            else:
+                self.merged += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call.done.set()
+
+    def stats(self):
+        """
+        @rtype dict
+        @return The number of calls done, calls merged into one in flight and calls currently in flight.
+        """
+        with self.__lock:
+            return {'executed': self.executed, 'merged': self.merged, 'in_flight': len(self.__calls)}
+
+    def reset(self):
+        """
+        Resets the counters.
+        """
+        with self.__lock:
+            self.executed = 0
+            self.merged = 0
+
+
+class EquivalenceSetCache(object):
+    """
+    Caches the complete set of equivalent classes of IRIs. Any pairwise equivalence check involving an IRI
+    whose set is known is then answered by a set lookup, no matter whether the classes are equivalent or not.
+
+    Equivalence by rdfs:seeAlso is not transitive, so a set is only known for the IRIs it was fetched for.
+    Identical sets are stored once and shared by all of their IRIs. The canonical representative of a set, its
+    smallest IRI, is determined once when the set is stored.
+    Hits and misses are counted separately from those of the query cache, once per get() or equivalent().
+    """
+
+    def __init__(self, maxsize=4096, ttl=300):
+        """
+        @type maxsize int
+        @param maxsize Maximum number of IRIs whose set is kept.
+        @type ttl float|None
+        @param ttl Seconds a set stays valid after it was stored. None for no expiration.
+        """
+        super().__init__()
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive')
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # (endpoint, IRI) -> (expiry time, frozenset of the IRI and its equivalents, canonical representative)
+        self.__sets = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __lookup(self, endpoint, iri):
+        """
+        Looks up the set of an IRI without counting the lookup. The lock must be held.
+        @rtype tuple|None
+        @return Tuple of the set and its canonical representative or None if not known.
+        """
+        entry = self.__sets.get((endpoint, iri))
+        if entry is None:
+            return None
+        expires, members, representative = entry
+        if expires is not None and expires <= time.monotonic():
+            del self.__sets[(endpoint, iri)]
+            return None
+        self.__sets.move_to_end((endpoint, iri))
+        return members, representative
+
+    def __count(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def get(self, endpoint, iri):
+        """
+        @rtype frozenset|None
+        @return The IRI and all IRIs equivalent to it or None if not known.
+        """
+        with self.__lock:
+            entry = self.__lookup(endpoint, iri)
+            self.__count(entry is not None)
+        return entry[0] if entry is not None else None
+
+    def put(self, endpoint, iri, equivalents):
+        """
+        Stores the equivalent classes of an IRI.
+        @type equivalents iterable
+        @param equivalents The IRIs of all classes equivalent to iri.
+        @rtype frozenset
+        @return The IRI and all IRIs equivalent to it.
+        """
+        members = frozenset(equivalents) | {iri}
+        representative = None
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.__lock:
+            for other in members:
+                existing = self.__lookup(endpoint, other) if other != iri else None
+                if existing is not None and existing[0] == members:
+                    members, representative = existing  # Share the set with the other IRIs of the class
+                    break
+            if representative is None:
+                representative = min(members)
+            self.__sets[(endpoint, iri)] = (expires, members, representative)
+            self.__sets.move_to_end((endpoint, iri))
+            while len(self.__sets) > self.maxsize:
+                self.__sets.popitem(last=False)
+                self.evictions += 1
+        return members
+
+    def equivalent(self, endpoint, iri1, iri2):
+        """
+        @rtype bool|None
+        @return Whether the classes are equivalent or None if the set of neither IRI is known.
+        """
+        with self.__lock:
+            entry = self.__lookup(endpoint, iri1)
+            if entry is None:
+                entry = self.__lookup(endpoint, iri2)
+            self.__count(entry is not None)
+        if entry is None:
+            return None
+        return iri1 in entry[0] and iri2 in entry[0]
+
+    def canonical(self, endpoint, iri):
+        """
+        Looks up the canonical representative of the set of an IRI, e.g. for using it as a key for all IRIs of
+        the class. The lookup is not counted in the statistics.
+        @rtype str|None
+        @return The smallest IRI of the set of iri or None if the set is not known.
+        """
+        with self.__lock:
+            entry = self.__lookup(endpoint, iri)
+        return entry[1] if entry is not None else None
+
+    def clear(self):
+        """
+        Removes all sets and resets the counters.
+        """
+        with self.__lock:
+            self.__sets.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """
+        @rtype dict
+        @return The number of hits, misses, evictions and the current number of IRIs whose set is known.
+        """
+        with self.__lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self.__sets), 'maxsize': self.maxsize}
@@ -0,0 +1,97 @@
+# Module sparql.closure
+# Materializes the closure of the equivalence relations in a named graph of the triple store.
+#
+# The queries of the sparql module follow rdfs:seeAlso, owl:sameAs and owl:equivalentClass with property paths,
+# which the endpoint evaluates on every request. materialize() computes the closure once and writes it back
+# as direct links into CLOSURE_GRAPH. After sparql.set_closure_graph(CLOSURE_GRAPH), equivalence queries are
+# single-hop lookups in that graph.
+#
+# Run again whenever the ontology changes:
+#     python -m src.sparql.closure --endpoint http://localhost:9999/bigdata/namespace/wotkb/sparql
+
+import argparse
+
+from rdflib import Graph, URIRef
+
+from src import sparql
+from src.sparql.local import LocalReasoner
+
+# Named graph holding the materialized closure.
+CLOSURE_GRAPH = 'http://www.matthias-fisch.de/ontologies/wot/closure'
+
+# Appended to the IRI of the closure graph for the graph the new closure is written to before it replaces the old one.
+STAGING_SUFFIX = '/staging'
+
+# Fetches all direct equivalence links between IRIs at once.
+EQUIVALENCE_EDGES_QUERY = 'PREFIX rdfs:<http://www.w3.org/2000/01/rdf-schema#>\
+         PREFIX owl: <http://www.w3.org/2002/07/owl#>\
+         SELECT DISTINCT ?s ?p ?o { \
+              VALUES ?p { rdfs:seeAlso owl:sameAs owl:equivalentClass } \
+              ?s ?p ?o . \
+              FILTER(isIRI(?s) && isIRI(?o)) \
+         }'
+
+
+def compute_closure(endpoint = sparql.DEFAULT_SPARQL_ENDPOINT):
+    """
+    Computes the equivalent classes of all classes of an endpoint with the semantics of sparql.equivalent_classes().
+    @type endpoint str
+    @param endpoint URL of the SPARQL endpoint.
+    @rtype dict
+    @return Mapping of each IRI having equivalent classes to the set of their IRIs.
+    """
+    r = sparql._execute(EQUIVALENCE_EDGES_QUERY, endpoint, 'closure')
+    if not (r and 'results' in r and 'bindings' in r['results']):
+        raise sparql.SparqlException('Malformed response')
+
+    graph = Graph()
+    for b in r['results']['bindings']:
+        if 's' in b and 'p' in b and 'o' in b:
+            graph.add((URIRef(b['s']['value']), URIRef(b['p']['value']), URIRef(b['o']['value'])))
+    return LocalReasoner(graph=graph).equivalences()
+
+
+def materialize(endpoint = sparql.DEFAULT_SPARQL_ENDPOINT, update_endpoint=None, graph=CLOSURE_GRAPH, batch_size=1000):
+    """
+    Computes the closure of the equivalence relations and replaces the contents of a named graph with it.
+    The closure is written to a staging graph first and then moved to the named graph by a single request,
+    so readers see either the previous or the new closure, never a partial one.
+    @type endpoint str
+    @param endpoint URL of the SPARQL endpoint to read the ontology from.
+    @type update_endpoint str|None
+    @param update_endpoint URL accepting SPARQL UPDATE requests. The same as endpoint if None.
+    @type graph str
+    @param graph IRI of the named graph to write the closure to.
+    @type batch_size int
+    @param batch_size Maximum number of triples inserted per request.
+    @rtype int
+    @return The number of triples written.
+    """
+    if update_endpoint is None:
+        update_endpoint = endpoint
+    closure = compute_closure(endpoint)
+
+    triples = ['<%s> <%s> <%s> .' % (iri, sparql.CLOSURE_PREDICATE, other)
+               for iri, equivalents in sorted(closure.items()) for other in sorted(equivalents)]
+
+    staging = graph + STAGING_SUFFIX
+    sparql.backend.update('DROP SILENT GRAPH <%s>' % staging, update_endpoint)
+    for i in range(0, len(triples), batch_size):
+        sparql.backend.update('INSERT DATA { GRAPH <%s> { %s } }' % (staging, ' '.join(triples[i:i + batch_size])),
+                              update_endpoint)
+
+    if triples:
+        sparql.backend.update('MOVE SILENT GRAPH <%s> TO <%s>' % (staging, graph), update_endpoint)
+    else:  # Nothing was written to the staging graph
+        sparql.backend.update('DROP SILENT GRAPH <%s>' % graph, update_endpoint)
+    return len(triples)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Materializes the equivalence closure in a named graph.')
+    parser.add_argument('--endpoint', default=sparql.DEFAULT_SPARQL_ENDPOINT)
+    parser.add_argument('--update-endpoint', default=None)
+    parser.add_argument('--graph', default=CLOSURE_GRAPH)
+    args = parser.parse_args()
+
+    print('Wrote %d triples to <%s>' % (materialize(args.endpoint, args.update_endpoint, args.graph), args.graph))
@@ -0,0 +1,146 @@
+# Module sparql.index
+# Precomputed index of the rdfs:subClassOf hierarchy.
+#
+# Each class gets an integer id and the set of its (transitive) superclasses is stored as a bitset,
+# so subsumption checks and common superclasses are answered by bit operations instead of
+# rdfs:subClassOf+ property path queries.
+
+import threading
+
+from rdflib import Graph, URIRef
+from rdflib.namespace import RDFS
+
+from src import sparql
+from src.sparql.local import DEFAULT_ONTOLOGY_FILES
+
+# Fetches all direct subclass relations between named classes at once.
+SUBCLASS_QUERY = 'PREFIX rdfs:<http://www.w3.org/2000/01/rdf-schema#>\
+         SELECT DISTINCT ?sub ?super { \
+              ?sub rdfs:subClassOf ?super . \
+              FILTER(isIRI(?sub) && isIRI(?super)) \
+         }'
+
+
+class SubclassIndex(object):
+    """
+    Index of the subclass hierarchy of a SPARQL endpoint or of local OWL files.
+    Install it with sparql.set_subclass_index() in order to answer has_type() and shared_superclasses()
+    for its endpoint from the index.
+
+    Example:
+        index = SubclassIndex()  # Loads the hierarchy from DEFAULT_SPARQL_ENDPOINT
+        sparql.set_subclass_index(index)
+        ...
+        index.refresh()  # After the ontology has changed
+    """
+
+    def __init__(self, endpoint = sparql.DEFAULT_SPARQL_ENDPOINT, ontology_files=None):
+        """
+        @type endpoint str
+        @param endpoint URL of the SPARQL endpoint whose hierarchy is indexed.
+        @type ontology_files list|None
+        @param ontology_files If given, the hierarchy is loaded from these OWL files instead of querying endpoint
+        (an empty list for the ontology of this repository). The index then answers queries for endpoint nevertheless.
+        """
+        super().__init__()
+        self.endpoint = endpoint
+        self.ontology_files = ontology_files
+        self.__ids = {}  # IRI -> id
+        self.__iris = []  # id -> IRI
+        self.__ancestors = {}  # IRI -> bitset of the ids of all superclasses
+        self.__lock = threading.Lock()
+        self.refresh()
+
+    def __load_edges(self):
+        """
+        @rtype list
+        @return Tuples (subclass IRI, superclass IRI) of all direct subclass relations.
+        """
+        if self.ontology_files is not None:
+            graph = Graph()
+            for path in self.ontology_files or DEFAULT_ONTOLOGY_FILES:
+                graph.parse(path, format='xml')
+            return [(str(s), str(o)) for s, o in graph.subject_objects(RDFS.subClassOf)
+                    if isinstance(s, URIRef) and isinstance(o, URIRef)]
+
+        r = sparql._execute(SUBCLASS_QUERY, self.endpoint, 'subclass_index')
+        if r and 'results' in r and 'bindings' in r['results']:
+            return [(b['sub']['value'], b['super']['value']) for b in r['results']['bindings']
+                    if 'sub' in b and 'super' in b]
+        else:
+            raise sparql.SparqlException('Malformed response')
+
+    def refresh(self):
+        """
+        Reloads the hierarchy and rebuilds the index. Queries answered concurrently use the old index
+        until the new one is complete.
+        """
+        edges = self.__load_edges()
+
+        ids = {}
+        iris = []
+        for edge in edges:
+            for iri in edge:
+                if iri not in ids:
+                    ids[iri] = len(iris)
+                    iris.append(iri)
+
+        parents = {}
+        for sub, sup in edges:
+            parents[sub] = parents.get(sub, 0) | (1 << ids[sup])
+
+        # Propagate superclasses until a fixpoint is reached (also terminates for cyclic hierarchies):
+        ancestors = dict(parents)
+        changed = True
+        while changed:
+            changed = False
+            for iri, bits in ancestors.items():
+                closure = bits
+                remaining = bits
+                while remaining:
+                    low = remaining & -remaining
+                    closure |= ancestors.get(iris[low.bit_length() - 1], 0)
+                    remaining ^= low
+                if closure != bits:
+                    ancestors[iri] = closure
+                    changed = True
+
+        with self.__lock:
+            self.__ids, self.__iris, self.__ancestors = ids, iris, ancestors
+
+    def __iris_of(self, bits, iris):
+        result = []
+        while bits:
+            low = bits & -bits
+            result.append(iris[low.bit_length() - 1])
+            bits ^= low
+        return result
+
+    def has_type(self, iri, type_iri):
+        """
+        @rtype bool
+        @return Returns True iff iri is a (transitive) subclass of type_iri.
+        """
+        with self.__lock:
+            type_id = self.__ids.get(type_iri)
+            return type_id is not None and (self.__ancestors.get(iri, 0) >> type_id) & 1 == 1
+
+    def superclasses(self, iri):
+        """
+        @rtype list
+        @return The IRIs of all (transitive) superclasses of iri.
+        """
+        with self.__lock:
+            return self.__iris_of(self.__ancestors.get(iri, 0), self.__iris)
+
+    def shared_superclasses(self, iri1, iri2):
+        """
+        @rtype list
+        @return The IRIs of the common superclasses of iri1 and iri2 of any distance.
+        """
+        with self.__lock:
+            return self.__iris_of(self.__ancestors.get(iri1, 0) & self.__ancestors.get(iri2, 0), self.__iris)
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__iris)
@@ -0,0 +1,140 @@
+# Module sparql.local
+# In-process reasoner answering the queries of the sparql module from local OWL files.
+#
+# This allows running controllers without any SPARQL endpoint available.
+
+import os
+from collections import defaultdict
+
+from rdflib import Graph, URIRef
+from rdflib.namespace import OWL, RDFS
+
+# The ontology shipped with this repository.
+DEFAULT_ONTOLOGY_FILES = [os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                       '..', '..', 'ontology', 'ontology.owl')]
+
+
+def _reachable(edges):
+    """
+    Computes the transitive closure of a directed graph.
+    @type edges dict
+    @param edges Mapping of each node to the set of its direct successors.
+    @rtype dict
+    @return Mapping of each node to the set of nodes reachable by one or more edges.
+    """
+    closure = {}
+    for start in edges:
+        seen = set()
+        stack = list(edges[start])
+        while stack:
+            node = stack.pop()
+            if node not in seen:
+                seen.add(node)
+                stack.extend(edges.get(node, ()))
+        closure[start] = frozenset(seen)
+    return closure
+
+
+class LocalReasoner(object):
+    """
+    Answers equivalent_classes, classes_equivalent, superclasses, shared_superclasses and has_type from OWL (RDF/XML) files
+    that are loaded once into memory.
+
+    Semantics match the queries sent to remote endpoints by the sparql module: Two classes are equivalent if one
+    can be reached from the other by following rdfs:seeAlso, owl:sameAs or owl:equivalentClass transitively.
+    Each path uses a single predicate in a single direction, so two classes referring to the same resource
+    (e.g. A owl:sameAs B and C owl:sameAs B) are not considered equivalent.
+
+    Example:
+        reasoner = LocalReasoner()
+        reasoner.has_type('http://www.matthias-fisch.de/ontologies/wot#AlarmAction',
+                          'http://www.matthias-fisch.de/ontologies/wot#Action')
+        > True
+    """
+
+    def __init__(self, *paths, graph=None):
+        """
+        @type paths str
+        @param paths Paths of the OWL files to load. The ontology of this repository if none given.
+        @type graph rdflib.Graph
+        @param graph An already loaded graph to use instead of files.
+        """
+        super().__init__()
+        if graph is None:
+            graph = Graph()
+            for path in paths or DEFAULT_ONTOLOGY_FILES:
+                graph.parse(path, format='xml')
+        self.__equivalents = {}
+        self.__superclasses = {}
+        self.__build(graph)
+
+    def __build(self, graph):
+        """
+        Computes the equivalence and subclass closures of a graph.
+        """
+        equivalents = defaultdict(set)
+
+        # Like the property paths <iri> p+ ?o and ?o p+ <iri> of the queries, per predicate p:
+        for predicate in (RDFS.seeAlso, OWL.sameAs, OWL.equivalentClass):
+            edges = defaultdict(set)
+            inverse_edges = defaultdict(set)
+            for s, o in graph.subject_objects(predicate):
+                if isinstance(s, URIRef) and isinstance(o, URIRef):
+                    edges[str(s)].add(str(o))
+                    inverse_edges[str(o)].add(str(s))
+            for closure in (_reachable(edges), _reachable(inverse_edges)):
+                for iri, reachable in closure.items():
+                    equivalents[iri].update(reachable)
+
+        # An IRI on a cycle reaches itself and is then returned as equivalent to itself, like by the queries:
+        self.__equivalents = {iri: frozenset(eq) for iri, eq in equivalents.items()}
+
+        super_edges = defaultdict(set)
+        for s, o in graph.subject_objects(RDFS.subClassOf):
+            if isinstance(s, URIRef) and isinstance(o, URIRef):
+                super_edges[str(s)].add(str(o))
+        self.__superclasses = _reachable(super_edges)
+
+    def equivalences(self):
+        """
+        @rtype dict
+        @return Mapping of each IRI having equivalent classes to the set of their IRIs.
+        """
+        return {iri: eq for iri, eq in self.__equivalents.items() if eq}
+
+    def equivalent_classes(self, iri):
+        """
+        @type iri str
+        @param iri The IRI of the class for which equivalent classes should be found.
+        @rtype list
+        @return Sorted list of the IRIs of equivalent classes.
+        """
+        return sorted(self.__equivalents.get(iri, ()))
+
+    def classes_equivalent(self, iri1, iri2):
+        """
+        @rtype bool
+        @return Returns true if the classes/resources are equivalent.
+        """
+        return iri1 == iri2 or iri2 in self.__equivalents.get(iri1, ())
+
+    def superclasses(self, iri):
+        """
+        @rtype list
+        @return Sorted list of the IRIs of all superclasses of any distance.
+        """
+        return sorted(self.__superclasses.get(iri, ()))
+
+    def shared_superclasses(self, iri1, iri2):
+        """
+        @rtype list
+        @return Sorted list of the IRIs of common superclasses of any distance.
+        """
+        return sorted(self.__superclasses.get(iri1, frozenset()) & self.__superclasses.get(iri2, frozenset()))
+
+    def has_type(self, iri, type_iri):
+        """
+        @rtype bool
+        @return Returns True iff iri is a (transitive) subclass of type_iri.
+        """
+        return type_iri in self.__superclasses.get(iri, ())
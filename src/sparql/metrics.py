@@ -0,0 +1,174 @@
+# Module sparql.metrics
+# Call counts, error counts, cache hit rates and latency histograms of the query functions.
+#
+# Example:
+#     with sparql.metrics.scope() as scope:
+#         td.has_all_events_of([...])
+#     scope.queries
+#     > 1
+
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (in seconds) of the buckets of the latency histograms. A last bucket takes all slower calls.
+LATENCY_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def _new_kind_stats():
+    return {'calls': 0, 'errors': 0, 'queries': 0, 'cache_hits': 0, 'cache_misses': 0,
+            'latency_sum': 0.0, 'latency_buckets': [0] * (len(LATENCY_BUCKETS) + 1)}
+
+
+class QueryScope(object):
+    """
+    Counts the calls and queries made while a scope of QueryMetrics is active.
+    """
+
+    def __init__(self):
+        self.calls = 0  # Calls of instrumented query functions
+        self.queries = 0  # Queries sent to SPARQL endpoints
+        self.queries_by_kind = {}
+
+
+class QueryMetrics(object):
+    """
+    Thread-safe statistics of the query functions, recorded per kind of query
+    (e.g. 'classes_equivalent', 'has_type').
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.__kinds = {}
+        self.__scopes = []
+        self.__lock = threading.Lock()
+
+    def __stats(self, kind):
+        stats = self.__kinds.get(kind)
+        if stats is None:
+            stats = self.__kinds[kind] = _new_kind_stats()
+        return stats
+
+    def record_call(self, kind, latency, error=False):
+        """
+        Records a call of a query function.
+        @type kind str
+        @param kind The kind of query.
+        @type latency float
+        @param latency The duration of the call in seconds.
+        @type error bool
+        @param error Whether the call raised an exception.
+        """
+        bucket = len(LATENCY_BUCKETS)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                bucket = i
+                break
+
+        with self.__lock:
+            stats = self.__stats(kind)
+            stats['calls'] += 1
+            stats['latency_sum'] += latency
+            stats['latency_buckets'][bucket] += 1
+            if error:
+                stats['errors'] += 1
+            for scope in self.__scopes:
+                scope.calls += 1
+
+    def record_query(self, kind):
+        """
+        Records a query sent to a SPARQL endpoint.
+        """
+        with self.__lock:
+            self.__stats(kind)['queries'] += 1
+            for scope in self.__scopes:
+                scope.queries += 1
+                scope.queries_by_kind[kind] = scope.queries_by_kind.get(kind, 0) + 1
+
+    def record_cache(self, kind, hit):
+        """
+        Records a lookup in the query cache.
+        @type hit bool
+        @param hit Whether the result was found in the cache.
+        """
+        with self.__lock:
+            self.__stats(kind)['cache_hits' if hit else 'cache_misses'] += 1
+
+    def snapshot(self):
+        """
+        @rtype dict
+        @return Mapping of each kind of query to its statistics: calls, errors, queries (sent to endpoints),
+        cache_hits, cache_misses, cache_hit_rate (None if there was no lookup), latency_sum (seconds) and
+        latency_histogram (mapping of bucket upper bounds to the number of calls).
+        """
+        with self.__lock:
+            snapshot = {}
+            for kind, stats in self.__kinds.items():
+                lookups = stats['cache_hits'] + stats['cache_misses']
+                histogram = dict(zip(LATENCY_BUCKETS + (float('inf'), ), stats['latency_buckets']))
+                snapshot[kind] = {'calls': stats['calls'], 'errors': stats['errors'], 'queries': stats['queries'],
+                                  'cache_hits': stats['cache_hits'], 'cache_misses': stats['cache_misses'],
+                                  'cache_hit_rate': stats['cache_hits'] / lookups if lookups else None,
+                                  'latency_sum': stats['latency_sum'], 'latency_histogram': histogram}
+            return snapshot
+
+    def reset(self):
+        """
+        Discards all statistics recorded so far.
+        """
+        with self.__lock:
+            self.__kinds = {}
+
+    @contextmanager
+    def scope(self):
+        """
+        Context manager counting the calls and queries made while it is active (by any thread).
+        @rtype QueryScope
+        """
+        scope = QueryScope()
+        with self.__lock:
+            self.__scopes.append(scope)
+        try:
+            yield scope
+        finally:
+            with self.__lock:
+                self.__scopes.remove(scope)
+
+
+def instrumented(metrics, kind):
+    """
+    Decorator recording calls, errors and latency of a (blocking or async) query function.
+    @type metrics QueryMetrics
+    @param metrics Where to record.
+    @type kind str
+    @param kind The kind of query the function answers.
+    """
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                error = False
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception:
+                    error = True
+                    raise
+                finally:
+                    metrics.record_call(kind, time.perf_counter() - start, error)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                error = False
+                try:
+                    return fn(*args, **kwargs)
+                except Exception:
+                    error = True
+                    raise
+                finally:
+                    metrics.record_call(kind, time.perf_counter() - start, error)
+        return wrapper
+    return decorate
@@ -0,0 +1,117 @@
+# Module sparql.persistent
+# Persistent cache of SPARQL responses stored in a single SQLite file.
+#
+# Keeps responses across restarts, so that previously seen IRIs need no SPARQL traffic
+# when a controller starts again.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def normalize_query(q):
+    """
+    Normalizes a SPARQL query so that queries only differing in whitespace share the same cache entry.
+    @type q str
+    @param q The SPARQL query.
+    @rtype str
+    @return The normalized query.
+    """
+    return ' '.join(q.split())
+
+
+class PersistentQueryCache(object):
+    """
+    Cache of SPARQL responses in a SQLite database, keyed by endpoint and normalized query.
+
+    Entries are only valid for the ontology version they were stored with. Opening the cache with another
+    ontology version drops all entries of other versions.
+
+    Example:
+        cache = PersistentQueryCache('sparql_cache.sqlite', ttl=86400, ontology_version='2017-01-25')
+        sparql.set_persistent_cache(cache)
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, ontology_version=''):
+        """
+        @type path str
+        @param path Path of the SQLite file. Created if it does not exist.
+        @type ttl float|None
+        @param ttl Seconds an entry stays valid after it was stored. None for no expiration.
+        @type ontology_version str
+        @param ontology_version Version of the ontology the cached responses are valid for.
+        """
+        super().__init__()
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.ontology_version = str(ontology_version)
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.__lock, self.__conn:
+            self.__conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                                'endpoint TEXT NOT NULL, query TEXT NOT NULL, version TEXT NOT NULL, '
+                                'stored REAL NOT NULL, response TEXT NOT NULL, PRIMARY KEY (endpoint, query))')
+            self.__conn.execute('DELETE FROM responses WHERE version != ?', (self.ontology_version, ))
+
+    def get(self, endpoint, q):
+        """
+        Looks up the response stored for a query.
+        @type endpoint str
+        @param endpoint URL of the SPARQL endpoint.
+        @type q str
+        @param q The SPARQL query.
+        @rtype dict|None
+        @return The deserialized response or None if there is no valid entry.
+        """
+        min_stored = time.time() - self.ttl if self.ttl is not None else float('-inf')
+        with self.__lock:
+            row = self.__conn.execute('SELECT response FROM responses WHERE endpoint = ? AND query = ? '
+                                      'AND version = ? AND stored > ?',
+                                      (endpoint, normalize_query(q), self.ontology_version, min_stored)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, endpoint, q, response):
+        """
+        Stores the response for a query.
+        @type endpoint str
+        @param endpoint URL of the SPARQL endpoint.
+        @type q str
+        @param q The SPARQL query.
+        @type response dict
+        @param response The deserialized JSON response of the endpoint.
+        """
+        with self.__lock, self.__conn:
+            self.__conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                                (endpoint, normalize_query(q), self.ontology_version, time.time(),
+                                 json.dumps(response)))
+
+    def invalidate(self):
+        """
+        Removes all entries.
+        """
+        with self.__lock, self.__conn:
+            self.__conn.execute('DELETE FROM responses')
+
+    def stats(self):
+        """
+        @rtype dict
+        @return The number of hits, misses and stored entries.
+        """
+        with self.__lock:
+            size = self.__conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            return {'hits': self.hits, 'misses': self.misses, 'size': size}
+
+    def close(self):
+        """
+        Closes the underlying database.
+        """
+        with self.__lock:
+            self.__conn.close()
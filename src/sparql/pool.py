@@ -0,0 +1,426 @@
+# Module sparql.pool
+# Thread-safe pool of keep-alive HTTP connections.
+#
+# Connections are kept open per host (scheme and netloc) and reused by subsequent requests,
+# which saves a TCP handshake per request. Connections idle for too long can be closed by a reaper thread.
+# AsyncConnectionPool does the same for asyncio.
+
+import asyncio
+import http.client
+import threading
+import time
+import weakref
+from collections import namedtuple
+from contextlib import contextmanager
+from email.parser import BytesParser
+from urllib.parse import urlparse
+
+# Response of a pooled request. The body is already read completely, so the connection can be reused.
+PooledResponse = namedtuple('PooledResponse', ['status', 'reason', 'headers', 'data'])
+
+
+class _HostPool(object):
+    """
+    Idle connections to a single host and a limit on the number of connections in use.
+    """
+
+    def __init__(self, maxsize):
+        self.idle = []  # (connection, time it became idle) in the order they became idle
+        self.slots = threading.BoundedSemaphore(maxsize)
+
+
+def _reap_periodically(pool_ref, interval):
+    """
+    Body of the reaper thread of a ConnectionPool. Ends when the pool was closed or garbage collected.
+    """
+    while True:
+        time.sleep(interval)
+        pool = pool_ref()
+        if pool is None or pool.closed:
+            return
+        pool.reap()
+        del pool
+
+
+class ConnectionPool(object):
+    """
+    Pool of keep-alive HTTP(S) connections that can be shared by multiple threads.
+
+    Example:
+        pool = ConnectionPool(maxsize=4, timeout=5)
+        response = pool.request('GET', 'http://localhost:9999/bigdata/status')
+        response.status
+        > 200
+    """
+
+    def __init__(self, maxsize=4, timeout=10.0, acquire_timeout=None, idle_timeout=None):
+        """
+        @type maxsize int
+        @param maxsize Maximum number of connections per host. Further requests wait for a free connection.
+        @type timeout float|None
+        @param timeout Socket timeout in seconds for connecting and reading responses. None for no timeout.
+        @type acquire_timeout float|None
+        @param acquire_timeout Seconds to wait for a free connection. None to wait without limit.
+        @type idle_timeout float|None
+        @param idle_timeout Seconds after which an idle connection is closed by a reaper thread instead of being
+        reused. None to keep idle connections open until the server closes them.
+        """
+        super().__init__()
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive')
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.idle_timeout = idle_timeout
+        self.created = 0  # Number of connections opened
+        self.reused = 0  # Number of requests sent over an already open connection
+        self.reaped = 0  # Number of idle connections closed after idle_timeout
+        self.closed = False
+        self.__hosts = {}
+        self.__lock = threading.Lock()
+        if idle_timeout is not None:
+            threading.Thread(target=_reap_periodically, args=(weakref.ref(self), max(idle_timeout / 2, 0.01)),
+                             name='connection-reaper', daemon=True).start()
+
+    def __host(self, key):
+        with self.__lock:
+            host = self.__hosts.get(key)
+            if host is None:
+                host = self.__hosts[key] = _HostPool(self.maxsize)
+            return host
+
+    def __connect(self, scheme, netloc):
+        with self.__lock:
+            self.created += 1
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        else:
+            return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def __checkout(self, host, scheme, netloc):
+        """
+        @rtype tuple
+        @return An idle connection to the host or a new one and whether it was reused.
+        """
+        with self.__lock:
+            while host.idle:
+                conn, since = host.idle.pop()
+                if self.idle_timeout is not None and time.monotonic() - since > self.idle_timeout:
+                    conn.close()  # The reaper did not get to it yet
+                    self.reaped += 1
+                    continue
+                self.reused += 1
+                return conn, True
+        return self.__connect(scheme, netloc), False
+
+    def __set_timeout(self, conn, timeout):
+        """
+        Sets the socket timeout of a connection to timeout or to the timeout of the pool if None.
+        """
+        conn.timeout = timeout if timeout is not None else self.timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(conn.timeout)
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        Sends a request over a pooled connection and reads the complete response.
+        A request over a reused connection that was closed by the server in the meantime is retried once
+        over a new connection.
+        @type method str
+        @param method The HTTP method, e.g. 'GET'.
+        @type url str
+        @param url The full URL of the resource.
+        @param body The request body or None.
+        @type headers dict|None
+        @param headers Additional request headers.
+        @type timeout float|None
+        @param timeout Socket timeout in seconds for this request (also bounding the wait for a free connection).
+        The timeout of the pool if None.
+        @rtype PooledResponse
+        @return The response including its complete body.
+        @raise TimeoutError If no connection became free in time or the server did not respond in time.
+        """
+        with self.stream(method, url, body, headers, timeout) as response:
+            data = response.read()
+        return PooledResponse(response.status, response.reason, response.headers, data)
+
+    @contextmanager
+    def stream(self, method, url, body=None, headers=None, timeout=None):
+        """
+        Sends a request over a pooled connection like request(), but leaves reading the body to the caller.
+        The connection returns to the pool if the body was read completely, otherwise it is closed.
+
+        Example:
+            with pool.stream('GET', url) as response:
+                for chunk in iter(lambda: response.read1(8192), b''):
+                    ...
+        @rtype http.client.HTTPResponse
+        @return Context manager for the response whose body is not read yet.
+        @raise TimeoutError If no connection became free in time or the server did not respond in time.
+        """
+        parsed = urlparse(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        key = (parsed.scheme, parsed.netloc)
+        host = self.__host(key)
+
+        acquire_timeout = self.acquire_timeout
+        if timeout is not None and (acquire_timeout is None or timeout < acquire_timeout):
+            acquire_timeout = timeout
+        if not host.slots.acquire(timeout=acquire_timeout):
+            raise TimeoutError('No free connection to %s within %s seconds' % (parsed.netloc, acquire_timeout))
+        try:
+            conn, reused = self.__checkout(host, parsed.scheme, parsed.netloc)
+            try:
+                try:
+                    self.__set_timeout(conn, timeout)
+                    conn.request(method, path, body=body, headers=headers or {})
+                    response = conn.getresponse()
+                except (http.client.HTTPException, ConnectionError):
+                    if not reused:
+                        raise
+                    # The server closed the idle connection. Retry with a fresh one:
+                    conn.close()
+                    conn = self.__connect(parsed.scheme, parsed.netloc)
+                    self.__set_timeout(conn, timeout)
+                    conn.request(method, path, body=body, headers=headers or {})
+                    response = conn.getresponse()
+
+                yield response
+            except BaseException:
+                conn.close()
+                raise
+
+            if response.will_close or not response.isclosed():
+                conn.close()
+            else:
+                with self.__lock:
+                    host.idle.append((conn, time.monotonic()))
+        finally:
+            host.slots.release()
+
+    def stats(self):
+        """
+        @rtype dict
+        @return The number of connections created, requests over reused connections, idle connections closed
+        by the reaper and idle connections.
+        """
+        with self.__lock:
+            return {'created': self.created, 'reused': self.reused, 'reaped': self.reaped,
+                    'idle': sum(len(host.idle) for host in self.__hosts.values())}
+
+    def reap(self):
+        """
+        Closes the connections idle for longer than idle_timeout. Called periodically by the reaper thread.
+        """
+        if self.idle_timeout is None:
+            return
+        deadline = time.monotonic() - self.idle_timeout
+        with self.__lock:
+            for host in self.__hosts.values():
+                expired = [conn for conn, since in host.idle if since < deadline]
+                if expired:
+                    host.idle[:] = [(conn, since) for conn, since in host.idle if since >= deadline]
+                    for conn in expired:
+                        conn.close()
+                    self.reaped += len(expired)
+
+    def close(self):
+        """
+        Closes all idle connections and stops the reaper thread.
+        """
+        with self.__lock:
+            self.closed = True
+            for host in self.__hosts.values():
+                for conn, since in host.idle:
+                    conn.close()
+                host.idle.clear()
+
+
+class _AsyncHostPool(object):
+    """
+    Idle asyncio connections to a single host and a semaphore limiting the number of concurrent requests.
+    """
+
+    def __init__(self, maxsize):
+        self.idle = []
+        self.slots = asyncio.Semaphore(maxsize)
+
+
+class AsyncConnectionPool(object):
+    """
+    asyncio counterpart of ConnectionPool. Keeps HTTP/1.1 keep-alive connections per host and limits the number
+    of concurrent requests per host by a semaphore, so that many requests can be awaited at once without
+    overloading a server.
+
+    A pool is bound to the event loop it is used in first. If it is used from another event loop later,
+    the connections of the previous loop are discarded.
+
+    Example:
+        pool = AsyncConnectionPool(maxsize=8)
+        response = await pool.request('GET', 'http://localhost:9999/bigdata/status')
+    """
+
+    def __init__(self, maxsize=8, timeout=10.0):
+        """
+        @type maxsize int
+        @param maxsize Maximum number of concurrent requests (and connections) per host.
+        @type timeout float|None
+        @param timeout Timeout in seconds for connecting and for receiving a response. None for no timeout.
+        """
+        super().__init__()
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive')
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.created = 0  # Number of connections opened
+        self.reused = 0  # Number of requests sent over an already open connection
+        self.__hosts = {}
+        self.__loop = None
+
+    def __host(self, key):
+        loop = asyncio.get_running_loop()
+        if loop is not self.__loop:
+            self.__discard_all()
+            self.__loop = loop
+
+        host = self.__hosts.get(key)
+        if host is None:
+            host = self.__hosts[key] = _AsyncHostPool(self.maxsize)
+        return host
+
+    def __discard_all(self):
+        for host in self.__hosts.values():
+            for reader, writer in host.idle:
+                try:
+                    writer.close()
+                except RuntimeError:  # Event loop of the connection is already closed
+                    pass
+        self.__hosts = {}
+
+    async def __connect(self, scheme, netloc, timeout):
+        parsed = urlparse('%s://%s' % (scheme, netloc))
+        port = parsed.port or (443 if scheme == 'https' else 80)
+        self.created += 1
+        return await asyncio.wait_for(asyncio.open_connection(parsed.hostname, port, ssl=(scheme == 'https') or None),
+                                      timeout)
+
+    async def request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        Sends a request over a pooled connection and reads the complete response.
+        A request over a reused connection that was closed by the server in the meantime is retried once
+        over a new connection.
+        @type method str
+        @param method The HTTP method, e.g. 'GET'.
+        @type url str
+        @param url The full URL of the resource.
+        @type body str|bytes|None
+        @param body The request body or None.
+        @type headers dict|None
+        @param headers Additional request headers.
+        @type timeout float|None
+        @param timeout Timeout in seconds for this request. The timeout of the pool if None.
+        @rtype PooledResponse
+        @return The response including its complete body.
+        @raise TimeoutError If connecting or receiving the response takes longer than timeout.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        parsed = urlparse(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        host = self.__host((parsed.scheme, parsed.netloc))
+
+        async with host.slots:
+            if host.idle:
+                conn, reused = host.idle.pop(), True
+                self.reused += 1
+            else:
+                conn, reused = await self.__connect(parsed.scheme, parsed.netloc, timeout), False
+
+            try:
+                try:
+                    response, will_close = await asyncio.wait_for(
+                        self.__exchange(conn, method, path, parsed.netloc, body, headers), timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    if not reused:
+                        raise
+                    # The server closed the idle connection. Retry with a fresh one:
+                    conn[1].close()
+                    conn = await self.__connect(parsed.scheme, parsed.netloc, timeout)
+                    response, will_close = await asyncio.wait_for(
+                        self.__exchange(conn, method, path, parsed.netloc, body, headers), timeout)
+            except BaseException:
+                conn[1].close()
+                raise
+
+            if will_close:
+                conn[1].close()
+            else:
+                host.idle.append(conn)
+            return response
+
+    @staticmethod
+    async def __exchange(conn, method, path, netloc, body, headers):
+        """
+        Writes a request to a connection and reads the response.
+        @rtype tuple
+        @return The response and whether the server will close the connection.
+        """
+        reader, writer = conn
+        request_headers = {'Host': netloc, 'Connection': 'keep-alive'}
+        request_headers.update(headers or {})
+        if body is not None or method in ('POST', 'PUT'):
+            request_headers['Content-Length'] = str(len(body or b''))
+        head = '%s %s HTTP/1.1\r\n' % (method, path)
+        head += ''.join('%s: %s\r\n' % header for header in request_headers.items()) + '\r\n'
+        writer.write(head.encode('latin-1') + (body or b''))
+        await writer.drain()
+
+        raw_head = await reader.readuntil(b'\r\n\r\n')
+        status_line, _, raw_headers = raw_head.partition(b'\r\n')
+        version, status, reason = (status_line.decode('latin-1').split(' ', 2) + [''])[:3]
+        status = int(status)
+        message = BytesParser(_class=http.client.HTTPMessage).parsebytes(raw_headers)
+
+        connection = message.get('Connection', '').lower()
+        will_close = connection == 'close' or (version == 'HTTP/1.0' and connection != 'keep-alive')
+
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            data = b''
+        elif 'chunked' in message.get('Transfer-Encoding', '').lower():
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if size == 0:
+                    while await reader.readuntil(b'\r\n') != b'\r\n':  # Skip trailers
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b''.join(chunks)
+        elif message.get('Content-Length') is not None:
+            data = await reader.readexactly(int(message['Content-Length']))
+        else:
+            data = await reader.read()
+            will_close = True
+
+        return PooledResponse(status, reason, message, data), will_close
+
+    def stats(self):
+        """
+        @rtype dict
+        @return The number of connections created, requests over reused connections and idle connections.
+        """
+        return {'created': self.created, 'reused': self.reused,
+                'idle': sum(len(host.idle) for host in self.__hosts.values())}
+
+    def close(self):
+        """
+        Closes all idle connections.
+        """
+        self.__discard_all()
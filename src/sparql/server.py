@@ -0,0 +1,139 @@
+# Module sparql.server
+# Minimal SPARQL endpoint standing in for Blazegraph, answering queries over HTTP from local OWL files.
+#
+# Serves the SPARQL 1.1 protocol (GET ?query=..., POST form-encoded, application/sparql-query or
+# application/sparql-update) with JSON results on any path, so that benchmarks and tests can exercise the complete HTTP query path on loopback.
+#
+# Example:
+#     python -m src.sparql.server --port 9999
+#     (then DEFAULT_SPARQL_ENDPOINT is answered from ontology/ontology.owl)
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from src.sparql.backend import GraphBackend
+
+
+class _SparqlRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        self.__answer(params.get('query', [None])[0])
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip()
+        if content_type == 'application/sparql-query':
+            self.__answer(body)
+        elif content_type == 'application/sparql-update':
+            self.__update(body)
+        else:
+            params = parse_qs(body)
+            if 'update' in params:
+                self.__update(params['update'][0])
+            else:
+                self.__answer(params.get('query', [None])[0])
+
+    def __update(self, u):
+        try:
+            self.server.backend.update(u, self.path)
+        except ValueError as e:
+            self.__send(400, str(e).encode('utf-8'), 'text/plain')
+            return
+        self.__send(200, b'', 'text/plain')
+
+    def __answer(self, q):
+        if q is None:
+            self.__send(400, b'Missing query parameter', 'text/plain')
+            return
+        try:
+            r = self.server.backend.query(q, self.path)
+        except ValueError as e:
+            self.__send(400, str(e).encode('utf-8'), 'text/plain')
+            return
+        self.__send(200, json.dumps(r).encode('utf-8'), 'application/sparql-results+json')
+
+    def __send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        if self.server.verbose:
+            super().log_message(*args)
+
+
+class SparqlServer(ThreadingHTTPServer):
+    """
+    HTTP SPARQL endpoint evaluating queries with a GraphBackend.
+
+    Example:
+        server = SparqlServer(port=0)
+        server.start()
+        sparql.classes_equivalent(a, b, endpoint=server.endpoint)
+        server.stop()
+    """
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=9999, backend=None, verbose=False):
+        """
+        @type host str
+        @param host The address to listen on.
+        @type port int
+        @param port The port to listen on. 0 for any free port.
+        @type backend SparqlBackend|None
+        @param backend Backend answering the queries. A GraphBackend of the ontology of this repository if None.
+        @type verbose bool
+        @param verbose Whether to log every request.
+        """
+        self.backend = backend if backend is not None else GraphBackend()
+        self.verbose = verbose
+        super().__init__((host, port), _SparqlRequestHandler)
+        self.__thread = None
+
+    @property
+    def endpoint(self):
+        """
+        @rtype str
+        @return URL of the endpoint, using the path of DEFAULT_SPARQL_ENDPOINT.
+        """
+        host, port = self.server_address[:2]
+        return 'http://%s:%d/bigdata/namespace/wotkb/sparql' % (host, port)
+
+    def start(self):
+        """
+        Serves requests in a background thread.
+        """
+        self.__thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stops serving and closes the socket.
+        """
+        if self.__thread is not None:
+            self.shutdown()
+            self.__thread = None
+        self.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local SPARQL endpoint serving OWL files.')
+    parser.add_argument('files', nargs='*', help='OWL (RDF/XML) files to serve. Defaults to ontology/ontology.owl.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9999)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = SparqlServer(args.host, args.port, GraphBackend(*args.files), args.verbose)
+    print('Serving SPARQL endpoint at %s' % server.endpoint)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
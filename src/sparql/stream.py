@@ -0,0 +1,75 @@
+# Module sparql.stream
+# Incremental parsing of SPARQL JSON results.
+#
+# Yields the bindings of a result while the response is still being received, so that callers looking
+# for a single match can stop reading a large result early.
+
+import codecs
+import json
+import re
+
+# Start of the array of bindings: "bindings" used as key (and not e.g. as name of a variable).
+_BINDINGS_START = re.compile(r'"bindings"\s*:\s*\[')
+
+_decoder = json.JSONDecoder()
+
+
+def iter_bindings(chunks):
+    """
+    Parses the bindings of a SPARQL JSON result incrementally.
+    @type chunks iterable
+    @param chunks The response body in pieces (bytes or str) as they are received.
+    @rtype generator
+    @return Generator of the bindings (dicts mapping variables to RDF terms) in the order of the result.
+    @raise ValueError If the body is not a SPARQL JSON result with bindings.
+    """
+    chunks = iter(chunks)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = None  # Position in buffer behind the last parsed binding, None before the bindings started
+    done = False
+
+    def more():
+        chunk = next(chunks, None)
+        if chunk is None:
+            return None
+        return decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+
+    # Skip everything up to the start of the array of bindings:
+    while pos is None:
+        chunk = more()
+        if chunk is None:
+            raise ValueError('Result contains no bindings')
+        buffer += chunk
+        match = _BINDINGS_START.search(buffer)
+        if match is not None:
+            buffer = buffer[match.end():]
+            pos = 0
+
+    while not done:
+        # Skip separators:
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer):
+                break
+            chunk = more()
+            if chunk is None:
+                raise ValueError('Result ended within bindings')
+            buffer, pos = chunk, 0
+
+        if buffer[pos] == ']':
+            done = True
+            continue
+
+        try:
+            binding, end = _decoder.raw_decode(buffer, pos)
+        except ValueError:
+            chunk = more()
+            if chunk is None:
+                raise ValueError('Result ended within a binding')
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        pos = end
+        yield binding
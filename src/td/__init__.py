@@ -7,15 +7,36 @@
 
 import json
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
-from http.client import HTTPConnection
+from types import MappingProxyType
 from urllib.parse import urlparse
 
 import time
-import http.client as httplib
 
 from src import sparql
 from src.sparql import SPARQLNamespaceRepository
+from src.sparql.pool import ConnectionPool
+
+# Seconds to wait for the value of a property. Other requests, e.g. invoking an action that takes a while
+# to complete, have no timeout.
+PROPERTY_READ_TIMEOUT = 2.0
+
+# Keep-alive connections to the things, shared by all threads. Event subscriptions poll over these connections,
+# so the pool allows some connections per thing. See set_connection_pool().
+connection_pool = ConnectionPool(maxsize=8, timeout=None, idle_timeout=30.0)
+
+
+def set_connection_pool(pool):
+    """
+    Replaces the pool of connections used for interacting with things, e.g. in order to change
+    the number of connections per thing or the timeouts.
+    @type pool ConnectionPool
+    @param pool The new connection pool.
+    """
+    global connection_pool
+    old_pool, connection_pool = connection_pool, pool
+    old_pool.close()
 
 def get_thing_description_from_url(url):
     """
@@ -25,15 +46,11 @@ def get_thing_description_from_url(url):
         @rtype ThingDescription
         @return The TD.
         """
-    url_parsed = urlparse(url)
-
-    conn = httplib.HTTPConnection(url_parsed.netloc)
-    conn.request('GET', url_parsed.path)
-    response = conn.getresponse()
-    if response.code == 200:
-        return ThingDescription(json.loads(response.read().decode('utf-8')))
+    response = connection_pool.request('GET', url)
+    if response.status == 200:
+        return ThingDescription(json.loads(response.data.decode('utf-8')))
     else:
-        raise Exception("Received %d %s requesting %s" % (response.code, response.status, url))
+        raise Exception("Received %d %s requesting %s" % (response.status, response.reason, url))
 
 class ThingDescription(object):
     """
@@ -54,6 +71,77 @@ class ThingDescription(object):
         self.__td = td
         self.__ns_repo = self.namespace_repository()
 
+        self.__type_indexes = {}  # Kind of interactions -> _TypeIndex, built on first lookup
+        self.__interactions = {}  # Kind of interactions -> list of tuples (JSON, object), created on first use
+
+    def _schema(self, interaction, key):
+        """
+        Resolves a schema of an interaction of this TD, e.g. its valueType. The interaction objects memoize
+        the result, see TDProperty.value_type().
+        @type interaction dict
+        @param interaction The interaction as deserialized JSON, e.g. a property of this TD.
+        @type key str
+        @param key The key of the schema in the interaction, e.g. 'valueType' or 'inputData'.
+        @rtype MappingProxyType|None
+        @return The schema with all IRIs resolved as read-only structure (lists become tuples) or None if the
+        interaction has no such schema.
+        """
+        if key in interaction.keys():
+            return _freeze(_ns_resolve_input_type(interaction[key], self.namespace_repository()))
+        else:
+            return None
+
+    def __interactions_of(self, kind):
+        """
+        Returns the interactions of a kind as objects, e.g. as TDProperty for properties. They are created on first
+        use and then returned by all lookups, so that each resolves its schemas only once.
+        @type kind str
+        @param kind 'properties', 'actions' or 'events'
+        @rtype list
+        @return List of tuples (interaction as deserialized JSON, interaction object) in the order of the TD.
+        """
+        interactions = self.__interactions.get(kind)
+        if interactions is None:
+            factory = {'properties': self._property, 'actions': self._action, 'events': self._event}[kind]
+            interactions = self.__interactions.setdefault(
+                kind, [(interaction, factory(interaction)) for interaction in self.__td.get(kind, [])])
+        return interactions
+
+    def __type_index(self, kind):
+        """
+        Returns the index of the interactions of a kind by their types. It is built on the first lookup,
+        so that a TD using an unknown prefix can be constructed nevertheless.
+        @type kind str
+        @param kind 'properties', 'actions' or 'events'
+        @rtype _TypeIndex
+        @raise UnknownPrefixException If the type of any interaction of the kind uses an unknown prefix.
+        """
+        index = self.__type_indexes.get(kind)
+        if index is None:
+            index = self.__type_indexes[kind] = _TypeIndex(self.__interactions_of(kind), self.__ns_repo)
+        return index
+
+    def _property(self, prop):
+        """
+        @rtype TDProperty
+        @return A property of this TD given as deserialized JSON.
+        """
+        return TDProperty(self, prop)
+
+    def _action(self, action):
+        """
+        @rtype TDAction
+        @return An action of this TD given as deserialized JSON.
+        """
+        return TDAction(self, action)
+
+    def _event(self, event):
+        """
+        @rtype TDEvent
+        @return An event of this TD given as deserialized JSON.
+        """
+        return TDEvent(self, event)
+
     def namespace_repository(self):
         """
         Returns the namespace repository of the TD.
@@ -62,11 +150,7 @@ class ThingDescription(object):
         if self.__ns_repo is not None:
             return self.__ns_repo
         else:
-            self.__ns_repo = SPARQLNamespaceRepository()
-            for context in self.__td['@context']:
-                if isinstance(context, dict):
-                    for shorthand, prefix in context.items():
-                        self.__ns_repo.register(shorthand, prefix)
+            self.__ns_repo = SPARQLNamespaceRepository.for_context(self.__td['@context'])
             return self.__ns_repo
 
     def type_equivalent_to(self, types, sparql_endpoint = sparql.DEFAULT_SPARQL_ENDPOINT):
@@ -78,10 +162,9 @@ class ThingDescription(object):
         if none of them is or @type is not set in this TD.
         """
         if '@type' in self.__td.keys():
-            for type in types:
-                if sparql.classes_equivalent(self.__ns_repo.resolve(self.__td['@type']), self.__ns_repo.resolve(type), sparql_endpoint):
-                    return True
-            return False
+            td_type = self.__ns_repo.resolve(self.__td['@type'])
+            pairs = [(td_type, self.__ns_repo.resolve(type)) for type in types]
+            return any(sparql.classes_equivalent_many(pairs, sparql_endpoint).values())
         else:
             return False
 
@@ -101,17 +184,7 @@ class ThingDescription(object):
         @param sparql_endpoint The URL of the NanoSPARQLServer REST-endpoint.
         @return Any property equivalent to any given type or None if none found.
         """
-        ns_repo = self.namespace_repository()
-
-        for prop in self.__td['properties']:
-            if '@type' in prop.keys():
-                if ns_repo.resolve(prop['@type']) in types:
-                    return TDProperty(self, prop)
-                else:
-                    for type in types:
-                        if sparql.classes_equivalent(type, ns_repo.resolve(prop['@type']), sparql_endpoint):
-                            return TDProperty(self, prop)
-        return None
+        return self.__type_index('properties').first_matching(types, sparql_endpoint)
 
     def get_action_by_types(self, types, sparql_endpoint = sparql.DEFAULT_SPARQL_ENDPOINT):
         """
@@ -120,17 +193,7 @@ class ThingDescription(object):
         @param sparql_endpoint The URL of the NanoSPARQLServer REST-endpoint.
         @return Any action equivalent to any given type or None if none found.
         """
-        ns_repo = self.namespace_repository()
-
-        for action in self.__td['actions']:
-            if '@type' in action.keys():
-                if ns_repo.resolve(action['@type']) in types:
-                    return TDAction(self, action)
-                else:
-                    for type in types:
-                        if sparql.classes_equivalent(type, ns_repo.resolve(action['@type']), sparql_endpoint):
-                            return TDAction(self, action)
-        return None
+        return self.__type_index('actions').first_matching(types, sparql_endpoint)
 
     def print_actions(self):
         """
@@ -150,17 +213,7 @@ class ThingDescription(object):
         @param sparql_endpoint The URL of the NanoSPARQLServer REST-endpoint.
         @return Any event equivalent to any given type or None if none found.
         """
-        ns_repo = self.namespace_repository()
-
-        for event in self.__td['events']:
-            if '@type' in event.keys():
-                if ns_repo.resolve(event['@type']) in types:
-                    return TDEvent(self, event)
-                else:
-                    for type in types:
-                        if sparql.classes_equivalent(type, ns_repo.resolve(event['@type']), sparql_endpoint):
-                            return TDEvent(self, event)
-        return None
+        return self.__type_index('events').first_matching(types, sparql_endpoint)
 
     def has_all_properties_of(self, types, sparql_endpoint = sparql.DEFAULT_SPARQL_ENDPOINT):
         """
@@ -171,16 +224,7 @@ class ThingDescription(object):
         @return Returns True iff there is an equivalent property for every given type.
         """
         ns_repo = self.namespace_repository()
-
-        for type in types:
-            found_matching_prop = False
-            for prop in self.__td['properties']:
-                if '@type' in prop.keys():
-                    if sparql.classes_equivalent(ns_repo.resolve(type), ns_repo.resolve(prop['@type']), sparql_endpoint):
-                        found_matching_prop = True
-            if not found_matching_prop:
-                return False
-        return True
+        return self.__type_index('properties').covers_all([ns_repo.resolve(type) for type in types], sparql_endpoint)
 
     def has_any_property_of(self, types):
         """
@@ -200,16 +244,7 @@ class ThingDescription(object):
         @return Returns True iff there is an equivalent action for every given type.
         """
         ns_repo = self.namespace_repository()
-
-        for type in types:
-            found_matching_action = False
-            for action in self.__td['actions']:
-                if '@type' in action.keys():
-                    if sparql.classes_equivalent(ns_repo.resolve(type), ns_repo.resolve(action['@type']), sparql_endpoint):
-                        found_matching_action = True
-            if not found_matching_action:
-                return False
-        return True
+        return self.__type_index('actions').covers_all([ns_repo.resolve(type) for type in types], sparql_endpoint)
 
     def has_any_action_of(self, types):
         """
@@ -229,16 +264,7 @@ class ThingDescription(object):
         @return Returns True iff there is an equivalent event for every given type.
         """
         ns_repo = self.namespace_repository()
-
-        for type in types:
-            found_matching_event = False
-            for event in self.__td['events']:
-                if '@type' in event.keys():
-                    if sparql.classes_equivalent(ns_repo.resolve(type), ns_repo.resolve(event['@type']), sparql_endpoint):
-                        found_matching_event = True
-            if not found_matching_event:
-                return False
-        return True
+        return self.__type_index('events').covers_all([ns_repo.resolve(type) for type in types], sparql_endpoint)
 
     def has_any_event_of(self, types):
         """
@@ -255,52 +281,296 @@ class ThingDescription(object):
         """
         return self.__td['uris']
 
+    def read_properties(self, selector=None, parallelism=8):
+        """
+        Reads the values of several properties of this thing concurrently, see read_many().
+        @type selector list|function|None
+        @param selector Names of the properties to read, a function taking a TDProperty and returning whether
+        to read it or None for all properties.
+        @type parallelism int
+        @param parallelism Maximum number of requests in flight at once.
+        @rtype dict
+        @return Mapping of the name of each property to its value or to the exception raised reading it.
+        """
+        return {name: value for (td, name), value in read_many(self._select_properties(selector), parallelism).items()}
 
-def _validate_input_string(vt, value):
-    if isinstance(value, str):
-        # Any constraints?
-        if 'enum' in vt.keys():
-            if value in vt['enum']:
-                return True
-            else:
-                raise ValueError("Value %s not allowed (not in enum)" % value)
-        elif 'oneOf' in vt.keys():
-            if value in [o['constant'] for o in vt['oneOf']]:
-                return True
-            else:
-                raise ValueError("Value %s not allowed (options constraint)" % value)
-    else:
-        raise ValueError("Value type definition imposes string but %s given!" % str(type(value)))
+    def _select_properties(self, selector):
+        """
+        @return List of tuples (this TD, name) of the named properties chosen by a selector of read_properties().
+        """
+        if selector is not None and not callable(selector):
+            return [(self, name) for name in selector]
 
+        names = []
+        for prop, td_property in self.__interactions_of('properties'):
+            if 'name' in prop.keys() and (selector is None or selector(td_property)):
+                names.append((self, prop['name']))
+        return names
 
-def _validate_input_number(vt, value):
-    if isinstance(value, float) or isinstance(value, int):
-        if 'minimum' in vt.keys() and value < vt['minimum']:
-            raise ValueError("Value %f violates minimum constraint of %f" % (float(value), float(vt['minimum'])))
 
-        if 'maximum' in vt.keys() and value > vt['maximum']:
-            raise ValueError("Value %f violates maximum constraint of %f" % (float(value), float(vt['maximum'])))
-    else:
-        raise ValueError("Value type definition imposes number but %s given!" % str(type(value)))
+def _property_of(td, prop):
+    """
+    @type prop TDProperty|str
+    @param prop A property of td or its name.
+    @rtype TDProperty
+    @raise KeyError If td has no property with that name.
+    """
+    if isinstance(prop, TDProperty):
+        return prop
+    found = td.get_property_by_name(prop)
+    if found is None:
+        raise KeyError('Thing has no property named %s' % prop)
+    return td._property(found)
 
 
-def _validate_input_object(vt, o):
-    if isinstance(o, dict):
-        for prop_name, prop_vt in vt['properties'].items():
-            if prop_name in o.keys():
-                if prop_vt['type'] == 'string':
-                    _validate_input_string(prop_vt, o[prop_name])
+def _read(td, prop):
+    return _property_of(td, prop).value()
+
+
+def read_many(entries, parallelism=8):
+    """
+    Reads the values of properties of one or many things concurrently, e.g. the permission of an authenticator
+    and the state of a door. Requests to the same thing share the keep-alive connections of connection_pool,
+    whose size bounds the number of requests in flight per thing.
+    @type entries iterable
+    @param entries Tuples (td, prop) of a ThingDescription and one of its properties as TDProperty or by name.
+    @type parallelism int
+    @param parallelism Maximum number of requests in flight at once.
+    @rtype dict
+    @return Mapping of each entry to the value of the property or to the exception raised reading it.
+    """
+    if parallelism < 1:
+        raise ValueError('parallelism must be positive')
+
+    entries = list(dict.fromkeys(entries))
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(parallelism, max(len(entries), 1))) as executor:
+        futures = [(entry, executor.submit(_read, *entry)) for entry in entries]
+        for entry, future in futures:
+            e = future.exception()
+            results[entry] = e if e is not None else future.result()
+    return results
+
+
+class _TypeIndex(object):
+    """
+    The interactions of one kind (properties, actions or events) of a TD indexed by the full IRIs of their @type.
+    """
 
-                elif prop_vt['type'] == 'number' or prop_vt['type'] == 'integer' or prop_vt['type'] == 'float':
-                    _validate_input_number(prop_vt, o[prop_name])
+    def __init__(self, interactions, ns_repo):
+        """
+        @type interactions list
+        @param interactions Tuples (interaction as deserialized JSON, interaction object) in the order of the TD.
+        @type ns_repo SPARQLNamespaceRepository
+        @param ns_repo The namespace repository of the TD.
+        """
+        super().__init__()
+        self.typed = [(interaction_object, ns_repo.resolve(interaction['@type']))
+                      for interaction, interaction_object in interactions if '@type' in interaction.keys()]
+        self.positions = {}  # Full IRI -> position of the first interaction of that type in typed
+        for position, (interaction, interaction_type) in enumerate(self.typed):
+            self.positions.setdefault(interaction_type, position)
+
+    def first_matching(self, types, sparql_endpoint = sparql.DEFAULT_SPARQL_ENDPOINT):
+        """
+        Finds the first interaction whose type is equivalent to any of the given types, like _first_matching().
+        Exact matches and matches by equivalence sets known to sparql.expansion_cache are looked up in the index.
+        Only the types whose equivalence set is unknown are checked by a query, and only against the interactions
+        preceding the first match found in the index.
+        @type types list
+        @param types List of full IRIs.
+        @param sparql_endpoint The URL of the NanoSPARQLServer REST-endpoint.
+        @return The first matching interaction object or None if there is none.
+        """
+        best = len(self.typed)
+        unknown = []
+        sets = sparql.expansion_cache
+        for type in types:
+            members = sets.get(sparql_endpoint, type) if sets is not None else None
+            if members is None:
+                members = (type, )
+                unknown.append(type)
+            for member in members:
+                position = self.positions.get(member)
+                if position is not None and position < best:
+                    best = position
+
+        if unknown and best > 0:
+            interaction = _first_matching(self.typed[:best], unknown, sparql_endpoint)
+            if interaction is not None:
+                return interaction
+        return self.typed[best][0] if best < len(self.typed) else None
+
+    def covers_all(self, types, sparql_endpoint = sparql.DEFAULT_SPARQL_ENDPOINT):
+        """
+        Checks whether there is an equivalent interaction for every given type.
+        Exact matches and types whose equivalence set is known to sparql.expansion_cache are decided locally.
+        The equivalence of the remaining types to the types offered is checked by a single batched query.
+        @type types list
+        @param types List of full IRIs required.
+        @param sparql_endpoint The URL of the NanoSPARQLServer REST-endpoint.
+        @rtype bool
+        @return Returns True iff every type is equivalent to the type of at least one interaction.
+        """
+        sets = sparql.expansion_cache
+        unknown = []
+        for type in dict.fromkeys(types):
+            if type in self.positions:
+                continue
+            members = sets.get(sparql_endpoint, type) if sets is not None else None
+            if members is None:
+                unknown.append(type)
+            elif members.isdisjoint(self.positions):
+                return False
 
-                elif prop_vt['type'] == 'object':
-                    _validate_input_object(prop_vt, o[prop_name])
+        if not unknown:
+            return True
+        if not self.positions:
+            return False
+        return _all_matching(unknown, list(self.positions), sparql_endpoint)
 
-            elif prop_name in vt['required']:
+
+def _first_matching(typed_interactions, types, sparql_endpoint = sparql.DEFAULT_SPARQL_ENDPOINT):
+    """
+    Finds the first interaction whose type is equivalent to any of the given types.
+    All equivalence checks necessary are done by a single batched query.
+    @type typed_interactions list
+    @param typed_interactions List of tuples (interaction, full IRI of its @type) in order of precedence.
+    @type types list
+    @param types List of full IRIs.
+    @param sparql_endpoint The URL of the NanoSPARQLServer REST-endpoint.
+    @return The first matching interaction or None if there is none.
+    """
+    pairs = []
+    for interaction, interaction_type in typed_interactions:
+        if interaction_type in types:
+            break  # Interactions after an exact match need not be checked
+        pairs.extend((type, interaction_type) for type in types)
+
+    equivalent = sparql.classes_equivalent_many(pairs, sparql_endpoint) if pairs else {}
+    for interaction, interaction_type in typed_interactions:
+        if interaction_type in types or any(equivalent[(type, interaction_type)] for type in types):
+            return interaction
+    return None
+
+def _all_matching(types, offered_types, sparql_endpoint = sparql.DEFAULT_SPARQL_ENDPOINT):
+    """
+    Checks whether there is an equivalent offered type for every given type.
+    All equivalence checks necessary are done by a single batched query.
+    @type types list
+    @param types List of full IRIs required.
+    @type offered_types list
+    @param offered_types List of full IRIs of the types offered, e.g. of the properties of a TD.
+    @param sparql_endpoint The URL of the NanoSPARQLServer REST-endpoint.
+    @rtype bool
+    @return Returns True iff every type is equivalent to at least one offered type.
+    """
+    pairs = [(type, offered) for type in types for offered in offered_types]
+    equivalent = sparql.classes_equivalent_many(pairs, sparql_endpoint) if pairs else {}
+    return all(any(equivalent[(type, offered)] for offered in offered_types) for type in types)
+
+# Types of the valueType definitions validated like numbers:
+_NUMBER_TYPES = frozenset(['number', 'integer', 'float'])
+
+
+def _constants(values):
+    """
+    @return The allowed values of an enum or oneOf constraint as frozenset or as tuple if any is not hashable.
+    """
+    try:
+        return frozenset(values)
+    except TypeError:
+        return tuple(values)
+
+
+def _compile_string_validator(vt):
+    if 'enum' in vt.keys():
+        allowed = _constants(vt['enum'])
+        message = "Value %s not allowed (not in enum)"
+    elif 'oneOf' in vt.keys():
+        allowed = _constants(o['constant'] for o in vt['oneOf'])
+        message = "Value %s not allowed (options constraint)"
+    else:
+        allowed = None
+
+    def validate(value):
+        if not isinstance(value, str):
+            raise ValueError("Value type definition imposes string but %s given!" % str(type(value)))
+        if allowed is not None and value not in allowed:
+            raise ValueError(message % value)
+    return validate
+
+
+def _compile_number_validator(vt):
+    minimum = vt.get('minimum')
+    maximum = vt.get('maximum')
+
+    def validate(value):
+        if not isinstance(value, (float, int)):
+            raise ValueError("Value type definition imposes number but %s given!" % str(type(value)))
+        if minimum is not None and value < minimum:
+            raise ValueError("Value %f violates minimum constraint of %f" % (float(value), float(minimum)))
+        if maximum is not None and value > maximum:
+            raise ValueError("Value %f violates maximum constraint of %f" % (float(value), float(maximum)))
+    return validate
+
+
+def _compile_object_validator(vt):
+    required = frozenset(vt.get('required', ()))
+    properties = []  # (name, validator or None if the property is not validated)
+    for prop_name, prop_vt in vt['properties'].items():
+        properties.append((prop_name, _compile_validator(prop_vt, 'type')))
+
+    def validate(o):
+        if not isinstance(o, dict):
+            raise ValueError("Value type definition imposes object but %s given!" % str(type(o)))
+        for prop_name, prop_validate in properties:
+            if prop_name in o:
+                if prop_validate is not None:
+                    prop_validate(o[prop_name])
+            elif prop_name in required:
                 raise ValueError("Object missing required property %s" % prop_name)
+    return validate
+
+
+def _compile_validator(vt, type_key):
+    """
+    Compiles a value type definition into a function validating values against it.
+    The definition is interpreted once, so validating a value only checks the constraints.
+    @type vt dict|MappingProxyType
+    @param vt The resolved value type definition.
+    @type type_key str
+    @param type_key The key of the type in vt, i.e. 'type' for valueType and 'valueType' for inputData.
+    @rtype function|None
+    @return Function taking a value and raising ValueError if it does not satisfy the definition
+    or None if the definition imposes a type which is not validated.
+    """
+    value_type = vt.get(type_key)
+    if value_type == 'string':
+        return _compile_string_validator(vt)
+    elif value_type in _NUMBER_TYPES:
+        return _compile_number_validator(vt)
+    elif value_type == 'object':
+        return _compile_object_validator(vt)
     else:
-        raise ValueError("Value type definition imposes object but %s given!" % str(type(o)))
+        return None
+
+
+def _validate_many(validate, values):
+    """
+    Validates values with a compiled validator.
+    @rtype list
+    @return For each value None if it is valid or the ValueError describing why it is not.
+    """
+    errors = []
+    for value in values:
+        try:
+            validate(value)
+        except ValueError as e:
+            errors.append(e)
+        else:
+            errors.append(None)
+    return errors
 
 def _is_url(s):
     """
@@ -325,6 +595,29 @@ def _ns_resolve_input_type(input_type, ns_repo):
     else:
         return deepcopy(input_type)
 
+def _memoized(memo, key, compute):
+    """
+    @type memo dict
+    @param memo The results computed so far.
+    @return The result stored in memo for key or that of compute(), which is stored for later calls.
+    """
+    try:
+        return memo[key]
+    except KeyError:
+        return memo.setdefault(key, compute())
+
+
+def _freeze(o):
+    """
+    @return A read-only copy of deserialized JSON: dicts become MappingProxyTypes and lists tuples.
+    """
+    if isinstance(o, dict):
+        return MappingProxyType({key: _freeze(value) for key, value in o.items()})
+    elif isinstance(o, list):
+        return tuple(_freeze(value) for value in o)
+    else:
+        return o
+
 def _parse_raw_response(v, vt):
     """
     Converts an response of a thing (e.g. property value) to the datatype corresponding the valueType definition given.
@@ -372,6 +665,7 @@ class TDProperty(object):
         super().__init__()
         self.__td = td
         self.__prop = prop
+        self.__memo = {}  # Resolved schema and compiled validator, filled on first use
 
     def get_td(self):
         """
@@ -402,14 +696,11 @@ class TDProperty(object):
 
     def value_type(self):
         """
-        @rtype dict
-        @return The value type definition of this property as deserialized JSON schema or None
+        @rtype MappingProxyType
+        @return The value type definition of this property as read-only deserialized JSON schema or None
         if there is no valueType annotation in the TD.
         """
-        if 'valueType' in self.__prop.keys():
-            return _ns_resolve_input_type(self.__prop['valueType'], self.__td.namespace_repository())
-        else:
-            return None
+        return _memoized(self.__memo, 'valueType', lambda: self.__td._schema(self.__prop, 'valueType'))
 
     def writeable(self):
         """
@@ -459,20 +750,25 @@ class TDProperty(object):
         @rtype str
         @returns Plain string representation of the value.
         """
-        url = urlparse(self.url())
-        conn = HTTPConnection(url.netloc, timeout=2)
-        conn.request('GET', url.path)
-        response = conn.getresponse()
-        if response.code == 200:
-            return response.read().decode('utf-8')
+        response = connection_pool.request('GET', self.url(), timeout=PROPERTY_READ_TIMEOUT)
+        if response.status == 200:
+            return response.data.decode('utf-8')
         else:
-            raise Exception("Received %d %s requesting %s" % (response.code, response.status, self.url()))
+            raise Exception("Received %d %s requesting %s" % (response.status, response.reason, self.url()))
 
     def value(self):
         """
         @return The value of the property in the type specified in the TD. (e.g. 'number' -> int, 'object' -> dict)
         """
-        v = json.loads(self.__value_plain())
+        return self._parse_value(self.__value_plain())
+
+    def _parse_value(self, plain):
+        """
+        @type plain str
+        @param plain The response of the thing to a request of the value.
+        @return The value of the property in the type specified in the TD.
+        """
+        v = json.loads(plain)
         vt = self.value_type()
 
         return _parse_raw_response(v['value'], vt)
@@ -482,11 +778,8 @@ class TDProperty(object):
         @type value str
         @param value The plain string representation of the value to set.
         """
-        url = urlparse(self.url())
-        conn = HTTPConnection(url.netloc)
-        conn.request('POST', url.path, body=value, headers={'Content-Type': 'application/json'})
-        response = conn.getresponse()
-        if response.code == 200:
+        response = connection_pool.request('POST', self.url(), body=value, headers={'Content-Type': 'application/json'})
+        if response.status == 200:
             return True
         else:
             return False
@@ -498,23 +791,43 @@ class TDProperty(object):
         @param value The value to set (of required type and format).
         @raise ValueError If value does not satisfy the constraints given by the TD.
         """
-        # Use JSON serialization:
-        data = json.dumps({'value': value})
+        self.__set_plain(self._serialize_value(value))
 
+    def __validator(self):
+        """
+        @return The validator compiled from the valueType of this property on first use or None if it has none.
+        """
         vt = self.value_type()
-        if vt['type'] == 'string':
-            _validate_input_string(vt, value)
-            self.__set_plain(data)
+        return _memoized(self.__memo, 'validator', lambda: _compile_validator(vt, 'type') if vt is not None else None)
 
-        elif vt['type'] == 'number' or vt['type'] == 'integer' or vt['type'] == 'float':
-            _validate_input_number(vt, value)
-            self.__set_plain(data)
+    def _serialize_value(self, value):
+        """
+        Validates a value whether it satisfies the constraints given by the TD and serializes it for setting it.
+        @rtype str
+        @return The plain string representation of the value to send to the thing.
+        @raise ValueError If value does not satisfy the constraints given by the TD.
+        """
+        validate = self.__validator()
+        if validate is None:
+            raise Exception("Property has unknown type %s" % self.value_type()['type'])
+        validate(value)
 
-        elif vt['type'] == 'object':
-            _validate_input_object(vt, value)
-            self.__set_plain(data)
-        else:
-            raise Exception("Property has unknown type %s" % vt['type'])
+        # Use JSON serialization:
+        return json.dumps({'value': value})
+
+    def validate_many(self, values):
+        """
+        Validates values whether they satisfy the constraints given by the TD without setting any.
+        @type values iterable
+        @param values The values to validate.
+        @rtype list
+        @return For each value None if it is valid or the ValueError describing why it is not.
+        @raise Exception If the property has an unknown type.
+        """
+        validate = self.__validator()
+        if validate is None:
+            raise Exception("Property has unknown type %s" % self.value_type()['type'])
+        return _validate_many(validate, values)
 
 class TDAction:
     """
@@ -528,6 +841,7 @@ class TDAction:
     def __init__(self, td, action):
         self.__td = td
         self.__action = action
+        self.__memo = {}  # Resolved schemas and compiled validator, filled on first use
 
     def get_td(self):
         """
@@ -549,16 +863,10 @@ class TDAction:
             return None
 
     def input_value_type(self):
-        if 'inputData' in self.__action.keys():
-            return _ns_resolve_input_type(self.__action['inputData'], self.__td.namespace_repository())
-        else:
-            return None
+        return _memoized(self.__memo, 'inputData', lambda: self.__td._schema(self.__action, 'inputData'))
 
     def output_value_type(self):
-        if 'outputData' in self.__action.keys():
-            return _ns_resolve_input_type(self.__action['outputData'], self.__td.namespace_repository())
-        else:
-            return None
+        return _memoized(self.__memo, 'outputData', lambda: self.__td._schema(self.__action, 'outputData'))
 
     def hrefs(self):
         """
@@ -593,46 +901,78 @@ class TDAction:
                         return base_url + hrefs[i]
         return None
 
+    def __validator(self):
+        ivt = self.input_value_type()
+        return _memoized(self.__memo, 'validator',
+                         lambda: _compile_validator(ivt, 'valueType') if ivt is not None else None)
+
+    def validate_many(self, values):
+        """
+        Validates inputs whether they satisfy the constraints given by the TD without invoking the action.
+        @type values iterable
+        @param values The inputs to validate.
+        @rtype list
+        @return For each input None if it is valid or the ValueError describing why it is not.
+        @raise Exception If the action has an input of unknown type.
+        """
+        validate = self.__validator()
+        if validate is None:
+            ivt = self.input_value_type()
+            if ivt is not None and 'valueType' not in ivt.keys():
+                return [None for value in values]  # The action takes no input
+            raise Exception("Action has unknown input data type %s" % (ivt['valueType'] if ivt else None))
+        return _validate_many(validate, values)
+
     def __invoke_plain(self, plain_data):
-        url = urlparse(self.url())
-        conn = HTTPConnection(url.netloc)
-        conn.request('POST', url.path, body=plain_data, headers={'Content-Type': 'application/json'})
-        response = conn.getresponse()
-        if response.code != 200:
-            raise Exception("Received error code %d %s when invoking action %s" % (response.code, response.status, self.url()))
+        response = connection_pool.request('POST', self.url(), body=plain_data,
+                                           headers={'Content-Type': 'application/json'})
+        if response.status != 200:
+            raise Exception("Received error code %d %s when invoking action %s" % (response.status, response.reason, self.url()))
         else:
-            return response.read().decode('utf-8')
+            return response.data.decode('utf-8')
 
     def invoke(self, input):
+        out_plain = self.__invoke_plain(self._serialize_input(input))
+        return self._parse_output(out_plain)
+
+    def _serialize_input(self, input):
+        """
+        Validates an input whether it satisfies the constraints given by the TD and serializes it for invoking
+        the action.
+        @rtype str
+        @return The plain string representation of the input to send to the thing.
+        @raise ValueError If input does not satisfy the constraints given by the TD.
+        """
         # Pack input in value field like recommended in W3C IG paper:
         input_data = json.dumps({'value': input})
 
         ivt = self.input_value_type()
-        ovt = self.output_value_type()
         if ivt and 'valueType' not in ivt.keys():
-            out_plain = self.__invoke_plain('')
-            if ovt:
-                return _parse_raw_response(out_plain, ovt)
+            return ''
         elif ivt and ivt['valueType'] == 'string':
-            _validate_input_string(ivt, input)
-            out_plain = self.__invoke_plain(input_data)
-            if ovt:
-                return _parse_raw_response(out_plain, ovt)
+            self.__validator()(input)
+            return input_data
 
         elif ivt and ivt['valueType'] == 'number' or ivt['valueType'] == 'integer' or ivt['valueType'] == 'float':
-            _validate_input_number(ivt, input)
-            out_plain = self.__invoke_plain(str(input_data))
-            if ovt:
-                return _parse_raw_response(out_plain, ovt)
+            self.__validator()(input)
+            return str(input_data)
 
         elif ivt and ivt['valueType'] == 'object':
-            _validate_input_object(ivt, input)
-            out_plain = self.__invoke_plain(json.dumps(input_data))
-            if ovt:
-                return _parse_raw_response(out_plain, ovt)
+            self.__validator()(input)
+            return json.dumps(input_data)
         else:
             raise Exception("Action has unknown input data type %s" % ivt['type'])
 
+    def _parse_output(self, out_plain):
+        """
+        @type out_plain str
+        @param out_plain The response of the thing to the invocation.
+        @return The output in the type specified in the TD or None if the TD specifies no output.
+        """
+        ovt = self.output_value_type()
+        if ovt:
+            return _parse_raw_response(out_plain, ovt)
+
 class TDEvent(object):
     """
     An event of a TD.
@@ -652,6 +992,7 @@ class TDEvent(object):
         super().__init__()
         self.__td = td
         self.__event = event
+        self.__memo = {}  # Resolved schema, filled on first use
 
     def get_td(self):
         """
@@ -682,14 +1023,11 @@ class TDEvent(object):
 
     def value_type(self):
         """
-        @rtype dict
-        @return The value type definition of this event as deserialized JSON schema or None
+        @rtype MappingProxyType
+        @return The value type definition of this event as read-only deserialized JSON schema or None
         if there is no valueType annotation in the TD.
         """
-        if 'valueType' in self.__event.keys():
-            return _ns_resolve_input_type(self.__event['valueType'], self.__td.namespace_repository())
-        else:
-            return None
+        return _memoized(self.__memo, 'valueType', lambda: self.__td._schema(self.__event, 'valueType'))
 
 
     def hrefs(self):
@@ -725,29 +1063,34 @@ class TDEvent(object):
         return None
 
     def subscribe(self, conf_data = None, poll_interval=200):
-        # Serialize data according to valueType of the TD:
-        if isinstance(conf_data, dict):
-            serialized_conf = json.dumps(conf_data)
-        elif isinstance(conf_data, str):
-            serialized_conf = conf_data
-        else:
-            serialized_conf = None
+        url = self._subscription_url()
+        # Do a POST request:
+        response = connection_pool.request('POST', url, body=_serialize_conf(conf_data),
+                                           headers={'Content-Type': 'application/json'})
+        return EventSubscription(self._subscription_uri(response), self.value_type(), poll_interval)
 
+    def _subscription_url(self):
+        """
+        @rtype str
+        @return The HTTP-URL to subscribe to this event at.
+        """
         # Get the HTTP-URL of this event:
         url = self.url(proto='http')
         if not url:
             raise Exception("HTTP is not supported for this event!")
+        return url
 
-        # Do a POST request:
-        url_parse = urlparse(url)
-        conn = HTTPConnection(url_parse.netloc)
-        conn.request('POST', url_parse.path, body=serialized_conf, headers={'Content-Type': 'application/json'})
-        response = conn.getresponse()
-
+    def _subscription_uri(self, response):
+        """
+        @type response PooledResponse
+        @param response The response of the thing to the subscription request.
+        @rtype str
+        @return The full URI of the resource created for the subscription.
+        """
         # Thing should create a new resource and redirect to it:
-        if response.code != 308:
+        if response.status != 308:
             raise Exception(
-                "Received HTTP code %d %s, but expected 308 Permanent Redirect when invoking action %s" % (response.code, response.reason, self.url()))
+                "Received HTTP code %d %s, but expected 308 Permanent Redirect when invoking action %s" % (response.status, response.reason, self.url()))
         else:
             # Build the full URI of the created resource:
             subscription_uri = None
@@ -761,10 +1104,22 @@ class TDEvent(object):
                         subscription_uri = base_url + response.headers['Location']
 
             if subscription_uri:
-                return EventSubscription(subscription_uri, self.value_type(), poll_interval)
+                return subscription_uri
             else:
                 raise Exception("Thing does not support HTTP.")
 
+def _serialize_conf(conf_data):
+    """
+    @return The configuration data of an event subscription as request body or None if there is none.
+    """
+    # Serialize data according to valueType of the TD:
+    if isinstance(conf_data, dict):
+        return json.dumps(conf_data)
+    elif isinstance(conf_data, str):
+        return conf_data
+    else:
+        return None
+
 class EventSubscription(object):
     def __init__(self, uri, value_type, poll_interval):
         self.__uri = uri
@@ -777,20 +1132,29 @@ class EventSubscription(object):
         """
         Start observation of the event resource.
         """
+        if error_callback is not None:
+            self.__error_callback = error_callback
+
         # Start polling routine as new daemon thread:
         poll_thread = threading.Thread(target=self.__poll, args=(callback, ))
         poll_thread.daemon = True
         poll_thread.start()
 
     def __poll(self, callback):
-        url_parsed = urlparse(self.__uri)
         print("Polling events each %f ms..." % self.__poll_interval)
         while self.__valid:
-            conn = HTTPConnection(url_parsed.netloc)
-            conn.request('GET', url_parsed.path)
-            response = conn.getresponse()
-            if response.code == 200:
-                raw = response.read().decode('utf-8')
+            # Reuses a keep-alive connection to the thing instead of connecting for every poll:
+            try:
+                response = connection_pool.request('GET', self.__uri)
+            except Exception as e:
+                # Keep polling, the thing may be reachable again later:
+                if self.__error_callback:
+                    self.__error_callback("Request for subscribed resource %s failed: %s" % (self.__uri, e))
+                time.sleep(self.__poll_interval/1000.0)
+                continue
+
+            if response.status == 200:
+                raw = response.data.decode('utf-8')
 
                 # Accoring to W3C IG Common Practices, the value is sent as the value of an objects "value" field:
                 response_object = json.loads(raw)
@@ -801,9 +1165,9 @@ class EventSubscription(object):
                 else:
                     print("Received invalid response. Should be object with 'value' field, %s received" % raw)
 
-            elif response.code != 208 and self.__error_callback:
+            elif response.status != 208 and self.__error_callback:
                 self.__error_callback("Received %d %s on request for subscribed resource %s" % (
-                response.code, response.status, self.__uri))
+                response.status, response.reason, self.__uri))
 
             time.sleep(self.__poll_interval/1000.0)
 
@@ -0,0 +1,271 @@
+# Module td.aio
+# asyncio counterparts of the classes of the td module.
+#
+# A single event loop can drive many things at once: Interactions are awaited instead of blocking a thread and
+# event subscriptions are polled by the loop instead of one thread each. Parsing, matching and validation
+# are shared with the blocking classes.
+#
+# Example:
+#     td = await get_thing_description_from_url('http://127.0.0.1:5000/')
+#     prop = await td.get_property_by_types(['http://www.matthias-fisch.de/ontologies/wot#Temperature'])
+#     print(await prop.value())
+#     async for value in (await td.get_event_by_types([...])).subscribe():
+#         ...
+
+import asyncio
+import contextvars
+import json
+from functools import partial
+
+from src import sparql
+from src.sparql.pool import AsyncConnectionPool
+from src.td import PROPERTY_READ_TIMEOUT, ThingDescription, TDAction, TDEvent, TDProperty, _property_of, \
+    _serialize_conf
+
+# Keep-alive connections to the things. The number of concurrent requests per thing is bounded by the size
+# of the pool. Like in the td module, only reading properties has a timeout. See set_connection_pool().
+connection_pool = AsyncConnectionPool(maxsize=8, timeout=None)
+
+
+def set_connection_pool(pool):
+    """
+    Replaces the pool of connections used for interacting with things, e.g. in order to change the number
+    of concurrent requests per thing or the timeout.
+    @type pool AsyncConnectionPool
+    @param pool The new connection pool.
+    """
+    global connection_pool
+    old_pool, connection_pool = connection_pool, pool
+    old_pool.close()
+
+
+async def get_thing_description_from_url(url):
+    """
+    Fetches and deserializes the thing description that can be found at a certain URL.
+    @type url str
+    @param url The URL where the TD is located.
+    @rtype AsyncThingDescription
+    @return The TD.
+    """
+    response = await connection_pool.request('GET', url)
+    if response.status == 200:
+        return AsyncThingDescription(json.loads(response.data.decode('utf-8')))
+    else:
+        raise Exception("Received %d %s requesting %s" % (response.status, response.reason, url))
+
+
+async def _in_executor(function, *args):
+    """
+    Runs a blocking function in the default executor, e.g. a matching that may query the SPARQL endpoint.
+    The function runs in a copy of the current context, so that e.g. a timeout set by sparql.timeout() applies.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(None, context.run, partial(function, *args))
+
+
+async def read_many(entries, parallelism=8):
+    """
+    Reads the values of properties of one or many things concurrently like td.read_many(), but on the event loop.
+    @type entries iterable
+    @param entries Tuples (td, prop) of an AsyncThingDescription and one of its properties as AsyncTDProperty
+    or by name.
+    @type parallelism int
+    @param parallelism Maximum number of requests in flight at once.
+    @rtype dict
+    @return Mapping of each entry to the value of the property or to the exception raised reading it.
+    """
+    if parallelism < 1:
+        raise ValueError('parallelism must be positive')
+    slots = asyncio.Semaphore(parallelism)
+
+    async def read(td, prop):
+        async with slots:
+            return await _property_of(td, prop).value()
+
+    entries = list(dict.fromkeys(entries))
+    values = await asyncio.gather(*[read(*entry) for entry in entries], return_exceptions=True)
+    return dict(zip(entries, values))
+
+
+class AsyncThingDescription(ThingDescription):
+    """
+    ThingDescription whose interactions are asyncio coroutines. Checks involving the SPARQL endpoint are
+    coroutines as well, which run the batched queries of ThingDescription in the default executor.
+    """
+
+    async def type_equivalent_to(self, types, sparql_endpoint = sparql.DEFAULT_SPARQL_ENDPOINT):
+        return await _in_executor(super().type_equivalent_to, types, sparql_endpoint)
+
+    async def get_property_by_types(self, types, sparql_endpoint = sparql.DEFAULT_SPARQL_ENDPOINT):
+        return await _in_executor(super().get_property_by_types, types, sparql_endpoint)
+
+    async def get_action_by_types(self, types, sparql_endpoint = sparql.DEFAULT_SPARQL_ENDPOINT):
+        return await _in_executor(super().get_action_by_types, types, sparql_endpoint)
+
+    async def get_event_by_types(self, types, sparql_endpoint = sparql.DEFAULT_SPARQL_ENDPOINT):
+        return await _in_executor(super().get_event_by_types, types, sparql_endpoint)
+
+    async def has_all_properties_of(self, types, sparql_endpoint = sparql.DEFAULT_SPARQL_ENDPOINT):
+        return await _in_executor(super().has_all_properties_of, types, sparql_endpoint)
+
+    async def has_all_actions_of(self, types, sparql_endpoint = sparql.DEFAULT_SPARQL_ENDPOINT):
+        return await _in_executor(super().has_all_actions_of, types, sparql_endpoint)
+
+    async def has_all_events_of(self, types, sparql_endpoint = sparql.DEFAULT_SPARQL_ENDPOINT):
+        return await _in_executor(super().has_all_events_of, types, sparql_endpoint)
+
+    async def has_any_property_of(self, types):
+        return await self.get_property_by_types(types) is not None
+
+    async def has_any_action_of(self, types):
+        return await self.get_action_by_types(types) is not None
+
+    async def has_any_event_of(self, types):
+        return await self.get_event_by_types(types) is not None
+
+    async def read_properties(self, selector=None, parallelism=8):
+        values = await read_many(self._select_properties(selector), parallelism)
+        return {name: value for (td, name), value in values.items()}
+
+    def _property(self, prop):
+        return AsyncTDProperty(self, prop)
+
+    def _action(self, action):
+        return AsyncTDAction(self, action)
+
+    def _event(self, event):
+        return AsyncTDEvent(self, event)
+
+
+class AsyncTDProperty(TDProperty):
+    """
+    A property of an AsyncThingDescription.
+    """
+
+    async def value(self):
+        """
+        @return The value of the property in the type specified in the TD. (e.g. 'number' -> int, 'object' -> dict)
+        """
+        response = await connection_pool.request('GET', self.url(), timeout=PROPERTY_READ_TIMEOUT)
+        if response.status != 200:
+            raise Exception("Received %d %s requesting %s" % (response.status, response.reason, self.url()))
+        return self._parse_value(response.data.decode('utf-8'))
+
+    async def set(self, value):
+        """
+        Validates an value whether it satisfies the constraints given by the TD and sets it.
+        @type value str|float|int|dict
+        @param value The value to set (of required type and format).
+        @raise ValueError If value does not satisfy the constraints given by the TD.
+        """
+        await connection_pool.request('POST', self.url(), body=self._serialize_value(value),
+                                      headers={'Content-Type': 'application/json'})
+
+
+class AsyncTDAction(TDAction):
+    """
+    An action of an AsyncThingDescription.
+    """
+
+    async def invoke(self, input):
+        """
+        Validates an input whether it satisfies the constraints given by the TD and invokes the action with it.
+        @return The output in the type specified in the TD or None if the TD specifies no output.
+        @raise ValueError If input does not satisfy the constraints given by the TD.
+        """
+        response = await connection_pool.request('POST', self.url(), body=self._serialize_input(input),
+                                                 headers={'Content-Type': 'application/json'})
+        if response.status != 200:
+            raise Exception("Received error code %d %s when invoking action %s" % (response.status, response.reason, self.url()))
+        return self._parse_output(response.data.decode('utf-8'))
+
+
+class AsyncTDEvent(TDEvent):
+    """
+    An event of an AsyncThingDescription.
+    """
+
+    def subscribe(self, conf_data = None, poll_interval=200):
+        """
+        Subscribes to the event. The subscription request is sent when the subscription is iterated first.
+
+        Example:
+            async for value in event.subscribe():
+                print(value)
+        @type conf_data dict|str|None
+        @param conf_data Configuration data of the subscription.
+        @type poll_interval float
+        @param poll_interval Milliseconds between two requests for the subscribed resource.
+        @rtype AsyncEventSubscription
+        @return The subscription yielding the values of the event.
+        """
+        return AsyncEventSubscription(self, conf_data, poll_interval)
+
+
+class AsyncEventSubscription(object):
+    """
+    Asynchronous iterator over the values of a subscribed event, which polls the resource created by the thing.
+    """
+
+    def __init__(self, event, conf_data, poll_interval):
+        """
+        @type event AsyncTDEvent
+        @param event The event subscribed to.
+        @param conf_data Configuration data of the subscription.
+        @type poll_interval float
+        @param poll_interval Milliseconds between two requests for the subscribed resource.
+        """
+        super().__init__()
+        self.uri = None  # URI of the resource created for the subscription, None until subscribed
+        self.__event = event
+        self.__conf_data = conf_data
+        self.__poll_interval = poll_interval
+        self.__valid = True
+        self.__error_callback = None
+
+    def __aiter__(self):
+        return self.__values()
+
+    async def __values(self):
+        if self.uri is None:
+            response = await connection_pool.request('POST', self.__event._subscription_url(),
+                                                     body=_serialize_conf(self.__conf_data),
+                                                     headers={'Content-Type': 'application/json'})
+            self.uri = self.__event._subscription_uri(response)
+
+        while self.__valid:
+            try:
+                response = await connection_pool.request('GET', self.uri)
+            except Exception as e:
+                # Keep polling, the thing may be reachable again later:
+                if self.__error_callback:
+                    self.__error_callback("Request for subscribed resource %s failed: %s" % (self.uri, e))
+                if self.__valid:
+                    await asyncio.sleep(self.__poll_interval / 1000.0)
+                continue
+
+            if response.status == 200:
+                raw = response.data.decode('utf-8')
+
+                # Accoring to W3C IG Common Practices, the value is sent as the value of an objects "value" field:
+                response_object = json.loads(raw)
+                if response_object and 'value' in response_object:
+                    yield response_object['value']
+                else:
+                    print("Received invalid response. Should be object with 'value' field, %s received" % raw)
+
+            elif response.status != 208 and self.__error_callback:
+                self.__error_callback("Received %d %s on request for subscribed resource %s" % (
+                    response.status, response.reason, self.uri))
+
+            if self.__valid:
+                await asyncio.sleep(self.__poll_interval / 1000.0)
+
+    def invalidate(self):
+        """
+        Ends the iteration after the value currently processed.
+        """
+        self.__valid = False
+
+    def set_error_callback(self, error_callback):
+        self.__error_callback = error_callback
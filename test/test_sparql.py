@@ -1,7 +1,31 @@
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
 from unittest import TestCase
+from unittest.mock import patch
+
+from rdflib import Dataset, URIRef
+from rdflib.namespace import OWL, RDFS
 
 from src import sparql
-from src.sparql import SPARQLNamespaceRepository, UnknownPrefixException
+from src.sparql import aio, closure
+from src.sparql import CircuitOpenException, SPARQLNamespaceRepository, SparqlException, UnknownPrefixException
+from src.sparql.bloom import BloomFilter, KnownIriFilter
+from src.sparql.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from src.sparql.backend import GraphBackend, HttpBackend, RecordingBackend, ReplayBackend, SparqlBackend
+from src.sparql.balancer import BalancedBackend
+from src.sparql.cache import EquivalenceSetCache, QueryCache, SingleFlight, symmetric_key
+from src.sparql.index import SubclassIndex
+from src.sparql.local import LocalReasoner
+from src.sparql.persistent import PersistentQueryCache
+from src.sparql.pool import AsyncConnectionPool, ConnectionPool, PooledResponse
+from src.sparql.server import SparqlServer
+from src.sparql.stream import iter_bindings
 
 
 class Test_Sparql(TestCase):
@@ -27,4 +51,924 @@ class Test_Sparql(TestCase):
             ns.resolve('unknownont:Lighting')
 
         with self.assertRaises(ValueError):
-            ns.resolve('nonshorthandgibberish')
\ No newline at end of file
+            ns.resolve('nonshorthandgibberish')
+
+    def test_namespace_repository_isolation(self):
+        ns1 = SPARQLNamespaceRepository()
+        ns1.register('dogont', 'http://elite.polito.it/ontologies/dogont.owl#')
+        ns2 = SPARQLNamespaceRepository()
+        with self.assertRaises(UnknownPrefixException):
+            ns2.resolve('dogont:Lighting')
+
+        # Repositories of identical contexts share prefixes until one registers another prefix:
+        context = ['http://w3c.github.io/wot/w3c-wot-td-context.jsonld',
+                   {'dogont': 'http://elite.polito.it/ontologies/dogont.owl#'}]
+        ns3 = SPARQLNamespaceRepository.for_context(context)
+        ns4 = SPARQLNamespaceRepository.for_context(context)
+        ns3.register('ncal', 'http://www.semanticdesktop.org/ontologies/2007/04/02/ncal#')
+        self.assertEqual(ns3.resolve('ncal:Alarm'), 'http://www.semanticdesktop.org/ontologies/2007/04/02/ncal#Alarm')
+        self.assertEqual(ns4.resolve('dogont:Lighting'), 'http://elite.polito.it/ontologies/dogont.owl#Lighting')
+        with self.assertRaises(UnknownPrefixException):
+            ns4.resolve('ncal:Alarm')
+
+    def test_namespace_repository_compact(self):
+        ns = SPARQLNamespaceRepository()
+        ns.register('wot', 'http://www.matthias-fisch.de/ontologies/wot#')
+        ns.register('wotx', 'http://www.matthias-fisch.de/ontologies/wot#x')
+        self.assertEqual(ns.compact('http://www.matthias-fisch.de/ontologies/wot#AlarmAction'), 'wot:AlarmAction')
+        self.assertEqual(ns.compact('http://www.matthias-fisch.de/ontologies/wot#xSensor'), 'wotx:Sensor')
+        self.assertEqual(ns.compact('http://example.org/Unknown'), 'http://example.org/Unknown')
+        self.assertEqual(ns.resolve_many(['wot:AlarmAction', 'wotx:Sensor']),
+                         ['http://www.matthias-fisch.de/ontologies/wot#AlarmAction',
+                          'http://www.matthias-fisch.de/ontologies/wot#xSensor'])
+
+
+class Test_QueryCache(TestCase):
+    def setUp(self):
+        self.original_cache = sparql.query_cache
+        sparql.set_query_cache(QueryCache())
+
+    def tearDown(self):
+        sparql.set_query_cache(self.original_cache)
+
+    def test_lru_eviction(self):
+        cache = QueryCache(maxsize=2, ttl=None)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_ttl(self):
+        cache = QueryCache(ttl=0.05)
+        cache.put('a', False)
+        self.assertFalse(cache.get('a', True))
+        time.sleep(0.1)
+        self.assertTrue(cache.get('a', True))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_symmetric_key(self):
+        self.assertEqual(symmetric_key('k', 'e', 'http://a', 'http://b'), symmetric_key('k', 'e', 'http://b', 'http://a'))
+
+    def test_classes_equivalent_cached(self):
+        with patch.object(sparql, '_query_classes_equivalent', return_value=True) as query:
+            self.assertTrue(sparql.classes_equivalent('http://example.org/a', 'http://example.org/b'))
+            self.assertTrue(sparql.classes_equivalent('http://example.org/b', 'http://example.org/a'))
+            self.assertEqual(query.call_count, 1)
+
+        with patch.object(sparql, '_query_equivalent_classes', return_value=['http://example.org/b']) as query:
+            sparql.equivalent_classes('http://example.org/a').append('http://example.org/c')
+            self.assertEqual(sparql.equivalent_classes('http://example.org/a'), ['http://example.org/b'])
+            self.assertEqual(query.call_count, 1)
+
+
+class Test_LocalReasoner(TestCase):
+    WOT = 'http://www.matthias-fisch.de/ontologies/wot#'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.reasoner = LocalReasoner()
+
+    def test_equivalent_classes(self):
+        self.assertEqual(sparql.equivalent_classes(self.WOT + 'AlarmAction', endpoint=self.reasoner),
+                         ['http://www.semanticdesktop.org/ontologies/2007/04/02/ncal#Alarm'])
+        self.assertEqual(sparql.equivalent_classes('http://example.org/bla#NotExisting', endpoint=self.reasoner), [])
+
+    def test_classes_equivalent(self):
+        self.assertTrue(sparql.classes_equivalent('http://www.semanticdesktop.org/ontologies/2007/04/02/ncal#Alarm',
+                                                  self.WOT + 'AlarmAction', endpoint=self.reasoner))
+        # Referring to the same resource does not make classes equivalent:
+        self.assertFalse(sparql.classes_equivalent(self.WOT + 'AlarmingDevice', self.WOT + 'AlarmAction',
+                                                   endpoint=self.reasoner))
+
+    def test_same_semantics_as_queries(self):
+        ex = 'http://example.org/'
+        graph = Dataset(default_union=True)
+        for s, p, o in [('A', OWL.sameAs, 'B'), ('C', OWL.sameAs, 'B'),
+                        ('D', OWL.equivalentClass, 'E'), ('E', RDFS.seeAlso, 'F'), ('F', RDFS.seeAlso, 'G'),
+                        ('H', OWL.sameAs, 'I'), ('I', OWL.sameAs, 'H')]:
+            graph.add((URIRef(ex + s), p, URIRef(ex + o)))
+        reasoner = LocalReasoner(graph=graph)
+        original_cache = sparql.query_cache
+        sparql.set_query_cache(None)
+        sparql.set_backend(GraphBackend(graph=graph))
+        try:
+            iris = [ex + x for x in 'ABCDEFGHI']
+            for iri1 in iris:
+                self.assertEqual(reasoner.equivalent_classes(iri1), sorted(sparql.equivalent_classes(iri1)), iri1)
+                for iri2 in iris:
+                    if iri1 != iri2:
+                        self.assertEqual(reasoner.classes_equivalent(iri1, iri2),
+                                         sparql.classes_equivalent(iri1, iri2), (iri1, iri2))
+        finally:
+            sparql.set_backend(HttpBackend())
+            sparql.set_query_cache(original_cache)
+        self.assertFalse(reasoner.classes_equivalent(ex + 'A', ex + 'C'))
+
+    def test_subclasses(self):
+        self.assertTrue(sparql.has_type(self.WOT + 'AlarmAction', self.WOT + 'Action', endpoint=self.reasoner))
+        self.assertFalse(sparql.has_type(self.WOT + 'Action', self.WOT + 'AlarmAction', endpoint=self.reasoner))
+        self.assertIn(self.WOT + 'Action', sparql.shared_superclasses(self.WOT + 'AlarmAction', self.WOT + 'BellRingAction',
+                                                                       endpoint=self.reasoner))
+
+    def test_default_reasoner(self):
+        sparql.set_default_reasoner(self.reasoner)
+        try:
+            self.assertTrue(sparql.has_type(self.WOT + 'AlarmAction', self.WOT + 'Action'))
+        finally:
+            sparql.set_default_reasoner(None)
+
+
+class Test_BatchedQueries(TestCase):
+    def setUp(self):
+        self.original_cache = sparql.query_cache
+        sparql.set_query_cache(QueryCache())
+
+    def tearDown(self):
+        sparql.set_query_cache(self.original_cache)
+
+    def test_classes_equivalent_many(self):
+        response = {'results': {'bindings': [{'a': {'type': 'uri', 'value': 'http://example.org/b'},
+                                              'b': {'type': 'uri', 'value': 'http://example.org/c'}}]}}
+        pairs = [('http://example.org/a', 'http://example.org/a'),
+                 ('http://example.org/a', 'http://example.org/c'),
+                 ('http://example.org/b', 'http://example.org/c'),
+                 ('http://example.org/c', 'http://example.org/b')]
+        with patch.object(sparql, '__query', return_value=response) as query:
+            self.assertEqual(sparql.classes_equivalent_many(pairs), {pairs[0]: True, pairs[1]: False,
+                                                                     pairs[2]: True, pairs[3]: True})
+            self.assertEqual(query.call_count, 1)
+            self.assertIn('VALUES', query.call_args[0][0])
+
+            # Results are cached for single checks as well:
+            self.assertTrue(sparql.classes_equivalent('http://example.org/c', 'http://example.org/b'))
+            self.assertEqual(query.call_count, 1)
+
+    def test_equivalent_classes_many(self):
+        response = {'results': {'bindings': [{'s': {'type': 'uri', 'value': 'http://example.org/a'},
+                                              'o': {'type': 'uri', 'value': 'http://example.org/b'}}]}}
+        with patch.object(sparql, '__query', return_value=response) as query:
+            self.assertEqual(sparql.equivalent_classes_many(['http://example.org/a', 'http://example.org/x']),
+                             {'http://example.org/a': ['http://example.org/b'], 'http://example.org/x': []})
+            self.assertEqual(sparql.equivalent_classes('http://example.org/a'), ['http://example.org/b'])
+            self.assertEqual(query.call_count, 1)
+
+
+class Test_PersistentQueryCache(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'cache.sqlite')
+
+    def tearDown(self):
+        sparql.set_persistent_cache(None)
+        self.dir.cleanup()
+
+    def test_normalized_lookup(self):
+        cache = PersistentQueryCache(self.path)
+        cache.put('http://e', 'ASK  {\n <http://a> ?p ?o }', {'boolean': True})
+        self.assertEqual(cache.get('http://e', 'ASK { <http://a> ?p ?o }'), {'boolean': True})
+        self.assertIsNone(cache.get('http://other', 'ASK { <http://a> ?p ?o }'))
+        cache.close()
+
+    def test_ontology_version(self):
+        cache = PersistentQueryCache(self.path, ontology_version='1')
+        cache.put('http://e', 'ASK {}', {'boolean': True})
+        cache.close()
+
+        cache = PersistentQueryCache(self.path, ontology_version='1')
+        self.assertEqual(cache.get('http://e', 'ASK {}'), {'boolean': True})
+        cache.close()
+
+        cache = PersistentQueryCache(self.path, ontology_version='2')
+        self.assertIsNone(cache.get('http://e', 'ASK {}'))
+        cache.close()
+
+    def test_ttl(self):
+        cache = PersistentQueryCache(self.path, ttl=-1)
+        cache.put('http://e', 'ASK {}', {'boolean': True})
+        self.assertIsNone(cache.get('http://e', 'ASK {}'))
+        cache.close()
+
+    def test_query_uses_persistent_cache(self):
+        sparql.set_persistent_cache(PersistentQueryCache(self.path))
+        with patch.object(sparql.connection_pool, 'request',
+                          return_value=PooledResponse(200, 'OK', {}, b'{"boolean": false}')) as request:
+            self.assertFalse(sparql.has_type('http://example.org/a', 'http://example.org/b', endpoint='http://e'))
+            sparql.query_cache.clear()
+            self.assertFalse(sparql.has_type('http://example.org/a', 'http://example.org/b', endpoint='http://e'))
+            self.assertEqual(request.call_count, 1)
+        sparql.persistent_cache.close()
+
+
+
+class _AskHandler(BaseHTTPRequestHandler):
+    """
+    Answers every SPARQL query with true over keep-alive connections.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = b'{"head": {}, "boolean": true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/sparql-results+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Test_ConnectionPool(TestCase):
+    def setUp(self):
+        self.server = _ThreadingHTTPServer(('127.0.0.1', 0), _AskHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = 'http://127.0.0.1:%d/sparql' % self.server.server_address[1]
+        self.original_cache = sparql.query_cache
+        sparql.set_query_cache(None)
+
+    def tearDown(self):
+        sparql.set_query_cache(self.original_cache)
+        sparql.set_connection_pool(ConnectionPool())
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        pool = ConnectionPool(maxsize=2)
+        sparql.set_connection_pool(pool)
+        for i in range(5):
+            self.assertTrue(sparql.has_type('http://example.org/a', 'http://example.org/b', endpoint=self.endpoint))
+        self.assertEqual(pool.stats()['created'], 1)
+        self.assertEqual(pool.stats()['reused'], 4)
+
+    def test_idle_timeout(self):
+        pool = ConnectionPool(maxsize=2, idle_timeout=0.05)
+        sparql.set_connection_pool(pool)
+        self.assertTrue(sparql.has_type('http://example.org/a', 'http://example.org/b', endpoint=self.endpoint))
+        self.assertEqual(pool.stats()['idle'], 1)
+        time.sleep(0.2)
+        self.assertEqual(pool.stats()['idle'], 0)
+        self.assertEqual(pool.stats()['reaped'], 1)
+
+    def test_concurrent_requests(self):
+        pool = ConnectionPool(maxsize=2)
+        sparql.set_connection_pool(pool)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            sparql.has_type('http://example.org/a', 'http://example.org/b', endpoint=self.endpoint))) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [True] * 8)
+        self.assertLessEqual(pool.stats()['created'], 2)
+
+
+class Test_AsyncQueries(TestCase):
+    def setUp(self):
+        self.server = _ThreadingHTTPServer(('127.0.0.1', 0), _AskHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = 'http://127.0.0.1:%d/sparql' % self.server.server_address[1]
+        self.original_cache = sparql.query_cache
+        sparql.set_query_cache(QueryCache())
+
+    def tearDown(self):
+        sparql.set_query_cache(self.original_cache)
+        aio.set_connection_pool(AsyncConnectionPool())
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_gather(self):
+        pool = AsyncConnectionPool(maxsize=2)
+        aio.set_connection_pool(pool)
+
+        async def check_all():
+            return await asyncio.gather(*[aio.classes_equivalent('http://example.org/a', 'http://example.org/%d' % i,
+                                                                 endpoint=self.endpoint) for i in range(20)])
+
+        self.assertEqual(asyncio.run(check_all()), [True] * 20)
+        self.assertLessEqual(pool.stats()['created'], 2)
+        # Results are shared with the blocking API:
+        self.assertTrue(sparql.classes_equivalent('http://example.org/5', 'http://example.org/a', endpoint=self.endpoint))
+        self.assertEqual(sparql.query_cache.stats()['hits'], 1)
+
+    def test_local_reasoner(self):
+        reasoner = LocalReasoner()
+        self.assertTrue(asyncio.run(aio.has_type('http://www.matthias-fisch.de/ontologies/wot#AlarmAction',
+                                                 'http://www.matthias-fisch.de/ontologies/wot#Action',
+                                                 endpoint=reasoner)))
+
+
+class Test_SubclassIndex(TestCase):
+    WOT = 'http://www.matthias-fisch.de/ontologies/wot#'
+
+    def tearDown(self):
+        sparql.set_subclass_index(None)
+
+    def test_local_ontology(self):
+        index = SubclassIndex(ontology_files=[])
+        self.assertTrue(index.has_type(self.WOT + 'BellRingAction', self.WOT + 'Action'))
+        self.assertFalse(index.has_type(self.WOT + 'Action', self.WOT + 'BellRingAction'))
+        self.assertFalse(index.has_type('http://example.org/Unknown', self.WOT + 'Action'))
+        self.assertEqual(LocalReasoner().shared_superclasses(self.WOT + 'BellRingAction', self.WOT + 'AlarmAction'),
+                         sorted(index.shared_superclasses(self.WOT + 'BellRingAction', self.WOT + 'AlarmAction')))
+
+    def test_bulk_load_and_refresh(self):
+        response = {'results': {'bindings': [
+            {'sub': {'type': 'uri', 'value': 'http://example.org/C'}, 'super': {'type': 'uri', 'value': 'http://example.org/B'}},
+            {'sub': {'type': 'uri', 'value': 'http://example.org/B'}, 'super': {'type': 'uri', 'value': 'http://example.org/A'}},
+            {'sub': {'type': 'uri', 'value': 'http://example.org/D'}, 'super': {'type': 'uri', 'value': 'http://example.org/A'}}]}}
+        with patch.object(sparql, '__query', return_value=response) as query:
+            index = SubclassIndex(endpoint='http://e')
+            sparql.set_subclass_index(index)
+            self.assertTrue(sparql.has_type('http://example.org/C', 'http://example.org/A', endpoint='http://e'))
+            self.assertEqual(sparql.shared_superclasses('http://example.org/C', 'http://example.org/D', endpoint='http://e'),
+                             ['http://example.org/A'])
+            self.assertEqual(query.call_count, 1)
+
+            response['results']['bindings'].pop()
+            index.refresh()
+            self.assertEqual(index.shared_superclasses('http://example.org/C', 'http://example.org/D'), [])
+
+
+class Test_SingleFlight(TestCase):
+    def setUp(self):
+        self.original_cache = sparql.query_cache
+        sparql.set_query_cache(None)
+
+    def tearDown(self):
+        sparql.set_query_cache(self.original_cache)
+
+    def test_concurrent_identical_queries_merged(self):
+        release = threading.Event()
+        calls = []
+
+        def slow_fetch(q, endpoint, kind=None):
+            calls.append(q)
+            release.wait(5)
+            return {'boolean': True}
+
+        results = []
+        sparql.single_flight.reset()
+        with patch.object(sparql, '_fetch', side_effect=slow_fetch):
+            threads = [threading.Thread(target=lambda: results.append(
+                sparql.classes_equivalent('http://example.org/a', 'http://example.org/b'))) for i in range(5)]
+            for thread in threads:
+                thread.start()
+            for i in range(500):
+                if sparql.single_flight.stats()['merged'] == 4:
+                    break
+                time.sleep(0.01)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results, [True] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sparql.single_flight.stats(), {'executed': 1, 'merged': 4, 'in_flight': 0})
+
+    def test_error_shared(self):
+        flight = SingleFlight()
+        with self.assertRaises(SparqlException):
+            flight.do('k', lambda: sparql._parse_boolean({}))
+        self.assertEqual(flight.do('k', lambda: 1), 1)
+
+
+class Test_QueryMetrics(TestCase):
+    def setUp(self):
+        self.original_cache = sparql.query_cache
+        sparql.set_query_cache(QueryCache())
+        sparql.metrics.reset()
+
+    def tearDown(self):
+        sparql.set_query_cache(self.original_cache)
+
+    def test_snapshot(self):
+        with patch.object(sparql.backend, 'query', return_value={'boolean': True}):
+            sparql.has_type('http://example.org/a', 'http://example.org/b')
+            sparql.has_type('http://example.org/a', 'http://example.org/b')
+        with patch.object(sparql.backend, 'query', return_value={}):
+            with self.assertRaises(SparqlException):
+                sparql.has_type('http://example.org/a', 'http://example.org/c')
+
+        stats = sparql.metrics.snapshot()['has_type']
+        self.assertEqual(stats['calls'], 3)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['queries'], 2)
+        self.assertAlmostEqual(stats['cache_hit_rate'], 1 / 3)
+        self.assertEqual(sum(stats['latency_histogram'].values()), 3)
+
+        sparql.metrics.reset()
+        self.assertEqual(sparql.metrics.snapshot(), {})
+
+    def test_scope(self):
+        with patch.object(sparql.backend, 'query', return_value={'boolean': False}):
+            with sparql.metrics.scope() as scope:
+                sparql.classes_equivalent('http://example.org/a', 'http://example.org/b')
+                sparql.classes_equivalent('http://example.org/b', 'http://example.org/a')
+            sparql.classes_equivalent('http://example.org/a', 'http://example.org/c')
+        self.assertEqual(scope.calls, 2)
+        self.assertEqual(scope.queries, 1)
+        self.assertEqual(scope.queries_by_kind, {'classes_equivalent': 1})
+
+    def test_only_queries_sent_are_counted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sparql.set_persistent_cache(PersistentQueryCache(os.path.join(directory, 'cache.sqlite')))
+            try:
+                with patch.object(sparql.backend, 'query', return_value={'boolean': True}) as query:
+                    sparql.has_type('http://example.org/a', 'http://example.org/b')
+                    sparql.query_cache.clear()
+                    with sparql.metrics.scope() as scope:
+                        self.assertTrue(sparql.has_type('http://example.org/a', 'http://example.org/b'))
+            finally:
+                sparql.set_persistent_cache(None)
+        self.assertEqual(query.call_count, 1)
+        self.assertEqual(scope.queries, 0)
+
+    def test_superclass_probes_are_not_counted(self):
+        sparql.query_cache.put(('superclasses', 'http://e', 'http://example.org/a'), ('http://example.org/b', ))
+        self.assertIsNotNone(sparql._cached_superclasses('http://example.org/a', 'http://e'))
+        self.assertIsNone(sparql._cached_superclasses('http://example.org/x', 'http://e'))
+        self.assertEqual(sparql.query_cache.stats()['hits'] + sparql.query_cache.stats()['misses'], 0)
+
+
+class Test_EquivalenceSetCache(TestCase):
+    def tearDown(self):
+        sparql.set_expansion_cache(None)
+
+    def test_shared_sets(self):
+        sets = EquivalenceSetCache()
+        members = sets.put('http://e', 'http://example.org/a', ['http://example.org/b'])
+        self.assertIs(sets.put('http://e', 'http://example.org/b', ['http://example.org/a']), members)
+        self.assertEqual(sets.canonical('http://e', 'http://example.org/b'), 'http://example.org/a')
+        self.assertIsNone(sets.canonical('http://e', 'http://example.org/x'))
+        self.assertTrue(sets.equivalent('http://e', 'http://example.org/b', 'http://example.org/a'))
+        self.assertFalse(sets.equivalent('http://e', 'http://example.org/x', 'http://example.org/a'))
+        self.assertIsNone(sets.equivalent('http://e', 'http://example.org/x', 'http://example.org/y'))
+
+    def test_pairwise_checks_from_one_lookup(self):
+        sets = EquivalenceSetCache()
+        sparql.set_expansion_cache(sets)
+        sparql.query_cache.clear()
+        with patch.object(sparql, '_query_equivalent_classes', return_value=['http://example.org/b']) as query:
+            self.assertTrue(sparql.classes_equivalent('http://example.org/a', 'http://example.org/b'))
+            self.assertFalse(sparql.classes_equivalent('http://example.org/a', 'http://example.org/c'))
+            self.assertFalse(sparql.classes_equivalent('http://example.org/d', 'http://example.org/a'))
+            self.assertEqual(sparql.equivalent_classes('http://example.org/a'), ['http://example.org/b'])
+            self.assertEqual(query.call_count, 1)
+        self.assertEqual(sets.stats()['hits'], 3)
+        self.assertEqual(sets.stats()['misses'], 1)
+        self.assertEqual(sparql.query_cache.stats()['hits'] + sparql.query_cache.stats()['misses'], 0)
+
+    def test_many(self):
+        sparql.set_expansion_cache(EquivalenceSetCache())
+        with patch.object(sparql, '_query_equivalent_classes_many',
+                          return_value={'http://example.org/a': ['http://example.org/b']}) as query:
+            pairs = [('http://example.org/a', 'http://example.org/%s' % x) for x in 'abcd']
+            self.assertEqual(list(sparql.classes_equivalent_many(pairs).values()), [True, True, False, False])
+            self.assertEqual(query.call_count, 1)
+            query.assert_called_with(['http://example.org/a'], sparql.DEFAULT_SPARQL_ENDPOINT)
+
+    def test_many_same_shape_as_single(self):
+        sparql.set_expansion_cache(EquivalenceSetCache())
+        eq_classes = {'http://example.org/a': ['http://example.org/c', 'http://example.org/a', 'http://example.org/b']}
+        with patch.object(sparql, '_query_equivalent_classes_many', return_value=eq_classes):
+            fetched = sparql.equivalent_classes_many(['http://example.org/a'])
+        self.assertEqual(fetched, {'http://example.org/a': ['http://example.org/b', 'http://example.org/c']})
+        self.assertEqual(sparql.equivalent_classes_many(['http://example.org/a']), fetched)
+        self.assertEqual(sparql.equivalent_classes('http://example.org/a'), fetched['http://example.org/a'])
+
+
+class Test_Backends(TestCase):
+    WOT = 'http://www.matthias-fisch.de/ontologies/wot#'
+    NCAL = 'http://www.semanticdesktop.org/ontologies/2007/04/02/ncal#'
+
+    def setUp(self):
+        self.original_cache = sparql.query_cache
+        sparql.set_query_cache(None)
+
+    def tearDown(self):
+        sparql.set_query_cache(self.original_cache)
+        sparql.set_backend(HttpBackend())
+
+    def test_local_server(self):
+        server = SparqlServer(port=0)
+        server.start()
+        try:
+            self.assertEqual(sparql.equivalent_classes(self.WOT + 'AlarmAction', endpoint=server.endpoint),
+                             [self.NCAL + 'Alarm'])
+            self.assertTrue(sparql.has_type(self.WOT + 'AlarmAction', self.WOT + 'Action', endpoint=server.endpoint))
+            self.assertFalse(sparql.classes_equivalent(self.WOT + 'AlarmAction', self.WOT + 'DoorOpenEvent',
+                                                       endpoint=server.endpoint))
+            with self.assertRaises(SparqlException):
+                sparql._execute('SELECT gibberish', server.endpoint, 'test')
+        finally:
+            server.stop()
+
+    def test_materialized_closure(self):
+        server = SparqlServer(port=0)
+        server.start()
+        try:
+            expected = sparql.equivalent_classes_many([self.WOT + 'AlarmAction', self.NCAL + 'Alarm'],
+                                                      endpoint=server.endpoint)
+            self.assertGreater(closure.materialize(server.endpoint), 0)
+            sparql.set_closure_graph(closure.CLOSURE_GRAPH)
+            self.assertIn(closure.CLOSURE_GRAPH, sparql._equivalent_classes_query(self.WOT + 'AlarmAction'))
+            self.assertEqual(sparql.equivalent_classes_many([self.WOT + 'AlarmAction', self.NCAL + 'Alarm'],
+                                                            endpoint=server.endpoint), expected)
+            self.assertTrue(sparql.classes_equivalent(self.NCAL + 'Alarm', self.WOT + 'AlarmAction',
+                                                      endpoint=server.endpoint))
+            self.assertFalse(sparql.classes_equivalent(self.WOT + 'AlarmAction', self.WOT + 'DoorOpenEvent',
+                                                       endpoint=server.endpoint))
+        finally:
+            sparql.set_closure_graph(None)
+            server.stop()
+
+    def test_closure_same_semantics_as_queries(self):
+        ex = 'http://example.org/'
+        graph = Dataset(default_union=True)
+        for s, p, o in [('A', OWL.sameAs, 'B'), ('C', OWL.sameAs, 'B'), ('D', OWL.equivalentClass, 'E'),
+                        ('E', RDFS.seeAlso, 'F'), ('F', RDFS.seeAlso, 'G'), ('H', OWL.sameAs, 'I'),
+                        ('I', OWL.sameAs, 'H')]:
+            graph.add((URIRef(ex + s), p, URIRef(ex + o)))
+        sparql.set_backend(GraphBackend(graph=graph))
+        iris = [ex + x for x in 'ABCDEFGHI']
+        pairs = [(iri1, iri2) for iri1 in iris for iri2 in iris if iri1 != iri2]
+
+        expected = (sparql.equivalent_classes_many(iris), sparql.classes_equivalent_many(pairs))
+        closure.materialize()
+        sparql.set_closure_graph(closure.CLOSURE_GRAPH)
+        try:
+            actual = (sparql.equivalent_classes_many(iris), sparql.classes_equivalent_many(pairs))
+        finally:
+            sparql.set_closure_graph(None)
+        self.assertEqual({iri: sorted(eq) for iri, eq in actual[0].items()},
+                         {iri: sorted(eq) for iri, eq in expected[0].items()})
+        self.assertEqual(actual[1], expected[1])
+        self.assertFalse(actual[1][(ex + 'A', ex + 'C')])
+
+    def test_rematerialization_is_atomic(self):
+        ex = 'http://example.org/'
+        graph = Dataset(default_union=True)
+        graph.add((URIRef(ex + 'A'), OWL.sameAs, URIRef(ex + 'B')))
+        backend = GraphBackend(graph=graph)
+        sparql.set_backend(backend)
+        closure.materialize(batch_size=1)
+        sparql.set_closure_graph(closure.CLOSURE_GRAPH)
+
+        seen = []
+        update = backend.update
+
+        def update_and_read(u, endpoint):
+            update(u, endpoint)
+            seen.append(sparql.equivalent_classes(ex + 'A'))
+
+        try:
+            with patch.object(backend, 'update', side_effect=update_and_read):
+                closure.materialize(batch_size=1)
+        finally:
+            sparql.set_closure_graph(None)
+        self.assertGreater(len(seen), 2)
+        self.assertEqual(seen, [[ex + 'B']] * len(seen))
+
+    def test_closure_graph_clears_caches(self):
+        sparql.set_query_cache(QueryCache())
+        sparql.set_expansion_cache(EquivalenceSetCache())
+        try:
+            sparql.query_cache.put(('equivalent_classes', 'http://e', 'http://example.org/a'), ())
+            sparql.expansion_cache.put('http://e', 'http://example.org/a', [])
+            sparql.set_closure_graph(closure.CLOSURE_GRAPH)
+            self.assertEqual(len(sparql.query_cache), 0)
+            self.assertIsNone(sparql.expansion_cache.get('http://e', 'http://example.org/a'))
+        finally:
+            sparql.set_closure_graph(None)
+            sparql.set_expansion_cache(None)
+
+    def test_record_and_replay(self):
+        recorder = RecordingBackend(GraphBackend())
+        sparql.set_backend(recorder)
+        self.assertEqual(sparql.shared_superclasses(self.WOT + 'AlarmAction', self.WOT + 'PlayWelcomeAction'),
+                         [self.WOT + 'Action'])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'recording.json')
+            recorder.save(path)
+            sparql.set_backend(ReplayBackend(path))
+
+        self.assertEqual(sparql.shared_superclasses(self.WOT + 'AlarmAction', self.WOT + 'PlayWelcomeAction'),
+                         [self.WOT + 'Action'])
+        with self.assertRaises(SparqlException):
+            sparql.has_type(self.WOT + 'AlarmAction', self.WOT + 'Action')
+        self.assertTrue(asyncio.run(aio.shared_superclasses(self.WOT + 'AlarmAction', self.WOT + 'PlayWelcomeAction')))
+
+    def test_warm(self):
+        sparql.set_query_cache(QueryCache())
+        sparql.set_expansion_cache(EquivalenceSetCache())
+        sparql.set_backend(GraphBackend())
+        try:
+            failed = sparql.warm([self.WOT + 'AlarmAction', self.WOT + 'PlayWelcomeAction'], parallelism=2)
+            self.assertEqual(failed, {})
+            with sparql.metrics.scope() as scope:
+                self.assertTrue(sparql.classes_equivalent(self.NCAL + 'Alarm', self.WOT + 'AlarmAction'))
+                self.assertTrue(sparql.has_type(self.WOT + 'AlarmAction', self.WOT + 'Action'))
+                self.assertEqual(sparql.shared_superclasses(self.WOT + 'AlarmAction', self.WOT + 'PlayWelcomeAction'),
+                                 [self.WOT + 'Action'])
+            self.assertEqual(scope.queries, 0)
+        finally:
+            sparql.set_expansion_cache(None)
+
+
+class _SlowHandler(_AskHandler):
+    def do_POST(self):
+        time.sleep(0.5)
+        super().do_POST()
+
+
+class Test_Resilience(TestCase):
+    def setUp(self):
+        self.original_cache = sparql.query_cache
+
+    def tearDown(self):
+        sparql.set_query_cache(self.original_cache)
+        sparql.set_query_timeout(None)
+        sparql.set_circuit_breaker(CircuitBreaker())
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.failure('a')
+        self.assertTrue(breaker.allow('a'))
+        breaker.failure('a')
+        self.assertEqual(breaker.state('a'), OPEN)
+        self.assertFalse(breaker.allow('a'))
+        self.assertTrue(breaker.allow('b'))
+
+        time.sleep(0.06)
+        self.assertEqual(breaker.state('a'), HALF_OPEN)
+        self.assertTrue(breaker.allow('a'))  # A single trial query
+        self.assertFalse(breaker.allow('a'))
+        breaker.success('a')
+        self.assertEqual(breaker.state('a'), CLOSED)
+
+    def test_timeout_opens_circuit(self):
+        server = _ThreadingHTTPServer(('127.0.0.1', 0), _SlowHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        endpoint = 'http://127.0.0.1:%d/sparql' % server.server_address[1]
+        sparql.set_query_cache(None)
+        sparql.set_query_timeout(0.1)
+        sparql.set_circuit_breaker(CircuitBreaker(failure_threshold=2))
+        try:
+            for i in range(2):
+                with self.assertRaises(TimeoutError):
+                    sparql.has_type('http://example.org/a', 'http://example.org/b', endpoint=endpoint)
+            start = time.monotonic()
+            with self.assertRaises(CircuitOpenException):
+                sparql.has_type('http://example.org/a', 'http://example.org/b', endpoint=endpoint)
+            self.assertLess(time.monotonic() - start, 0.1)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_per_call_timeout(self):
+        server = _ThreadingHTTPServer(('127.0.0.1', 0), _SlowHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        endpoint = 'http://127.0.0.1:%d/sparql' % server.server_address[1]
+        sparql.set_query_cache(None)
+        try:
+            with sparql.timeout(0.1):
+                with self.assertRaises(TimeoutError):
+                    sparql.has_type('http://example.org/a', 'http://example.org/b', endpoint=endpoint)
+            self.assertTrue(sparql.has_type('http://example.org/a', 'http://example.org/b', endpoint=endpoint))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_per_call_timeout_in_executors(self):
+        sparql.set_query_cache(None)
+        replicas = _ReplicaBackend({'http://a/sparql': 0.0})
+        sparql.set_backend(replicas)
+        try:
+            with sparql.timeout(0.5):
+                self.assertEqual(asyncio.run(aio.equivalent_classes('http://example.org/a', 'http://a/sparql')),
+                                 ['http://a/sparql'])
+        finally:
+            sparql.set_backend(HttpBackend())
+        self.assertEqual(replicas.timeouts, [0.5])
+
+        replicas = _ReplicaBackend({'http://a/sparql': 0.2, 'http://b/sparql': 0.0})
+        balancer = BalancedBackend(['http://a/sparql', 'http://b/sparql'], backend=replicas, hedge_after=0.01)
+        with sparql.timeout(0.5):
+            balancer.query('SELECT ?o {}', sparql.DEFAULT_SPARQL_ENDPOINT)
+        balancer.close()
+        self.assertEqual(replicas.timeouts, [0.5, 0.5])
+
+    def test_cancelled_trial_releases_circuit(self):
+        silent = socket.socket()  # Accepts connections, but never answers
+        silent.bind(('127.0.0.1', 0))
+        silent.listen(8)
+        endpoint = 'http://127.0.0.1:%d/sparql' % silent.getsockname()[1]
+        sparql.set_query_cache(None)
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+        sparql.set_circuit_breaker(breaker)
+        try:
+            breaker.failure(endpoint)
+            time.sleep(0.02)
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(asyncio.wait_for(aio.has_type('http://example.org/a', 'http://example.org/b',
+                                                          endpoint=endpoint), 0.1))
+            self.assertEqual(breaker.state(endpoint), HALF_OPEN)
+            self.assertTrue(breaker.allow(endpoint))
+        finally:
+            silent.close()
+
+    def test_stale_while_revalidate(self):
+        sparql.set_query_cache(QueryCache(ttl=0.2, stale_ttl=60))
+        with patch.object(sparql, '__query', return_value={'boolean': True}):
+            self.assertTrue(sparql.has_type('http://example.org/a', 'http://example.org/b'))
+        time.sleep(0.25)
+
+        refreshed = threading.Event()
+
+        def slow_query(q, endpoint, kind=None):
+            refreshed.wait(5)
+            return {'boolean': False}
+
+        with patch.object(sparql, '__query', side_effect=slow_query):
+            # The expired result is served while the fresh one is pending:
+            self.assertTrue(sparql.has_type('http://example.org/a', 'http://example.org/b'))
+            refreshed.set()
+            for i in range(500):
+                if sparql.query_cache.get(('has_type', sparql.DEFAULT_SPARQL_ENDPOINT,
+                                           'http://example.org/a', 'http://example.org/b')) is False:
+                    break
+                time.sleep(0.01)
+        self.assertFalse(sparql.has_type('http://example.org/a', 'http://example.org/b'))
+
+
+class Test_KnownIriFilter(TestCase):
+    WOT = 'http://www.matthias-fisch.de/ontologies/wot#'
+
+    def setUp(self):
+        self.original_cache = sparql.query_cache
+        sparql.set_query_cache(None)
+
+    def tearDown(self):
+        sparql.set_query_cache(self.original_cache)
+        sparql.set_known_iris(None)
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        iris = ['http://example.org/known#%d' % i for i in range(1000)]
+        for iri in iris:
+            bloom.add(iri)
+        self.assertTrue(all(iri in bloom for iri in iris))
+        false_positives = sum('http://example.org/unknown#%d' % i in bloom for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+    def test_unknown_iris_not_queried(self):
+        sparql.set_known_iris(KnownIriFilter(ontology_files=[], refresh_interval=None))
+        private = 'http://example.org/private#Gadget'
+        with patch.object(sparql, '__query', return_value={'boolean': True}) as query:
+            self.assertFalse(sparql.classes_equivalent(private, self.WOT + 'AlarmAction'))
+            self.assertFalse(sparql.has_type(private, self.WOT + 'Action'))
+            self.assertEqual(sparql.equivalent_classes(private), [])
+            self.assertEqual(sparql.classes_equivalent_many([(private, self.WOT + 'AlarmAction')]),
+                             {(private, self.WOT + 'AlarmAction'): False})
+            self.assertEqual(query.call_count, 0)
+
+            self.assertTrue(sparql.has_type(self.WOT + 'AlarmAction', self.WOT + 'Action'))
+            self.assertEqual(query.call_count, 1)
+        self.assertGreaterEqual(sparql.known_iris.rejected, 4)
+
+
+class _ReplicaBackend(SparqlBackend):
+    """
+    Answers with the URL of the replica queried after a delay per replica. Replicas without a delay fail.
+    """
+
+    def __init__(self, delays):
+        super().__init__()
+        self.delays = delays
+        self.queried = []
+        self.timeouts = []  # Per-call timeouts in effect when the replicas were queried
+
+    def query(self, q, endpoint):
+        self.queried.append(endpoint)
+        self.timeouts.append(sparql._query_timeout())
+        if self.delays.get(endpoint) is None:
+            raise ConnectionError('%s is down' % endpoint)
+        time.sleep(self.delays[endpoint])
+        return {'head': {}, 'results': {'bindings': [{'o': {'type': 'uri', 'value': endpoint}}]}}
+
+
+class Test_BalancedBackend(TestCase):
+    def test_routes_to_fastest_replica(self):
+        replicas = _ReplicaBackend({'http://a/sparql': 0.02, 'http://b/sparql': 0.0})
+        balancer = BalancedBackend(['http://a/sparql', 'http://b/sparql'], backend=replicas)
+        for i in range(5):
+            balancer.query('SELECT ?o {}', sparql.DEFAULT_SPARQL_ENDPOINT)
+        self.assertEqual(replicas.queried.count('http://a/sparql'), 1)  # Only measured once
+        self.assertEqual(balancer.stats()['http://b/sparql']['requests'], 4)
+
+    def test_ejects_failing_replica(self):
+        replicas = _ReplicaBackend({'http://a/sparql': None, 'http://b/sparql': 0.0})
+        balancer = BalancedBackend(['http://a/sparql', 'http://b/sparql'], backend=replicas, eject_after=1)
+        for i in range(3):
+            r = balancer.query('SELECT ?o {}', sparql.DEFAULT_SPARQL_ENDPOINT)
+            self.assertEqual(sparql._parse_uris(r, 'o'), ['http://b/sparql'])
+        self.assertTrue(balancer.stats()['http://a/sparql']['ejected'])
+        self.assertEqual(replicas.queried.count('http://a/sparql'), 1)
+
+    def test_hedging(self):
+        replicas = _ReplicaBackend({'http://a/sparql': 1.0, 'http://b/sparql': 0.0})
+        balancer = BalancedBackend(['http://a/sparql', 'http://b/sparql'], backend=replicas, hedge_after=0.05)
+        start = time.monotonic()
+        r = balancer.query('SELECT ?o {}', sparql.DEFAULT_SPARQL_ENDPOINT)
+        self.assertEqual(sparql._parse_uris(r, 'o'), ['http://b/sparql'])
+        self.assertLess(time.monotonic() - start, 0.5)
+        balancer.close()
+
+
+class _StreamingHandler(BaseHTTPRequestHandler):
+    """
+    Sends a result of many bindings in chunks, slowly after the first one.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionError:  # The client stopped reading
+            pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/sparql-results+json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            self.__chunk(b'{"head": {"vars": ["o", "super"]}, "results": {"bindings": [')
+            for i in range(20):
+                self.__chunk(b'%s{"o": {"type": "uri", "value": "http://example.org/c%d"}, '
+                             b'"super": {"type": "uri", "value": "http://example.org/c%d"}}' % (b',' if i else b'', i, i))
+                time.sleep(0.05)
+            self.__chunk(b']}}')
+            self.__chunk(b'')
+        except (ConnectionError, OSError):
+            pass
+
+    def __chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+class Test_Streaming(TestCase):
+    def setUp(self):
+        self.original_cache = sparql.query_cache
+        sparql.set_query_cache(QueryCache())
+
+    def tearDown(self):
+        sparql.set_query_cache(self.original_cache)
+
+    def test_iter_bindings(self):
+        body = ('{"head": {"vars": ["bindings", "o"]}, "results": {"bindings": [%s]}}'
+                % ', '.join('{"o": {"type": "uri", "value": "http://example.org/\u00e4%d"}}' % i
+                            for i in range(10))).encode('utf-8')
+        for size in (1, 7, len(body)):
+            bindings = list(iter_bindings(body[i:i + size] for i in range(0, len(body), size)))
+            self.assertEqual([b['o']['value'] for b in bindings], ['http://example.org/\u00e4%d' % i for i in range(10)])
+        with self.assertRaises(ValueError):
+            list(iter_bindings([b'{"head": {}, "results": {"bindings": [{"o": ']))
+
+    def test_early_exit(self):
+        server = _ThreadingHTTPServer(('127.0.0.1', 0), _StreamingHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        endpoint = 'http://127.0.0.1:%d/sparql' % server.server_address[1]
+        try:
+            start = time.monotonic()
+            classes = sparql.iter_equivalent_classes('http://example.org/a', endpoint=endpoint)
+            self.assertEqual(next(classes), 'http://example.org/c0')
+            classes.close()
+            self.assertLess(time.monotonic() - start, 0.5)
+            # An incomplete result is not cached:
+            self.assertIsNone(sparql.query_cache.get(('equivalent_classes', endpoint, 'http://example.org/a')))
+
+            self.assertEqual(len(list(sparql.iter_shared_superclasses('http://example.org/a', 'http://example.org/b',
+                                                                       endpoint=endpoint))), 20)
+            self.assertEqual(len(sparql.shared_superclasses('http://example.org/a', 'http://example.org/b',
+                                                            endpoint=endpoint)), 20)
+        finally:
+            server.shutdown()
+            server.server_close()
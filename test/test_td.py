@@ -0,0 +1,313 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from unittest import TestCase
+from unittest.mock import patch
+
+from src import sparql
+from src.sparql import UnknownPrefixException
+from src.sparql.cache import EquivalenceSetCache, QueryCache
+from src import td as td_module
+from src.sparql.pool import ConnectionPool
+from src.td import EventSubscription, TDProperty, ThingDescription, read_many
+from src.td import aio as td_aio
+from src.td.aio import AsyncThingDescription
+
+SPEAKER_TD = {
+    '@context': ['http://w3c.github.io/wot/w3c-wot-td-context.jsonld',
+                 {'wot': 'http://www.matthias-fisch.de/ontologies/wot#',
+                  'ncal': 'http://www.semanticdesktop.org/ontologies/2007/04/02/ncal#'}],
+    '@type': 'wot:AlarmingDevice',
+    'name': 'Speaker',
+    'uris': ['http://127.0.0.1:5000/'],
+    'properties': [],
+    'actions': [
+        {'@type': 'wot:PlayWelcomeAction', 'name': 'welcome', 'hrefs': ['welcome'],
+         'inputData': {'valueType': 'string',
+                       'oneOf': [{'constant': 'welcome.mp3', 'wot:SoundFile': 'wot:WelcomeSound'}]}},
+        {'@type': 'ncal:Alarm', 'name': 'alarm', 'hrefs': ['alarm'],
+         'inputData': {'valueType': 'integer', 'wot:Duration': 'http://dbpedia.org/resource/Second'}}
+    ],
+    'events': [
+        {'@type': 'wot:DoorOpenEvent', 'name': 'opened', 'hrefs': ['opened'], 'valueType': {'type': 'boolean'}}
+    ]
+}
+
+WOT = 'http://www.matthias-fisch.de/ontologies/wot#'
+
+
+class Test_ThingDescription(TestCase):
+    def setUp(self):
+        self.original_cache = sparql.query_cache
+        sparql.set_query_cache(QueryCache())
+
+    def tearDown(self):
+        sparql.set_query_cache(self.original_cache)
+
+    def test_get_action_by_types_batched(self):
+        td = ThingDescription(SPEAKER_TD)
+        with patch.object(sparql, '_query_classes_equivalent_many',
+                          return_value={(WOT + 'AlarmAction', 'http://www.semanticdesktop.org/ontologies/2007/04/02/ncal#Alarm')}) as query:
+            self.assertEqual(td.get_action_by_types([WOT + 'AlarmAction']).name(), 'alarm')
+            self.assertEqual(query.call_count, 1)
+            self.assertTrue(td.has_all_actions_of([WOT + 'AlarmAction', WOT + 'PlayWelcomeAction']))
+            self.assertEqual(query.call_count, 1)  # Pairs checked before are cached
+
+    def test_exact_match_needs_no_query(self):
+        td = ThingDescription(SPEAKER_TD)
+        with patch.object(sparql, '_query_classes_equivalent_many') as query:
+            self.assertEqual(td.get_action_by_types([WOT + 'PlayWelcomeAction']).name(), 'welcome')
+            query.assert_not_called()
+
+    def test_unknown_prefix_of_interaction(self):
+        td_json = dict(SPEAKER_TD, properties=[{'@type': 'unknown:Volume', 'name': 'volume', 'hrefs': ['volume']}])
+        td = ThingDescription(td_json)
+        self.assertEqual(td.get_action_by_types([WOT + 'PlayWelcomeAction']).name(), 'welcome')
+        with self.assertRaises(UnknownPrefixException):
+            td.get_property_by_types([WOT + 'Volume'])
+
+    def test_known_equivalence_set_needs_no_query(self):
+        td = ThingDescription(SPEAKER_TD)
+        original = sparql.expansion_cache
+        sets = EquivalenceSetCache()
+        sets.put(sparql.DEFAULT_SPARQL_ENDPOINT, WOT + 'AlarmAction',
+                 ['http://www.semanticdesktop.org/ontologies/2007/04/02/ncal#Alarm'])
+        sparql.set_expansion_cache(sets)
+        try:
+            with patch.object(sparql, '_query_classes_equivalent_many') as query:
+                self.assertEqual(td.get_action_by_types([WOT + 'AlarmAction']).name(), 'alarm')
+                query.assert_not_called()
+        finally:
+            sparql.set_expansion_cache(original)
+
+    def test_has_all_actions_of_decided_locally(self):
+        td = ThingDescription(SPEAKER_TD)
+        with patch.object(sparql, '_query_classes_equivalent_many') as query:
+            self.assertTrue(td.has_all_actions_of(['wot:PlayWelcomeAction', WOT + 'PlayWelcomeAction']))
+            self.assertFalse(td.has_all_properties_of([WOT + 'Temperature']))
+            query.assert_not_called()
+
+    def test_schemas_resolved_once(self):
+        td = ThingDescription(SPEAKER_TD)
+        action = td.get_action_by_types([WOT + 'PlayWelcomeAction'])
+        self.assertIs(td.get_action_by_types([WOT + 'PlayWelcomeAction']), action)
+        with patch.object(td_module, '_ns_resolve_input_type', wraps=td_module._ns_resolve_input_type) as resolve:
+            ivt = action.input_value_type()
+            resolved = resolve.call_count
+            self.assertIs(td.get_action_by_types([WOT + 'PlayWelcomeAction']).input_value_type(), ivt)
+            action.validate_many(['welcome.mp3'])
+            self.assertEqual(resolve.call_count, resolved)
+        self.assertEqual(ivt['oneOf'][0]['constant'], 'welcome.mp3')
+        with self.assertRaises(TypeError):
+            ivt['valueType'] = 'integer'
+        self.assertIsNone(action.output_value_type())
+
+    def test_schemas_of_ad_hoc_interactions(self):
+        td = ThingDescription(SPEAKER_TD)
+        for i in range(50):
+            # The dict is freed right away, so the next one may get its id:
+            vt = TDProperty(td, {'name': 'p%d' % i, 'valueType': {'type': 'number', 'maximum': i}}).value_type()
+            self.assertEqual(vt['maximum'], i)
+        for i in range(50):
+            errors = TDProperty(td, {'name': 'p%d' % i, 'valueType': {'type': 'number', 'maximum': i}}).validate_many([i])
+            self.assertEqual(errors, [None])
+
+    def test_validate_many(self):
+        td = ThingDescription(SPEAKER_TD)
+        welcome = td.get_action_by_types([WOT + 'PlayWelcomeAction'])
+        errors = welcome.validate_many(['welcome.mp3', 'other.mp3', 3])
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], ValueError)
+        self.assertIsInstance(errors[2], ValueError)
+
+        with patch.object(sparql, '_query_classes_equivalent_many', return_value=set()):
+            alarm = td.get_action_by_types(['http://www.semanticdesktop.org/ontologies/2007/04/02/ncal#Alarm'])
+        self.assertEqual([e is None for e in alarm.validate_many([10, 2.5, '10'])], [True, True, False])
+
+    def test_has_all_events_of_query_count(self):
+        td = ThingDescription(SPEAKER_TD)
+        with patch.object(sparql.backend, 'query', return_value={'results': {'bindings': []}}):
+            with sparql.metrics.scope() as scope:
+                self.assertFalse(td.has_all_events_of([WOT + 'DoorOpenEvent', WOT + 'AlarmEvent', WOT + 'RingEvent']))
+        self.assertLessEqual(scope.queries, 1)
+
+
+class _ThingHandler(BaseHTTPRequestHandler):
+    """
+    Thing with a temperature property, a ring action and a ring event over keep-alive connections.
+    """
+    protocol_version = 'HTTP/1.1'
+    temperature = 21.5
+    rings = 0
+
+    def do_GET(self):
+        if self.path.endswith('/subscriptions/1'):
+            self.__respond(json.dumps({'value': _ThingHandler.rings}).encode('utf-8'))
+        else:
+            self.__respond(json.dumps({'value': _ThingHandler.temperature}).encode('utf-8'))
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path == '/ring':
+            _ThingHandler.rings += 1
+            self.__respond(json.dumps(_ThingHandler.rings).encode('utf-8'))
+        elif self.path == '/ringing':
+            self.__respond(b'', status=308, location='/subscriptions/1')
+        else:
+            _ThingHandler.temperature = json.loads(data)['value']
+            self.__respond(b'')
+
+    def __respond(self, body, status=200, location=None):
+        self.send_response(status)
+        if location is not None:
+            self.send_header('Location', location)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _thermometer_td(port):
+    return {
+        '@context': ['http://w3c.github.io/wot/w3c-wot-td-context.jsonld',
+                     {'wot': 'http://www.matthias-fisch.de/ontologies/wot#'}],
+        '@type': 'wot:Thermometer',
+        'name': 'Thermometer',
+        'uris': ['http://127.0.0.1:%d/' % port],
+        'properties': [
+            {'@type': 'wot:Temperature', 'name': 'temperature', 'hrefs': ['/temperature'], 'writeable': True,
+             'valueType': {'type': 'number', 'minimum': -40, 'maximum': 60}}
+        ],
+        'actions': [
+            {'@type': 'wot:RingAction', 'name': 'ring', 'hrefs': ['/ring'],
+             'inputData': {'valueType': 'integer', 'minimum': 1}, 'outputData': {'type': 'integer'}}
+        ],
+        'events': [
+            {'@type': 'wot:RingEvent', 'name': 'ringing', 'hrefs': ['/ringing'], 'valueType': {'type': 'integer'}}
+        ]
+    }
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Test_ThingInteractions(TestCase):
+    def setUp(self):
+        self.server = _ThreadingHTTPServer(('127.0.0.1', 0), _ThingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.pool = ConnectionPool(maxsize=2, timeout=2.0)
+        td_module.set_connection_pool(self.pool)
+        self.td = ThingDescription(_thermometer_td(self.server.server_address[1]))
+        _ThingHandler.temperature = 21.5
+
+    def tearDown(self):
+        td_module.set_connection_pool(ConnectionPool(maxsize=8, timeout=None, idle_timeout=30.0))
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        prop = self.td.get_property_by_types([WOT + 'Temperature'])
+        self.assertEqual(prop.value(), 21.5)
+        prop.set(23.0)
+        self.assertEqual(prop.value(), 23.0)
+        self.assertEqual(self.pool.stats()['created'], 1)
+        self.assertEqual(self.pool.stats()['reused'], 2)
+
+    def test_poll_survives_failed_requests(self):
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        port = closed.getsockname()[1]
+        closed.close()  # Nothing listens on the port anymore
+
+        errors = []
+        subscription = EventSubscription('http://127.0.0.1:%d/subscriptions/1' % port, None, 1)
+        subscription.start(None, errors.append)
+        deadline = time.monotonic() + 5
+        while len(errors) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        subscription.invalidate()
+        self.assertGreaterEqual(len(errors), 3)
+
+    def test_read_many(self):
+        self.assertEqual(self.td.read_properties(), {'temperature': 21.5})
+        results = read_many([(self.td, 'temperature'), (self.td, 'humidity')])
+        self.assertEqual(results[(self.td, 'temperature')], 21.5)
+        self.assertIsInstance(results[(self.td, 'humidity')], KeyError)
+
+
+class Test_AsyncThingDescription(TestCase):
+    def setUp(self):
+        self.server = _ThreadingHTTPServer(('127.0.0.1', 0), _ThingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.td = AsyncThingDescription(_thermometer_td(self.server.server_address[1]))
+        _ThingHandler.temperature = 21.5
+        _ThingHandler.rings = 0
+
+    def tearDown(self):
+        td_aio.set_connection_pool(td_aio.AsyncConnectionPool(maxsize=8, timeout=None))
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_interactions(self):
+        async def interact():
+            prop = await self.td.get_property_by_types([WOT + 'Temperature'])
+            await prop.set(30)
+            with self.assertRaises(ValueError):
+                await prop.set(100)
+            action = await self.td.get_action_by_types([WOT + 'RingAction'])
+            event = await self.td.get_event_by_types([WOT + 'RingEvent'])
+            rings = [await action.invoke(1)]
+
+            subscription = event.subscribe(poll_interval=1)
+            async for value in subscription:
+                rings.append(value)
+                subscription.invalidate()
+            return await prop.value(), rings
+
+        self.assertEqual(asyncio.run(interact()), (30, [1, 1]))
+        self.assertEqual(td_aio.connection_pool.stats()['created'], 1)
+
+    def test_poll_survives_failed_requests(self):
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        port = closed.getsockname()[1]
+        closed.close()  # Nothing listens on the port anymore
+
+        async def poll():
+            event = await self.td.get_event_by_types([WOT + 'RingEvent'])
+            subscription = event.subscribe(poll_interval=1)
+            subscription.uri = 'http://127.0.0.1:%d/subscriptions/1' % port
+
+            def on_error(message):
+                errors.append(message)
+                if len(errors) == 3:
+                    subscription.invalidate()
+
+            subscription.set_error_callback(on_error)
+            async for value in subscription:
+                pass
+
+        errors = []
+        asyncio.run(asyncio.wait_for(poll(), 5))
+        self.assertEqual(len(errors), 3)
+        self.assertIn('failed', errors[0])
+
+    def test_has_any_of(self):
+        async def check():
+            with patch.object(sparql, '_query_classes_equivalent_many', return_value=set()):
+                return (await self.td.has_any_property_of([WOT + 'Temperature']),
+                        await self.td.has_any_action_of([WOT + 'AlarmAction']),
+                        await self.td.has_any_event_of([WOT + 'DoorOpenEvent']))
+
+        self.assertEqual(asyncio.run(check()), (True, False, False))
+
+    def test_read_properties(self):
+        self.assertEqual(asyncio.run(self.td.read_properties(lambda prop: prop.writeable())), {'temperature': 21.5})